@@ -8,11 +8,18 @@ import json
 from bson import ObjectId
 from pymongo import MongoClient, GEOSPHERE
 import uuid
+import time
+import threading
 import base64
 import cv2
 import numpy as np
 from PIL import Image
 from config import Config
+import stats_queries
+import route_corridor
+import report_clusters
+import report_search
+import geo_utils
 
 # Initialize Flask app
 app = Flask(__name__)
@@ -20,7 +27,15 @@ app.config.from_object(Config)
 Config.init_app(app)
 
 # Initialize MongoDB
-client = MongoClient(app.config['MONGO_URI'])
+client = MongoClient(
+    app.config['MONGO_URI'],
+    maxPoolSize=app.config['MONGO_MAX_POOL_SIZE'],
+    minPoolSize=app.config['MONGO_MIN_POOL_SIZE'],
+    waitQueueTimeoutMS=app.config['MONGO_WAIT_QUEUE_TIMEOUT_MS'],
+    serverSelectionTimeoutMS=5000,
+    compressors=app.config['MONGO_COMPRESSORS'],
+    appname='p2pl'
+)
 db = client[app.config['MONGO_DBNAME']]
 
 # Initialize Login Manager
@@ -34,9 +49,45 @@ login_manager.login_message_category = 'info'
 db.users.create_index('email', unique=True)
 db.users.create_index('username', unique=True)
 db.road_reports.create_index([('location', GEOSPHERE)])
-db.road_reports.create_index('status')
-db.road_reports.create_index('severity')
 db.road_reports.create_index('created_at')
+stats_queries.create_stats_indexes(db)
+report_search.create_search_indexes(db)
+# Compound/partial indexes shared with smart-road-monitor/indexes.py (same names)
+ACTIVE_STATUSES = ['pending', 'assigned', 'in_progress']
+# Status/severity filters use report_stats (status, severity, created_at, resolved_at)
+for redundant in ('status_1', 'severity_1', 'status_1_severity_1_created_at_-1'):
+    if redundant in db.road_reports.index_information():
+        db.road_reports.drop_index(redundant)
+db.road_reports.create_index(
+    [('location', GEOSPHERE), ('severity', 1), ('created_at', -1)],
+    name='location_active',
+    partialFilterExpression={'status': {'$in': ACTIVE_STATUSES}}
+)
+db.road_reports.create_index(
+    [('resolved_at', -1)],
+    name='resolved_at_resolved',
+    partialFilterExpression={'status': 'resolved'}
+)
+# camera_detections is a time-series collection with TTL retention
+# (rollups and migration live in smart-road-monitor/detection_store.py)
+if 'camera_detections' not in db.list_collection_names():
+    db.create_collection(
+        'camera_detections',
+        timeseries={'timeField': 'timestamp', 'metaField': 'camera_id', 'granularity': 'seconds'},
+        expireAfterSeconds=app.config['DETECTION_RETENTION_DAYS'] * 86400
+    )
+db.camera_detections.create_index([('timestamp', -1)])
+
+def backfill_search_terms():
+    """Give reports stored before search_terms existed their terms (runs once per start)"""
+    try:
+        updated = report_search.backfill_search_terms(db.road_reports)
+        if updated:
+            print(f"Search terms added to {updated} reports")
+    except Exception as e:
+        print(f"Search terms backfill error: {e}")
+
+threading.Thread(target=backfill_search_terms, daemon=True).start()
 
 # User class for Flask-Login
 class User:
@@ -135,19 +186,20 @@ def create_default_users():
         db.users.insert_one(system_data)
         print("System user created for AI detections")
 
+# In-process statistics cache: pages read this instead of querying MongoDB
+_stats_cache = {'stats': None, 'expires': 0}
+
 def get_statistics():
-    """Get system statistics"""
-    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    """Get system statistics (cached for STATS_CACHE_TTL seconds)"""
+    now = time.time()
+    if _stats_cache['stats'] is not None and now < _stats_cache['expires']:
+        return _stats_cache['stats']
     
-    stats = {
-        'total_reports': db.road_reports.count_documents({}),
-        'reports_today': db.road_reports.count_documents({'created_at': {'$gte': today}}),
-        'pending_reports': db.road_reports.count_documents({'status': 'pending'}),
-        'resolved_today': db.road_reports.count_documents({'status': 'resolved', 'resolved_at': {'$gte': today}}),
-        'high_priority': db.road_reports.count_documents({'severity': 'high'}),
-        'ai_detections': db.camera_detections.count_documents({'timestamp': {'$gte': today}}) if 'camera_detections' in db.list_collection_names() else 0
-    }
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    stats = stats_queries.dashboard_stats(db, today)
     
+    _stats_cache['stats'] = stats
+    _stats_cache['expires'] = now + app.config['STATS_CACHE_TTL']
     return stats
 
 # Routes
@@ -167,21 +219,12 @@ def about():
 
 @app.route('/map')
 def map_page():
-    reports = list(db.road_reports.find({}).sort('created_at', -1).limit(100))
-    
-    # Convert ObjectId to string
-    for report in reports:
-        report['_id'] = str(report['_id'])
-        if 'reporter_id' in report and report['reporter_id']:
-            report['reporter_id'] = str(report['reporter_id'])
-        if 'assigned_to' in report and report['assigned_to']:
-            report['assigned_to'] = str(report['assigned_to'])
-
+    # Reports are fetched by the page itself: clusters of the visible area
+    # and, once a route is planned, the damages along it
     current_time = datetime.now()
 
     return render_template(
         'map.html',
-        reports=reports,
         current_time=current_time,
         user=current_user
     )
@@ -227,6 +270,7 @@ def report():
                 'created_at': datetime.utcnow(),
                 'updated_at': datetime.utcnow()
             }
+            report_data['search_terms'] = report_search.search_terms(report_data)
             
             # Insert into database
             result = db.road_reports.insert_one(report_data)
@@ -321,7 +365,7 @@ def login():
     return render_template('login.html', user=current_user)
 # Add these new routes to your existing app.py
 
-@app.route('/api/reports/route-damages')
+@app.route('/api/reports/route-damages', methods=['GET', 'POST'])
 def get_route_damages():
     """
     Get damages along a specific route
@@ -329,41 +373,34 @@ def get_route_damages():
     """
     try:
         # Get route coordinates from request
-        route_data = request.get_json()
+        route_data = request.get_json(silent=True)
         
         if not route_data or 'coordinates' not in route_data:
             return jsonify({'error': 'No route coordinates provided'}), 400
         
-        coordinates = route_data['coordinates']
-        
-        # Find damages near the route (within 100 meters)
-        all_reports = list(db.road_reports.find({
-            'location': {'$exists': True},
-            'status': {'$ne': 'resolved'}  # Don't show resolved issues
-        }))
-        
-        damages_on_route = []
-        
-        for report in all_reports:
-            if report.get('location') and report['location'].get('coordinates'):
-                report_lon, report_lat = report['location']['coordinates']
-                
-                # Check distance from each route point
-                min_distance = float('inf')
-                for coord in coordinates:
-                    route_lat, route_lon = coord[0], coord[1]
-                    distance = calculate_distance(
-                        report_lat, report_lon,
-                        route_lat, route_lon
-                    )
-                    if distance < min_distance:
-                        min_distance = distance
-                
-                # If within 100 meters of route
-                if min_distance < 100:
-                    report['_id'] = str(report['_id'])
-                    report['distance_from_route'] = min_distance
-                    damages_on_route.append(report)
+        # Corridor width in metres on each side of the route
+        try:
+            buffer_m = min(
+                float(route_data.get('buffer', app.config['ROUTE_CORRIDOR_METERS'])),
+                app.config['ROUTE_CORRIDOR_MAX_METERS']
+            )
+        except (TypeError, ValueError):
+            return jsonify({'error': 'buffer must be a number of metres'}), 400
+        
+        # Only reports inside the corridor are read; exact distances are
+        # computed for those candidates in one vectorized pass
+        damages_on_route = route_corridor.find_route_damages(
+            db.road_reports,
+            route_data['coordinates'],
+            buffer_m=buffer_m,
+            statuses=ACTIVE_STATUSES  # Don't show resolved issues
+        )
+        for report in damages_on_route:
+            report['_id'] = str(report['_id'])
+            if report.get('reporter_id'):
+                report['reporter_id'] = str(report['reporter_id'])
+            if report.get('assigned_to'):
+                report['assigned_to'] = str(report['assigned_to'])
         
         return jsonify({
             'damages': damages_on_route,
@@ -371,6 +408,8 @@ def get_route_damages():
             'high_priority': sum(1 for d in damages_on_route if d.get('severity') == 'high')
         })
         
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
@@ -378,61 +417,74 @@ def get_route_damages():
 def get_report_stats():
     """Get real-time statistics for the map"""
     try:
-        total = db.road_reports.count_documents({})
-        high = db.road_reports.count_documents({'severity': 'high', 'status': {'$ne': 'resolved'}})
-        medium = db.road_reports.count_documents({'severity': 'medium', 'status': {'$ne': 'resolved'}})
-        low = db.road_reports.count_documents({'severity': 'low', 'status': {'$ne': 'resolved'}})
-        resolved = db.road_reports.count_documents({'status': 'resolved'})
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        return jsonify(stats_queries.map_stats(db, today))
         
-        return jsonify({
-            'total': total,
-            'high': high,
-            'medium': medium,
-            'low': low,
-            'resolved': resolved,
-            'active': high + medium + low
-        })
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/reports/clusters')
+def get_report_clusters():
+    """Zoom-dependent report clusters for the visible map area
+    
+    ?bbox=west,south,east,north&zoom=z, optionally &status=active|all|<status>
+    and &severity=high,medium
+    """
+    try:
+        bbox = report_clusters.parse_bbox(request.args.get('bbox', ''))
+        zoom = report_clusters.parse_zoom(request.args.get('zoom', app.config['MAP_ZOOM']))
+        severities = [value for value in request.args.get('severity', '').split(',') if value]
+        query = report_clusters.filter_query(request.args.get('status', 'active'), severities, ACTIVE_STATUSES)
         
+        cell_px = app.config['REPORT_CLUSTER_CELL_PX']
+        clusters = report_clusters.find_clusters(db.road_reports, bbox, zoom, query, cell_px)
+        return jsonify(report_clusters.summarize(clusters, bbox, zoom, cell_px))
+        
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/reports/search')
 def search_reports():
-    """Search reports by location or address"""
+    """Search reports by address, description or issue type (word prefixes, ranked)"""
     try:
         query = request.args.get('q', '')
+        page = max(int(request.args.get('page', 1)), 1)
+        per_page = min(max(int(request.args.get('per_page', 20)), 1), app.config['SEARCH_MAX_PER_PAGE'])
         if not query:
-            return jsonify({'reports': []})
+            return jsonify({'reports': [], 'total': 0, 'page': page, 'per_page': per_page})
         
-        # Search by address (case-insensitive)
-        reports = list(db.road_reports.find({
-            'address': {'$regex': query, '$options': 'i'}
-        }).limit(20))
+        result = report_search.search(
+            db.road_reports, query, page, per_page,
+            max_candidates=app.config['SEARCH_MAX_CANDIDATES']
+        )
         
-        for report in reports:
+        for report in result['reports']:
             report['_id'] = str(report['_id'])
+            if report.get('reporter_id'):
+                report['reporter_id'] = str(report['reporter_id'])
+            if report.get('assigned_to'):
+                report['assigned_to'] = str(report['assigned_to'])
         
-        return jsonify({'reports': reports})
+        return jsonify({
+            'reports': result['reports'],
+            'total': result['total'],
+            'capped': result['capped'],
+            'page': page,
+            'per_page': per_page
+        })
         
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 # Helper function for distance calculation
 def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two points in meters (Haversine formula)"""
-    from math import radians, sin, cos, sqrt, atan2
-    
-    R = 6371000  # Earth's radius in meters
+    """Calculate distance between two points in meters (Haversine formula)
     
-    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
-    
-    dlat = lat2 - lat1
-    dlon = lon2 - lon1
-    
-    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    
-    return R * c
+    Accepts arrays as well; see geo_utils for the batch helpers.
+    """
+    return geo_utils.haversine(lat1, lon1, lat2, lon2)
 
 # Add this to your existing configuration section
 app.config.update({
@@ -607,9 +659,6 @@ def detect_defects():
                 'timestamp': datetime.utcnow()
             }
             
-            if 'camera_detections' not in db.list_collection_names():
-                db.create_collection('camera_detections')
-            
             db.camera_detections.insert_one(detection_data)
             
             return jsonify({
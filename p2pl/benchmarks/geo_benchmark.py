@@ -0,0 +1,77 @@
+"""Compare the scalar distance helper with the vectorized geo_utils functions.
+
+No database needed: synthetic reports and a route are generated around
+Chennai and the old per-pair loop is timed against the array versions.
+
+    python benchmarks/geo_benchmark.py --reports 20000 --route-points 500
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from math import radians, sin, cos, sqrt, atan2
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import geo_utils
+
+
+def scalar_distance(lat1, lon1, lat2, lon2):
+    """The previous calculate_distance, one pair at a time"""
+    R = 6371000
+    lat1, lon1, lat2, lon2 = map(radians, [lat1, lon1, lat2, lon2])
+    dlat = lat2 - lat1
+    dlon = lon2 - lon1
+    a = sin(dlat/2)**2 + cos(lat1) * cos(lat2) * sin(dlon/2)**2
+    return R * 2 * atan2(sqrt(a), sqrt(1-a))
+
+
+def timed(label, fn, repeat=3):
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        result = fn()
+        best = min(best, time.perf_counter() - started)
+    print(f"  {label:<42} {best * 1000:10.2f} ms")
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=20000)
+    parser.add_argument('--route-points', type=int, default=500)
+    args = parser.parse_args()
+
+    random.seed(1)
+    reports = np.array([
+        (80.27 + random.uniform(-0.2, 0.2), 13.08 + random.uniform(-0.2, 0.2))
+        for _ in range(args.reports)
+    ])
+    steps = np.cumsum(np.random.default_rng(1).normal(0, 0.0008, (args.route_points, 2)), axis=0)
+    route = np.array([80.2, 13.0]) + steps + np.linspace(0, 0.15, args.route_points)[:, None]
+
+    print(f"{args.reports} reports, {args.route_points} route points")
+
+    print("Pair distances (report i to route point 0):")
+    lon0, lat0 = route[0]
+    _, slow = timed('scalar loop', lambda: [scalar_distance(lat, lon, lat0, lon0) for lon, lat in reports])
+    _, fast = timed('geo_utils.haversine', lambda: geo_utils.haversine(reports[:, 1], reports[:, 0], lat0, lon0))
+    print(f"  speed-up {slow / fast:.0f}x")
+
+    print("Nearest route point per report (old route-damages inner loop):")
+    sample = reports[:max(args.reports // 20, 1)]
+    _, slow = timed(f'scalar loop ({len(sample)} reports)', lambda: [
+        min(scalar_distance(lat, lon, r_lat, r_lon) for r_lon, r_lat in route) for lon, lat in sample
+    ], repeat=1)
+    _, fast = timed(f'geo_utils.nearest ({len(sample)} reports)', lambda: geo_utils.nearest(sample, route))
+    print(f"  speed-up {slow / fast:.0f}x")
+
+    print("Distance to the route polyline:")
+    timed(f'geo_utils.point_to_polyline ({args.reports} reports)',
+          lambda: geo_utils.point_to_polyline(reports, route))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,124 @@
+"""Time report search: the old address $regex against the search_terms index.
+
+Fills a scratch database with synthetic reports (default 1M), then runs the
+same typed-as-you-go queries through both and prints latency percentiles
+and the documents each plan examines. Needs a MongoDB server:
+
+    MONGO_URI=mongodb://localhost:27017 python benchmarks/search_benchmark.py --reports 1000000
+
+The scratch database is dropped afterwards unless --keep is given (reruns
+with --keep reuse the data).
+"""
+import argparse
+import os
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import report_search
+
+STREETS = [
+    'Anna Salai', 'Mount Road', 'Poonamallee High Road', 'Arcot Road', 'GST Road', 'OMR',
+    'ECR', 'Velachery Main Road', 'Sardar Patel Road', 'Kamarajar Salai', 'Usman Road',
+    'TTK Road', 'Cathedral Road', 'Nungambakkam High Road', 'Radhakrishnan Salai',
+    'Royapettah High Road', 'Lattice Bridge Road', 'Inner Ring Road', 'Bazullah Road',
+    'Thiruvanmiyur Main Road', 'Adyar Bridge', 'Guindy Industrial Estate', 'Tambaram Bypass'
+]
+AREAS = [
+    'Chennai', 'T Nagar', 'Adyar', 'Velachery', 'Guindy', 'Mylapore', 'Egmore', 'Tambaram',
+    'Porur', 'Anna Nagar', 'Vadapalani', 'Kodambakkam', 'Perungudi', 'Sholinganallur',
+    # Addresses are stored as typed, so some arrive in Tamil
+    'சென்னை', 'அண்ணா நகர்', 'வேளச்சேரி', 'அடையாறு'
+]
+ISSUES = ['pothole', 'crack', 'speed_hump', 'flooding', 'debris', 'faded_marking']
+DESCRIPTIONS = [
+    'Large pothole causing vehicle damage', 'Multiple cracks across the lane',
+    'Water logging after rain', 'Unmarked speed hump near the junction',
+    'Construction debris left in the lane', 'Lane markings no longer visible at night'
+]
+QUERIES = ['mo', 'mount', 'mount ro', 'anna sal', 'velachery', 'pothole guindy', 'arc',
+           'speed hump', 'inner ring', 'flood tambaram', 'usman road t nagar', 'xyz',
+           'சென்னை', 'அண்ணா நக', 'வேள']
+
+
+def fill(collection, count, batch_size=10000):
+    random.seed(1)
+    start = datetime.utcnow() - timedelta(days=365)
+    for first in range(0, count, batch_size):
+        batch = []
+        for _ in range(min(batch_size, count - first)):
+            report = {
+                'address': f"{random.randint(1, 400)}, {random.choice(STREETS)}, {random.choice(AREAS)}",
+                'issue_type': random.choice(ISSUES),
+                'description': random.choice(DESCRIPTIONS),
+                'severity': random.choice(['high', 'medium', 'low']),
+                'status': 'pending',
+                'created_at': start + timedelta(seconds=random.randint(0, 365 * 86400))
+            }
+            report['search_terms'] = report_search.search_terms(report)
+            batch.append(report)
+        collection.insert_many(batch, ordered=False)
+        print(f"\r  inserted {first + len(batch)}/{count}", end='', flush=True)
+    print()
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p95 = samples[min(int(len(samples) * 0.95), len(samples) - 1)]
+    return statistics.median(samples) * 1000, p95 * 1000, samples[-1] * 1000
+
+
+def timed(fn, repeat):
+    samples = []
+    for _ in range(repeat):
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return percentiles(samples)
+
+
+def examined(collection, query):
+    stats = collection.find(query).limit(20).explain().get('executionStats', {})
+    return stats.get('totalDocsExamined', '?')
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--reports', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--database', default='smart_roads_search_bench')
+    parser.add_argument('--keep', action='store_true')
+    args = parser.parse_args()
+
+    client = MongoClient(os.environ.get('MONGO_URI', 'mongodb://localhost:27017'))
+    db = client[args.database]
+    collection = db.road_reports
+    try:
+        existing = collection.estimated_document_count()
+        if existing < args.reports:
+            print(f"Filling {args.database}.road_reports with {args.reports - existing} reports")
+            fill(collection, args.reports - existing)
+        report_search.create_search_indexes(db)
+        print(f"{collection.estimated_document_count()} reports, {args.repeat} runs per query\n")
+
+        print(f"{'query':<22} {'regex p50/p95 ms':>20} {'examined':>10}   {'index p50/p95 ms':>20} {'examined':>10} {'matches':>8}")
+        for query in QUERIES:
+            regex = {'address': {'$regex': query, '$options': 'i'}}
+            slow = timed(lambda: list(collection.find(regex).limit(20)), args.repeat)
+            fast = timed(lambda: report_search.search(collection, query), args.repeat)
+            match = report_search.search_pipeline(query)[0]['$match']
+            total = report_search.search(collection, query)['total']
+            print(f"{query!r:<22} {slow[0]:9.1f}/{slow[1]:<9.1f} {examined(collection, regex):>10}   "
+                  f"{fast[0]:9.1f}/{fast[1]:<9.1f} {examined(collection, match):>10} {total:>8}")
+    finally:
+        if not args.keep:
+            client.drop_database(args.database)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+"""Compare per-count statistics with the single $facet pipeline.
+
+Seeds a scratch database with synthetic road reports and times the old
+count_documents-per-number approach against stats_queries.
+
+    python benchmarks/stats_benchmark.py --uri mongodb://localhost:27017 --count 1000000
+"""
+import argparse
+import os
+import random
+import sys
+import time
+from datetime import datetime, timedelta
+
+from pymongo import MongoClient, GEOSPHERE
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+import stats_queries
+
+STATUSES = ['pending', 'assigned', 'in_progress', 'resolved']
+SEVERITIES = ['high', 'medium', 'low']
+ISSUE_TYPES = ['pothole', 'crack', 'speed_hump', 'debris', 'flooding']
+
+
+def seed(db, count, chunk=10000):
+    """Insert `count` synthetic reports spread over the last 90 days"""
+    db.road_reports.drop()
+    now = datetime.utcnow()
+    inserted = 0
+    while inserted < count:
+        batch = []
+        for _ in range(min(chunk, count - inserted)):
+            created = now - timedelta(seconds=random.randint(0, 90 * 86400))
+            status = random.choice(STATUSES)
+            batch.append({
+                'location': {
+                    'type': 'Point',
+                    'coordinates': [80.27 + random.uniform(-0.5, 0.5), 13.08 + random.uniform(-0.5, 0.5)]
+                },
+                'issue_type': random.choice(ISSUE_TYPES),
+                'severity': random.choice(SEVERITIES),
+                'status': status,
+                'created_at': created,
+                'resolved_at': created + timedelta(hours=random.randint(1, 240)) if status == 'resolved' else None
+            })
+        db.road_reports.insert_many(batch, ordered=False)
+        inserted += len(batch)
+        print(f"  seeded {inserted}/{count}", end='\r')
+    print()
+
+    # Same indexes as p2pl/app.py
+    db.road_reports.create_index([('location', GEOSPHERE)])
+    db.road_reports.create_index('status')
+    db.road_reports.create_index('severity')
+    db.road_reports.create_index('created_at')
+    stats_queries.create_stats_indexes(db)
+
+
+def per_count_stats(db, today):
+    """The previous implementation: one count_documents per number"""
+    not_resolved = {'$ne': 'resolved'}
+    return {
+        'total': db.road_reports.count_documents({}),
+        'reports_today': db.road_reports.count_documents({'created_at': {'$gte': today}}),
+        'pending_reports': db.road_reports.count_documents({'status': 'pending'}),
+        'resolved_today': db.road_reports.count_documents({'status': 'resolved', 'resolved_at': {'$gte': today}}),
+        'high_priority': db.road_reports.count_documents({'severity': 'high'}),
+        'high': db.road_reports.count_documents({'severity': 'high', 'status': not_resolved}),
+        'medium': db.road_reports.count_documents({'severity': 'medium', 'status': not_resolved}),
+        'low': db.road_reports.count_documents({'severity': 'low', 'status': not_resolved}),
+        'resolved': db.road_reports.count_documents({'status': 'resolved'})
+    }
+
+
+def facet_stats(db, today):
+    counters = stats_queries.report_counters(db, today)
+    active = counters['active_by_severity']
+    return {
+        'total': counters['total'],
+        'reports_today': counters['created_today'],
+        'pending_reports': counters['by_status'].get('pending', 0),
+        'resolved_today': counters['resolved_today'],
+        'high_priority': counters['by_severity'].get('high', 0),
+        'high': active.get('high', 0),
+        'medium': active.get('medium', 0),
+        'low': active.get('low', 0),
+        'resolved': counters['by_status'].get('resolved', 0)
+    }
+
+
+def timed(fn, repeat):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+    return result, timings[len(timings) // 2], timings[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--uri', default=os.environ.get('MONGO_URI', 'mongodb://localhost:27017'))
+    parser.add_argument('--db', default='smart_roads_bench')
+    parser.add_argument('--count', type=int, default=1000000)
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--skip-seed', action='store_true', help='reuse an already seeded database')
+    args = parser.parse_args()
+
+    db = MongoClient(args.uri)[args.db]
+    if not args.skip_seed:
+        print(f"Seeding {args.count} reports into {args.db}...")
+        seed(db, args.count)
+
+    today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+    legacy, legacy_median, legacy_best = timed(lambda: per_count_stats(db, today), args.repeat)
+    facet, facet_median, facet_best = timed(lambda: facet_stats(db, today), args.repeat)
+
+    if legacy != facet:
+        print("WARNING: results differ")
+        print(f"  per-count: {legacy}")
+        print(f"  $facet:    {facet}")
+
+    print(f"{'approach':<12}{'median ms':>12}{'best ms':>12}")
+    print(f"{'per-count':<12}{legacy_median * 1000:>12.1f}{legacy_best * 1000:>12.1f}")
+    print(f"{'$facet':<12}{facet_median * 1000:>12.1f}{facet_best * 1000:>12.1f}")
+    print(f"speedup: {legacy_median / facet_median:.2f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -13,6 +13,10 @@ class Config:
     # MongoDB Configuration
     MONGO_URI = os.environ.get('MONGO_URI') or 'mongodb://localhost:27017/smart_roads'
     MONGO_DBNAME = 'smart_roads'
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 50))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 2))
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib')
     
     # File upload configuration
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB max file size
@@ -24,6 +28,22 @@ class Config:
     MAP_CENTER = [13.0827, 80.2707]  # Default center (Chennai)
     MAP_ZOOM = 8
     MAX_REPORTS_ON_MAP = 500
+    # Map clusters: cell size in screen pixels (same size at every zoom)
+    REPORT_CLUSTER_CELL_PX = 60
+    
+    # Route damages: default and maximum corridor width (metres each side)
+    ROUTE_CORRIDOR_METERS = 100
+    ROUTE_CORRIDOR_MAX_METERS = 1000
+    
+    # Report search: most results per page, and most matches ranked per query
+    SEARCH_MAX_PER_PAGE = 50
+    SEARCH_MAX_CANDIDATES = 5000
+    
+    # Seconds the homepage/dashboard statistics are served from memory
+    STATS_CACHE_TTL = 10
+    
+    # Days raw camera detections are kept before MongoDB expires them
+    DETECTION_RETENTION_DAYS = int(os.environ.get('DETECTION_RETENTION_DAYS', 30))
     
     # API rate limiting (if you want to implement)
     RATELIMIT_ENABLED = True
@@ -0,0 +1,169 @@
+"""Prefix search over report addresses, descriptions and issue types.
+
+Every report stores search_terms: the distinct lower-case words of its
+address, description and issue type. A multikey index on that array turns
+each query word into an index range scan (word <= term < next word), so a
+half-typed query such as "mount ro" is answered from the index instead of
+an unanchored $regex over every address.
+
+Matches need every query word as a word prefix. At most max_candidates
+matches are ranked: a word hit in the address counts most, then the issue
+type, then the description, with a bonus for whole-word hits; ties go to
+the newest report.
+
+The same module is used by smart-road-monitor (which stores search_terms on
+every write) and p2pl (kept identical in both apps, which are deployed
+separately).
+"""
+import re
+import unicodedata
+from datetime import datetime
+
+from pymongo import ASCENDING, UpdateOne
+
+SEARCH_INDEX = 'search_terms'
+SEARCH_FIELDS = (('address', 3), ('issue_type', 2), ('description', 1))
+MAX_TERMS = 64
+MIN_TERM_LENGTH = 2
+
+# Unicode categories kept inside words: letters, numbers and marks (the
+# vowel signs and viramas of Indic scripts, which \w does not match)
+_WORD_CATEGORIES = ('L', 'N', 'M')
+# The same word boundary for MongoDB's (PCRE) $regexMatch
+_BOUNDARY = r'[^\p{L}\p{N}\p{M}]'
+# Reports whose text may have been split by the earlier ASCII-minded tokenizer
+_NON_ASCII = {'$regex': '[^\\x00-\\x7f]'}
+
+# Bumped when tokenize() changes in a way that needs stored terms rebuilt;
+# the version the stored terms match is kept in SEARCH_STATE
+TOKENIZER_VERSION = 2
+SEARCH_STATE = 'search_state'
+
+
+def tokenize(text):
+    """Lower-case words of text (underscores split words, e.g. speed_hump)
+
+    Words are runs of letters, digits and combining marks, so Tamil text
+    such as "சென்னை அண்ணா சாலை" keeps all three words.
+    """
+    if not text:
+        return []
+    words = []
+    start = None
+    text = str(text).lower()
+    for index, char in enumerate(text):
+        if unicodedata.category(char)[0] in _WORD_CATEGORIES:
+            if start is None:
+                start = index
+        elif start is not None:
+            words.append(text[start:index])
+            start = None
+    if start is not None:
+        words.append(text[start:])
+    return [word for word in words if len(word) >= MIN_TERM_LENGTH]
+
+
+def search_terms(document):
+    """Distinct words of a report document's searchable fields, address first"""
+    terms = []
+    seen = set()
+    for field, _ in SEARCH_FIELDS:
+        for word in tokenize(document.get(field)):
+            if word not in seen:
+                seen.add(word)
+                terms.append(word)
+    return terms[:MAX_TERMS]
+
+
+def create_search_indexes(db):
+    db.road_reports.create_index([('search_terms', ASCENDING)], name=SEARCH_INDEX)
+
+
+def backfill_search_terms(collection, batch_size=1000):
+    """Store search_terms on reports written before they existed; returns the count
+
+    Once per TOKENIZER_VERSION, reports with non-ASCII text are re-tokenized
+    too (rewritten only where their terms changed) and the version is
+    recorded, so later starts only look for reports without terms.
+    """
+    state = collection.database[SEARCH_STATE]
+    marker = state.find_one({'_id': 'tokenizer'}) or {}
+    migrate = marker.get('version', 0) < TOKENIZER_VERSION
+    fields = {field: 1 for field, _ in SEARCH_FIELDS}
+    fields['search_terms'] = 1
+    query = {'search_terms': {'$exists': False}}
+    if migrate:
+        query = {'$or': [query] + [{field: _NON_ASCII} for field, _ in SEARCH_FIELDS]}
+    updated = 0
+    batch = []
+    for document in collection.find(query, fields).batch_size(batch_size):
+        terms = search_terms(document)
+        if terms == document.get('search_terms'):
+            continue
+        batch.append(UpdateOne({'_id': document['_id']}, {'$set': {'search_terms': terms}}))
+        if len(batch) >= batch_size:
+            updated += collection.bulk_write(batch, ordered=False).modified_count
+            batch = []
+    if batch:
+        updated += collection.bulk_write(batch, ordered=False).modified_count
+    if migrate:
+        state.update_one(
+            {'_id': 'tokenizer'},
+            {'$set': {'version': TOKENIZER_VERSION, 'migrated_at': datetime.utcnow()}},
+            upsert=True
+        )
+    return updated
+
+
+def _prefix_range(word):
+    """Index bounds matching every term starting with word"""
+    return {'$gte': word, '$lt': word[:-1] + chr(ord(word[-1]) + 1)}
+
+
+def _score(words):
+    """Aggregation expression ranking a matched report"""
+    parts = []
+    for word in words:
+        escaped = re.escape(word)
+        for field, weight in SEARCH_FIELDS:
+            text = {'$toLower': {'$ifNull': [f"${field}", '']}}
+            starts = {'$regexMatch': {'input': text, 'regex': f"(^|{_BOUNDARY}){escaped}"}}
+            whole = {'$regexMatch': {'input': text, 'regex': f"(^|{_BOUNDARY}){escaped}({_BOUNDARY}|$)"}}
+            parts.append({'$cond': [starts, weight, 0]})
+            parts.append({'$cond': [whole, 1, 0]})
+    return {'$add': parts}
+
+
+def search_pipeline(query, page=1, per_page=20, max_candidates=5000, extra_match=None):
+    """Aggregation returning one page of ranked matches plus the match count"""
+    words = list(dict.fromkeys(tokenize(query)))
+    # Longest word first: its range is usually the most selective
+    words.sort(key=len, reverse=True)
+    match = {'$and': [{'search_terms': _prefix_range(word)} for word in words]}
+    if extra_match:
+        match['$and'].append(extra_match)
+    return [
+        {'$match': match},
+        {'$limit': max_candidates},
+        {'$addFields': {'search_score': _score(words)}},
+        {'$facet': {
+            'reports': [
+                {'$sort': {'search_score': -1, 'created_at': -1, '_id': -1}},
+                {'$skip': (page - 1) * per_page},
+                {'$limit': per_page},
+                {'$project': {'search_terms': 0}}
+            ],
+            'total': [{'$count': 'n'}]
+        }}
+    ]
+
+
+def search(collection, query, page=1, per_page=20, max_candidates=5000, extra_match=None):
+    """One page of reports matching query; returns {'reports', 'total', 'capped'}"""
+    if not tokenize(query):
+        return {'reports': [], 'total': 0, 'capped': False}
+    result = next(collection.aggregate(search_pipeline(query, page, per_page, max_candidates, extra_match)), None)
+    if not result:
+        return {'reports': [], 'total': 0, 'capped': False}
+    total = result['total'][0]['n'] if result['total'] else 0
+    return {'reports': result['reports'], 'total': total, 'capped': total >= max_candidates}
@@ -0,0 +1,89 @@
+"""Open reports along a route.
+
+The route (the map's list of [lat, lon] points) is covered by one rectangle
+per run of segments, grown by the corridor width, and sent to MongoDB as a
+$geoWithin MultiPolygon, so only reports near the route are read (served by
+the location_active partial 2dsphere index). The exact distance from every
+candidate to every route segment is then computed in one NumPy pass, on a
+local equirectangular projection per segment, which is accurate to well
+under a metre at corridor widths.
+"""
+import math
+
+import numpy as np
+
+from geo_utils import METERS_PER_DEGREE, point_to_polyline
+
+# 2dsphere treats polygon edges as great circles, which bow towards the pole
+# by roughly (step / 2)^2 * sin(2 * lat) / 4 radians: with a vertex every
+# 0.1 degrees that stays around a metre, well inside the corridor width
+EDGE_STEP = 0.1
+
+
+def route_to_lonlat(coordinates):
+    """Array of (lon, lat) from the map's [[lat, lon], ...] route"""
+    points = np.asarray(coordinates, dtype=float)
+    if points.ndim != 2 or points.shape[1] < 2 or len(points) == 0:
+        raise ValueError('Route must be a list of [lat, lon] points')
+    return points[:, [1, 0]]
+
+
+def corridor_geometry(route, buffer_m, segments_per_box=16):
+    """GeoJSON MultiPolygon covering `route` (lon, lat array) plus buffer_m"""
+    if not buffer_m >= 0:
+        raise ValueError('buffer must be a non-negative number of metres')
+    dlat = buffer_m / METERS_PER_DEGREE
+    polygons = []
+    last = max(len(route) - 1, 1)
+    for start in range(0, last, segments_per_box):
+        chunk = route[start:start + segments_per_box + 1]
+        west, south = chunk.min(axis=0)
+        east, north = chunk.max(axis=0)
+        # Longitude degrees shrink towards the poles; size the margin for the widest latitude
+        widest = min(max(abs(south), abs(north)) + dlat, 89.0)
+        dlon = buffer_m / (METERS_PER_DEGREE * np.cos(np.radians(widest)))
+        west, east = west - dlon, east + dlon
+        south, north = max(south - dlat, -90.0), min(north + dlat, 90.0)
+        west, south, east, north = float(west), float(south), float(east), float(north)
+        # Vertices along the south and north edges keep them on their parallels
+        steps = max(math.ceil((east - west) / EDGE_STEP), 1)
+        lons = [west + (east - west) * step / steps for step in range(steps + 1)]
+        ring = [[lon, south] for lon in lons]
+        ring += [[lon, north] for lon in reversed(lons)]
+        ring.append([west, south])
+        polygons.append([ring])
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+def find_route_damages(collection, coordinates, buffer_m=100, statuses=None, limit=None):
+    """Reports within buffer_m of a route, ordered by position along it
+
+    Each returned document gets distance_from_route, distance_along_route
+    (both in metres) and route_segment.
+    """
+    route = route_to_lonlat(coordinates)
+    query = {'location': {'$geoWithin': {'$geometry': corridor_geometry(route, buffer_m)}}}
+    if statuses:
+        query['status'] = {'$in': list(statuses)}
+
+    candidates = []
+    points = []
+    for report in collection.find(query):
+        coords = (report.get('location') or {}).get('coordinates')
+        if coords and len(coords) >= 2:
+            candidates.append(report)
+            points.append(coords[:2])
+    if not candidates:
+        return []
+
+    distance, along, segment = point_to_polyline(points, route)
+    damages = []
+    for index in np.flatnonzero(distance <= buffer_m):
+        report = candidates[index]
+        report['distance_from_route'] = float(distance[index])
+        report['distance_along_route'] = float(along[index])
+        report['route_segment'] = int(segment[index])
+        damages.append(report)
+
+    damages.sort(key=lambda report: report['distance_along_route'])
+    return damages[:limit] if limit else damages
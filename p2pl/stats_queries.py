@@ -0,0 +1,103 @@
+"""Single-pass statistics queries for road reports.
+
+All severity/status/time-window counters are computed by one aggregation
+over road_reports using $facet, instead of one count_documents per number.
+The pipeline only projects fields held in the REPORT_STATS_INDEX compound
+index and hints it, so MongoDB can answer it from the index alone.
+"""
+from pymongo import ASCENDING, DESCENDING
+
+REPORT_STATS_INDEX = 'report_stats'
+REPORT_STATS_KEYS = [
+    ('status', ASCENDING),
+    ('severity', ASCENDING),
+    ('created_at', DESCENDING),
+    ('resolved_at', DESCENDING)
+]
+
+SEVERITIES = ('high', 'medium', 'low')
+
+
+def create_stats_indexes(db):
+    """Create the compound index the stats pipeline is hinted to"""
+    db.road_reports.create_index(REPORT_STATS_KEYS, name=REPORT_STATS_INDEX)
+
+
+def _count(stage_result):
+    return stage_result[0]['n'] if stage_result else 0
+
+
+def report_stats_pipeline(today):
+    """Build the $facet pipeline computing every report counter at once"""
+    return [
+        {'$project': {'_id': 0, 'status': 1, 'severity': 1, 'created_at': 1, 'resolved_at': 1}},
+        {'$facet': {
+            'total': [{'$count': 'n'}],
+            'by_status': [
+                {'$group': {'_id': '$status', 'n': {'$sum': 1}}}
+            ],
+            'by_severity': [
+                {'$group': {'_id': '$severity', 'n': {'$sum': 1}}}
+            ],
+            'active_by_severity': [
+                {'$match': {'status': {'$ne': 'resolved'}}},
+                {'$group': {'_id': '$severity', 'n': {'$sum': 1}}}
+            ],
+            'created_today': [
+                {'$match': {'created_at': {'$gte': today}}},
+                {'$count': 'n'}
+            ],
+            'resolved_today': [
+                {'$match': {'status': 'resolved', 'resolved_at': {'$gte': today}}},
+                {'$count': 'n'}
+            ]
+        }}
+    ]
+
+
+def report_counters(db, today):
+    """Run the stats pipeline and flatten it into plain counters"""
+    try:
+        cursor = db.road_reports.aggregate(report_stats_pipeline(today), hint=REPORT_STATS_INDEX)
+    except Exception:
+        # Index not built yet: same pipeline, collection scan
+        cursor = db.road_reports.aggregate(report_stats_pipeline(today))
+    facets = next(cursor, None) or {}
+
+    by_status = {row['_id']: row['n'] for row in facets.get('by_status', [])}
+    by_severity = {row['_id']: row['n'] for row in facets.get('by_severity', [])}
+    active = {row['_id']: row['n'] for row in facets.get('active_by_severity', [])}
+
+    return {
+        'total': _count(facets.get('total')),
+        'by_status': by_status,
+        'by_severity': by_severity,
+        'active_by_severity': active,
+        'created_today': _count(facets.get('created_today')),
+        'resolved_today': _count(facets.get('resolved_today'))
+    }
+
+
+def dashboard_stats(db, today):
+    """Counters for the homepage and dashboard"""
+    counters = report_counters(db, today)
+    return {
+        'total_reports': counters['total'],
+        'reports_today': counters['created_today'],
+        'pending_reports': counters['by_status'].get('pending', 0),
+        'resolved_today': counters['resolved_today'],
+        'high_priority': counters['by_severity'].get('high', 0),
+        'ai_detections': db.camera_detections.count_documents({'timestamp': {'$gte': today}})
+    }
+
+
+def map_stats(db, today):
+    """Counters for the map legend (/api/reports/stats)"""
+    counters = report_counters(db, today)
+    active = counters['active_by_severity']
+    stats = {'total': counters['total']}
+    for severity in SEVERITIES:
+        stats[severity] = active.get(severity, 0)
+    stats['resolved'] = counters['by_status'].get('resolved', 0)
+    stats['active'] = sum(stats[severity] for severity in SEVERITIES)
+    return stats
@@ -21,18 +21,70 @@ def create_app(config_class=Config):
     login_manager.init_app(app)
     
     # Initialize MongoDB
+    from detection_store import detection_store
+    detection_store.configure(app.config)
     with app.app_context():
         mongo = MongoDB()
         mongo.init_db()  # Ensure database is initialized
         app.mongo = mongo
     
+    # Start the in-memory statistics service
+    from stats_service import statistics_service
+    statistics_service.configure(app.config)
+    with app.app_context():
+        statistics_service.start()
+    detection_store.start()
+    
+    # Open reports held in memory for nearby/bbox/nearest queries
+    from report_index import report_index
+    report_index.configure(app.config)
+    report_index.start()
+    
+    # Duplicate reports are merged into incidents on submission
+    from incidents import incidents
+    incidents.configure(app.config)
+    
+    # Addresses for reports submitted without one, resolved in the background
+    from geocoding import geocoder
+    geocoder.configure(app.config)
+    geocoder.start()
+    
+    # Report map tiles, invalidated by the same events after the index has applied them
+    from report_tiles import report_tiles
+    report_tiles.configure(app.config)
+    report_tiles.start()
+    
+    # Daily heatmap cells for authority analytics, rebuilt periodically
+    from heatmaps import heatmap_store
+    heatmap_store.configure(app.config)
+    heatmap_store.start()
+    
     # Register routes
     register_routes(app)
     
-    # Initialize SocketIO
-    socketio.init_app(app, cors_allowed_origins="*", async_mode='eventlet')
+    # Initialize SocketIO and the worker pool its handlers use for MongoDB
+    from async_db import async_db
+    async_db.configure(app.config)
+    socketio.init_app(
+        app,
+        cors_allowed_origins="*",
+        async_mode='eventlet',
+        message_queue=app.config.get('SOCKETIO_MESSAGE_QUEUE')
+    )
+    from presence import presence
+    presence.configure(app.config)
+    presence.start(socketio)
+    from broadcaster import broadcaster
+    broadcaster.configure(app.config)
+    
+    # Push report/detection changes to clients as they happen
+    from change_feed import change_feed
+    change_feed.configure(app.config)
+    change_feed.start()
     
-    # Initialize camera manager
+    # Initialize camera manager and the relay sharing each camera's stream
+    from camera_relay import relay_hub
+    relay_hub.configure(app.config)
     from camera_integration import camera_manager
     
     # Create default admin user if not exists
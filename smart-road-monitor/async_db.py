@@ -0,0 +1,73 @@
+"""Asynchronous data access for Socket.IO handlers and background tasks.
+
+Handlers hand blocking model calls (geo queries, saves) to a bounded worker
+pool and return immediately; the result is delivered to a callback that
+emits to the requesting client. One slow query then only delays the client
+that asked for it, never the event loop serving everyone else.
+"""
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
+
+
+class AsyncDB:
+    """Bounded executor for blocking MongoDB work"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.max_workers = 16
+            cls._instance.timeout = 10
+            cls._instance.executor = None
+        return cls._instance
+
+    def configure(self, config):
+        """Read pool size and default timeout from the Flask config"""
+        self.max_workers = config.get('ASYNC_DB_WORKERS', self.max_workers)
+        self.timeout = config.get('ASYNC_DB_TIMEOUT', self.timeout)
+
+    def _get_executor(self):
+        if self.executor is None:
+            self.executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix='async-db')
+        return self.executor
+
+    def submit(self, fn, *args, **kwargs):
+        """Schedule fn(*args, **kwargs) and return a Future"""
+        return self._get_executor().submit(fn, *args, **kwargs)
+
+    def run(self, fn, *args, callback=None, errback=None, **kwargs):
+        """Schedule fn and pass its result to callback (or the exception to errback)"""
+        future = self.submit(fn, *args, **kwargs)
+
+        def done(future):
+            try:
+                result = future.result()
+            except Exception as e:
+                if errback:
+                    errback(e)
+                else:
+                    print(f"Async DB error in {getattr(fn, '__qualname__', fn)}: {e}")
+                return
+            if callback:
+                try:
+                    callback(result)
+                except Exception as e:
+                    print(f"Async DB callback error: {e}")
+
+        future.add_done_callback(done)
+        return future
+
+    def call(self, fn, *args, timeout=None, default=None, **kwargs):
+        """Run fn on the pool and wait for it, giving up after timeout seconds"""
+        future = self.submit(fn, *args, **kwargs)
+        try:
+            return future.result(timeout=timeout or self.timeout)
+        except TimeoutError:
+            print(f"Async DB timeout in {getattr(fn, '__qualname__', fn)}")
+            return default
+        except Exception as e:
+            print(f"Async DB error in {getattr(fn, '__qualname__', fn)}: {e}")
+            return default
+
+
+# Global async data-access pool
+async_db = AsyncDB()
@@ -63,23 +63,34 @@ def generate_token(user, expiration_hours=24):
     
     return token
 
-def verify_token(token):
-    """Verify JWT token and return user"""
+def decode_token(token):
+    """Check a JWT token's signature and expiry; returns (user_id, error) without a database lookup"""
     try:
         payload = jwt.decode(
             token,
             current_app.config['SECRET_KEY'],
             algorithms=['HS256']
         )
-        user = User.find_by_id(payload['user_id'])
-        if user and user.is_active:
-            return user, None
-        return None, 'User not found or inactive'
+        return payload['user_id'], None
     except jwt.ExpiredSignatureError:
         return None, 'Token has expired'
-    except jwt.InvalidTokenError:
+    except (jwt.InvalidTokenError, KeyError):
         return None, 'Invalid token'
 
+def load_token_user(user_id):
+    """The active user a decoded token belongs to; returns (user, error)"""
+    user = User.find_by_id(user_id)
+    if user and user.is_active:
+        return user, None
+    return None, 'User not found or inactive'
+
+def verify_token(token):
+    """Verify JWT token and return user"""
+    user_id, error = decode_token(token)
+    if error:
+        return None, error
+    return load_token_user(user_id)
+
 def authority_required(f):
     """Decorator to require authority role"""
     @wraps(f)
@@ -0,0 +1,161 @@
+"""Coalescing Socket.IO broadcaster for bursty events.
+
+Camera detections and data changes are published here instead of being
+emitted straight away. Messages for the same event and target rooms are
+collected for BROADCAST_WINDOW seconds and sent together; a message whose
+key is already waiting (the same report, the same camera defect) replaces
+the earlier one. A window holding a single message is sent unchanged as
+`event`, several are sent as `event_batch` with {'events': [...]}. A batch
+reaching BROADCAST_MAX_BATCH distinct messages is sent at once rather than
+waiting for the window, so bursts are split up but never dropped.
+
+Clients whose Engine.IO send queue is longer than BROADCAST_MAX_CLIENT_QUEUE
+are skipped while they catch up and then get one `broadcast_resync` message
+saying what they missed, so a slow browser never holds up everyone else.
+
+With a Socket.IO message queue, messages reach the clients of every web
+process; `local` messages skip the queue for events that each process
+observes on its own (MongoDB change streams).
+"""
+import itertools
+import threading
+from collections import OrderedDict
+
+
+def _target(to):
+    """Normalise a room argument into a hashable target (None = everyone)"""
+    if to is None:
+        return None
+    if isinstance(to, str):
+        return (to,)
+    return tuple(sorted(set(to)))
+
+
+class Broadcaster:
+    """Batch, deduplicate and flow-control broadcasts"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = threading.Lock()
+            # Serialises sending (window flushes and early flushes of full batches)
+            cls._instance.send_lock = threading.Lock()
+            cls._instance.window = 0.25
+            cls._instance.max_batch = 100
+            cls._instance.max_client_queue = 64
+            cls._instance.pending = OrderedDict()  # (event, target, local) -> {key: payload}
+            cls._instance.missed = {}  # sid -> {'count': n, 'events': set()}
+            cls._instance.sequence = itertools.count()
+            cls._instance.task = None
+        return cls._instance
+
+    def configure(self, config):
+        self.window = config.get('BROADCAST_WINDOW', self.window)
+        self.max_batch = config.get('BROADCAST_MAX_BATCH', self.max_batch)
+        self.max_client_queue = config.get('BROADCAST_MAX_CLIENT_QUEUE', self.max_client_queue)
+
+    def publish(self, event, payload, to=None, key=None, local=False):
+        """Queue a message for the next flush
+
+        `to` is a room, a list of rooms or None for every client. Messages
+        with the same event, target and key coalesce to the latest one.
+        """
+        if key is None:
+            key = ('seq', next(self.sequence))
+        group = (event, _target(to), local)
+        full = None
+        with self.lock:
+            batch = self.pending.setdefault(group, OrderedDict())
+            batch.pop(key, None)
+            batch[key] = payload
+            if len(batch) >= self.max_batch:
+                full = self.pending.pop(group)
+        if full is not None:
+            from websocket_handler import socketio
+            with self.send_lock:
+                self._send(socketio, group, full)
+        self._ensure_started()
+
+    def _ensure_started(self):
+        if self.task is not None:
+            return
+        from websocket_handler import socketio
+        with self.lock:
+            if self.task is None:
+                self.task = socketio.start_background_task(self._run)
+
+    def _run(self):
+        from websocket_handler import socketio
+        while True:
+            socketio.sleep(self.window)
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Broadcast flush error: {e}")
+
+    def flush(self):
+        """Send everything collected during the last window"""
+        from websocket_handler import socketio
+
+        with self.lock:
+            pending, self.pending = self.pending, OrderedDict()
+        if not pending and not self.missed:
+            return
+
+        with self.send_lock:
+            for group, batch in pending.items():
+                self._send(socketio, group, batch)
+            self._resync(socketio)
+
+    def _send(self, socketio, group, batch):
+        """Emit one batch of messages for an (event, target, local) group"""
+        event, target, local = group
+        messages = list(batch.values())
+        to = list(target) if target else None
+        skip = self._slow_clients(socketio.server, target, event)
+        if len(messages) == 1:
+            socketio.emit(event, messages[0], to=to, skip_sid=skip, ignore_queue=local)
+        else:
+            socketio.emit(f'{event}_batch', {'events': messages, 'count': len(messages)},
+                          to=to, skip_sid=skip, ignore_queue=local)
+
+    def _queue_length(self, server, eio_sid):
+        """Outgoing packets waiting on a client's connection, or None if gone"""
+        socket = server.eio.sockets.get(eio_sid)
+        if socket is None:
+            return None
+        queue = getattr(socket, 'queue', None)
+        return queue.qsize() if queue is not None else 0
+
+    def _slow_clients(self, server, target, event):
+        """Sids in the target rooms that are too far behind to send to"""
+        slow = []
+        rooms = list(target) if target else None
+        for sid, eio_sid in list(server.manager.get_participants('/', rooms)):
+            length = self._queue_length(server, eio_sid)
+            if length is not None and length > self.max_client_queue:
+                slow.append(sid)
+                entry = self.missed.setdefault(sid, {'count': 0, 'events': set()})
+                entry['count'] += 1
+                entry['events'].add(event)
+        return slow
+
+    def _resync(self, socketio):
+        """Tell recovered clients what they missed so they can reload"""
+        server = socketio.server
+        for sid, entry in list(self.missed.items()):
+            eio_sid = server.manager.eio_sid_from_sid(sid, '/')
+            length = self._queue_length(server, eio_sid) if eio_sid else None
+            if length is None:
+                del self.missed[sid]
+            elif length <= self.max_client_queue // 2:
+                del self.missed[sid]
+                socketio.emit('broadcast_resync', {
+                    'missed': entry['count'],
+                    'events': sorted(entry['events'])
+                }, to=sid)
+
+
+# Global broadcaster
+broadcaster = Broadcaster()
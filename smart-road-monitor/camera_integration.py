@@ -8,34 +8,62 @@ from datetime import datetime
 from flask import current_app
 from models import CameraDetection, RoadReport, User
 from ai_detection import detector
+from camera_relay import relay_hub
+from incidents import incidents
 import base64
 import io
 from PIL import Image
 
 class ESP32Camera:
+    # Snapshots younger than this (seconds) are shared instead of fetched again
+    snapshot_max_age = 1.0
+    
     def __init__(self, ip=None, port=None):
         self.ip = ip or current_app.config['ESP32_CAM_IP']
         self.port = port or current_app.config['ESP32_CAM_PORT']
         self.stream_url = f"http://{self.ip}:{self.port}/stream"
-        self.snapshot_url = f"http://{self.ip}:{self.ip}/capture"
+        self.snapshot_url = f"http://{self.ip}:{self.port}/capture"
         self.is_streaming = False
         self.stream_thread = None
         self.gps_data = None
         self.camera_id = f"esp32_{self.ip.replace('.', '_')}"
+        self.snapshot_lock = threading.Lock()
+        self.latest_jpeg = None
+        self.latest_jpeg_at = 0
+    
+    def get_snapshot_jpeg(self):
+        """Latest snapshot as the JPEG bytes sent by the camera (no re-encoding)
         
-    def get_snapshot(self):
-        """Capture a single snapshot from ESP32 camera"""
-        try:
-            response = requests.get(self.snapshot_url, timeout=5)
-            if response.status_code == 200:
-                # Convert bytes to image
-                image_array = np.frombuffer(response.content, dtype=np.uint8)
-                image = cv2.imdecode(image_array, cv2.IMREAD_COLOR)
-                return image
-        except Exception as e:
-            print(f"Error getting snapshot: {e}")
+        Viewers asking within snapshot_max_age seconds of each other share one
+        request to the camera.
+        """
+        with self.snapshot_lock:
+            if self.latest_jpeg is not None and time.time() - self.latest_jpeg_at < self.snapshot_max_age:
+                return self.latest_jpeg
+            # While the camera is streaming, /capture would need a second connection
+            relayed = relay_hub.latest(self, self.snapshot_max_age)
+            if relayed is not None:
+                self.latest_jpeg = relayed
+                self.latest_jpeg_at = time.time()
+                return relayed
+            try:
+                response = requests.get(self.snapshot_url, timeout=5)
+                if response.status_code == 200 and response.content:
+                    self.latest_jpeg = response.content
+                    self.latest_jpeg_at = time.time()
+                    return self.latest_jpeg
+            except Exception as e:
+                print(f"Error getting snapshot: {e}")
         return None
     
+    def get_snapshot(self):
+        """Capture a single snapshot from ESP32 camera as a decoded image"""
+        jpeg = self.get_snapshot_jpeg()
+        if jpeg is None:
+            return None
+        image_array = np.frombuffer(jpeg, dtype=np.uint8)
+        return cv2.imdecode(image_array, cv2.IMREAD_COLOR)
+    
     def start_streaming(self, gps_callback=None, detection_callback=None):
         """Start streaming and processing frames"""
         if self.is_streaming:
@@ -61,24 +89,18 @@ class ESP32Camera:
     
     def _stream_worker(self):
         """Worker thread for streaming and processing"""
-        cap = None
         frame_count = 0
+        # Frames come from the shared relay, so viewers and detection use one
+        # upstream connection to the camera
+        relay = relay_hub.relay_for(self)
         
         try:
-            # Open video stream
-            cap = cv2.VideoCapture(self.stream_url)
-            if not cap.isOpened():
-                print(f"Failed to open stream: {self.stream_url}")
-                return
-            
             print(f"Started streaming from ESP32 camera at {self.stream_url}")
             
-            while self.is_streaming and cap.isOpened():
-                # Read frame
-                ret, frame = cap.read()
-                if not ret:
-                    print("Failed to read frame")
-                    time.sleep(0.1)
+            for jpeg in relay.frames(max_fps=relay_hub.detection_fps, stop=lambda: not self.is_streaming):
+                frame = cv2.imdecode(np.frombuffer(jpeg, dtype=np.uint8), cv2.IMREAD_COLOR)
+                if frame is None:
+                    print("Failed to decode frame")
                     continue
                 
                 frame_count += 1
@@ -104,14 +126,9 @@ class ESP32Camera:
                     if self.detection_callback:
                         self.detection_callback(detection_result)
                 
-                # Limit frame rate
-                time.sleep(0.033)  # ~30 FPS
-                
         except Exception as e:
             print(f"Stream error: {e}")
         finally:
-            if cap:
-                cap.release()
             self.is_streaming = False
             print("Streaming stopped")
     
@@ -121,7 +138,13 @@ class ESP32Camera:
             # Create detection record
             detection = CameraDetection()
             detection.camera_id = self.camera_id
-            detection.location = detection_result.get('gps')
+            gps = detection_result.get('gps')
+            if gps and gps.get('latitude') is not None and gps.get('longitude') is not None:
+                detection.location = {
+                    'type': 'Point',
+                    'coordinates': [gps['longitude'], gps['latitude']]
+                }
+            detection.gps = gps
             detection.image_url = detection_result.get('image_path', '')
             detection.detections = [{
                 'type': detection_result['defect_type'],
@@ -143,23 +166,6 @@ class ESP32Camera:
     def _create_report(self, detection_result):
         """Create a road report from detection"""
         try:
-            # Check if similar report already exists nearby
-            if detection_result.get('gps'):
-                lat = detection_result['gps'].get('latitude')
-                lon = detection_result['gps'].get('longitude')
-                
-                if lat and lon:
-                    # Look for existing reports within 50 meters
-                    existing_reports = RoadReport.find_nearby(lon, lat, 50)
-                    
-                    if existing_reports:
-                        # Update existing report if found
-                        report = existing_reports[0]
-                        report.verification_score = min(1.0, report.verification_score + 0.1)
-                        report.save()
-                        return report
-            
-            # Create new report
             report = RoadReport()
             
             # Use system user or find admin user
@@ -185,9 +191,11 @@ class ESP32Camera:
             report.priority = 1 if detection_result['severity'] == 'high' else 2
             report.verification_score = detection_result['confidence']
             
-            report.save()
+            # Repeat detections of the same defect are merged into its incident
+            report, merged = incidents.submit(report, detection_result['confidence'])
             
-            print(f"Report created: {report.issue_type} at {report.location}")
+            if not merged:
+                print(f"Report created: {report.issue_type} at {report.location}")
             return report
             
         except Exception as e:
@@ -196,11 +204,9 @@ class ESP32Camera:
     
     def get_live_feed_base64(self):
         """Get current frame as base64 encoded image"""
-        snapshot = self.get_snapshot()
-        if snapshot is not None:
-            # Convert to base64
-            _, buffer = cv2.imencode('.jpg', snapshot)
-            return base64.b64encode(buffer).decode('utf-8')
+        jpeg = self.get_snapshot_jpeg()
+        if jpeg is not None:
+            return base64.b64encode(jpeg).decode('utf-8')
         return None
 
 class CameraManager:
@@ -244,30 +250,30 @@ class CameraManager:
     
     def on_detection(self, detection_result):
         """Callback when a detection is made"""
-        # Broadcast detection via WebSocket
-        from websocket_handler import socketio
-        socketio.emit('new_detection', {
-            'camera_id': detection_result.get('camera_id', 'unknown'),
+        # Broadcast detection via WebSocket. A camera firing several times a
+        # second reaches clients as one batch per window, latest per defect type
+        from broadcaster import broadcaster
+        from websocket_handler import broadcast_map_update
+        camera_id = detection_result.get('camera_id', 'unknown')
+        broadcaster.publish('new_detection', {
+            'camera_id': camera_id,
             'defect_type': detection_result.get('defect_type'),
             'confidence': detection_result.get('confidence'),
             'severity': detection_result.get('severity'),
             'location': detection_result.get('gps'),
             'timestamp': detection_result.get('timestamp'),
             'image_url': detection_result.get('image_path')
-        })
+        }, key=(camera_id, detection_result.get('defect_type')))
         
-        # Also emit for map updates
-        socketio.emit('map_update', {
-            'type': 'new_issue',
-            'data': {
-                'id': f"ai_{datetime.utcnow().timestamp()}",
-                'type': detection_result.get('defect_type'),
-                'severity': detection_result.get('severity'),
-                'location': detection_result.get('gps'),
-                'source': 'ai_camera',
-                'timestamp': detection_result.get('timestamp')
-            }
-        })
+        # Also emit for map updates, to the grid cells around the detection
+        broadcast_map_update('new_issue', {
+            'id': f"ai_{datetime.utcnow().timestamp()}",
+            'type': detection_result.get('defect_type'),
+            'severity': detection_result.get('severity'),
+            'location': detection_result.get('gps'),
+            'source': 'ai_camera',
+            'timestamp': detection_result.get('timestamp')
+        }, detection_result.get('gps'))
 
 class GPSSimulator:
     """Simulate GPS data for development"""
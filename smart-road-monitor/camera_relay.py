@@ -0,0 +1,185 @@
+"""Fan-out relay for ESP32 MJPEG streams.
+
+An ESP32-CAM serves one or two stream clients at most, so the server keeps a
+single upstream connection per camera and hands the newest JPEG to every
+consumer: browser viewers (/api/camera/<id>/mjpeg), the detection worker and
+snapshots. Each consumer takes frames at its own rate cap, skipping frames it
+is too slow for, and the upstream connection is closed again once nobody has
+used it for CAMERA_RELAY_IDLE_TIMEOUT seconds.
+"""
+import threading
+import time
+
+import requests
+
+JPEG_START = b'\xff\xd8'
+JPEG_END = b'\xff\xd9'
+
+
+def iter_jpeg_frames(chunks, max_frame_bytes=2 * 1024 * 1024):
+    """Split a multipart MJPEG byte stream into complete JPEG images"""
+    buffer = bytearray()
+    for chunk in chunks:
+        buffer.extend(chunk)
+        while True:
+            start = buffer.find(JPEG_START)
+            if start < 0:
+                # Keep the last byte in case a start marker is split across chunks
+                del buffer[:-1]
+                break
+            end = buffer.find(JPEG_END, start + 2)
+            if end < 0:
+                del buffer[:start]
+                if len(buffer) > max_frame_bytes:
+                    buffer.clear()
+                break
+            yield bytes(buffer[start:end + 2])
+            del buffer[:end + 2]
+
+
+class CameraRelay:
+    """One upstream MJPEG connection shared by any number of consumers"""
+
+    def __init__(self, camera_id, stream_url, idle_timeout=30):
+        self.camera_id = camera_id
+        self.stream_url = stream_url
+        self.idle_timeout = idle_timeout
+        self.condition = threading.Condition()
+        self.frame = None
+        self.frame_at = 0
+        self.sequence = 0
+        self.clients = 0
+        self.last_used = time.time()
+        self.thread = None
+
+    def acquire(self):
+        with self.condition:
+            self.clients += 1
+            self.last_used = time.time()
+            if self.thread is None:
+                self.thread = threading.Thread(target=self._run, daemon=True)
+                self.thread.start()
+
+    def release(self):
+        with self.condition:
+            self.clients = max(self.clients - 1, 0)
+            self.last_used = time.time()
+
+    def latest(self, max_age):
+        """The newest frame if it is younger than max_age seconds"""
+        with self.condition:
+            if self.frame is not None and time.time() - self.frame_at < max_age:
+                return self.frame
+        return None
+
+    def frames(self, max_fps=None, stall_timeout=None, stop=None):
+        """Yield the newest frame, at most max_fps times per second
+
+        Ends when no frame arrives for stall_timeout seconds or when stop()
+        returns true. Frames published while the consumer is busy or
+        rate-limited are skipped, never queued.
+        """
+        interval = 1.0 / max_fps if max_fps else 0
+        seen = 0
+        self.acquire()
+        try:
+            while True:
+                # Checked for every frame, not only while waiting: a busy stream never waits
+                if stop and stop():
+                    return
+                waited_since = time.time()
+                with self.condition:
+                    while self.sequence == seen:
+                        if stop and stop():
+                            return
+                        if stall_timeout and time.time() - waited_since > stall_timeout:
+                            return
+                        self.condition.wait(timeout=1.0)
+                    seen = self.sequence
+                    frame = self.frame
+                sent_at = time.time()
+                yield frame
+                if stop and stop():
+                    return
+                delay = interval - (time.time() - sent_at)
+                if delay > 0:
+                    time.sleep(delay)
+        finally:
+            self.release()
+
+    def _idle(self):
+        return self.clients == 0 and time.time() - self.last_used > self.idle_timeout
+
+    def _publish(self, frame):
+        with self.condition:
+            self.frame = frame
+            self.frame_at = time.time()
+            self.sequence += 1
+            self.condition.notify_all()
+
+    def _run(self):
+        backoff = 1
+        while True:
+            with self.condition:
+                if self._idle():
+                    self.thread = None
+                    print(f"Camera relay for {self.camera_id} closed (idle)")
+                    return
+            try:
+                with requests.get(self.stream_url, stream=True, timeout=(5, 10)) as response:
+                    response.raise_for_status()
+                    print(f"Camera relay connected to {self.stream_url}")
+                    backoff = 1
+                    for frame in iter_jpeg_frames(response.iter_content(chunk_size=8192)):
+                        self._publish(frame)
+                        if self._idle():
+                            break
+            except Exception as e:
+                print(f"Camera relay error for {self.camera_id}: {e}")
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 30)
+
+
+class RelayHub:
+    """One CameraRelay per camera"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = threading.Lock()
+            cls._instance.relays = {}
+            cls._instance.max_viewer_fps = 15
+            cls._instance.detection_fps = 30
+            cls._instance.idle_timeout = 30
+            cls._instance.stall_timeout = 15
+        return cls._instance
+
+    def configure(self, config):
+        self.max_viewer_fps = config.get('CAMERA_RELAY_MAX_FPS', self.max_viewer_fps)
+        self.detection_fps = config.get('CAMERA_DETECTION_FPS', self.detection_fps)
+        self.idle_timeout = config.get('CAMERA_RELAY_IDLE_TIMEOUT', self.idle_timeout)
+        self.stall_timeout = config.get('CAMERA_RELAY_STALL_TIMEOUT', self.stall_timeout)
+
+    def relay_for(self, camera):
+        with self.lock:
+            relay = self.relays.get(camera.camera_id)
+            if relay is None or relay.stream_url != camera.stream_url:
+                relay = CameraRelay(camera.camera_id, camera.stream_url, self.idle_timeout)
+                self.relays[camera.camera_id] = relay
+            return relay
+
+    def latest(self, camera, max_age):
+        """Newest relayed frame for a camera, without opening a connection"""
+        relay = self.relays.get(camera.camera_id)
+        return relay.latest(max_age) if relay else None
+
+    def viewer_fps(self, requested=None):
+        """Frame rate for a browser viewer, capped at CAMERA_RELAY_MAX_FPS"""
+        if not requested or requested <= 0:
+            return self.max_viewer_fps
+        return min(requested, self.max_viewer_fps)
+
+
+# Global relay registry
+relay_hub = RelayHub()
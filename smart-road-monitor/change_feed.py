@@ -0,0 +1,196 @@
+"""Push report and detection changes to websocket clients as they happen.
+
+Each watched collection is followed with a MongoDB change stream, which also
+sees writes made by other processes (including p2pl). Where change streams
+are unavailable (standalone server, time-series collections) the feed falls
+back to the in-process event bus the models publish to. Only the changed
+document is pushed; statistics are re-sent at most once per
+CHANGE_FEED_STATS_INTERVAL seconds and only after a change.
+
+With several web processes every process follows the change streams, so
+stream events are pushed to local clients only; local bus events (this
+process's own writes) go through the Socket.IO message queue to all.
+"""
+import threading
+import time
+from datetime import datetime
+
+from pymongo.errors import OperationFailure, PyMongoError
+
+from broadcaster import broadcaster
+from event_bus import event_bus
+from models import MongoDB, RoadReport, CameraDetection
+
+WATCHED_OPERATIONS = ['insert', 'update', 'replace', 'delete']
+
+
+def live_statistics_payload():
+    """Statistics message sent to clients (served from memory)"""
+    from stats_service import statistics_service
+    stats = statistics_service.get()
+    return {
+        'total_reports': stats.get('total_reports', 0),
+        'pending_reports': stats.get('pending_reports', 0),
+        'resolved_today': stats.get('resolved_reports', 0),
+        'ai_detections': stats.get('ai_detections', 0),
+        'updated_at': datetime.utcnow().isoformat()
+    }
+
+
+def detection_payload(detection):
+    return {
+        'type': detection.detections[0]['type'] if detection.detections else 'unknown',
+        'confidence': detection.confidence,
+        'timestamp': detection.timestamp.isoformat() if detection.timestamp else None,
+        'location': detection.location
+    }
+
+
+class ChangeFeed:
+    """Turn data changes into websocket pushes"""
+    _instance = None
+    collections = ('road_reports', 'camera_detections')
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = threading.Lock()
+            cls._instance.streaming = set()
+            cls._instance.resume_tokens = {}
+            cls._instance.stats_interval = 1.0
+            cls._instance.last_stats_push = 0
+            cls._instance.stats_timer = None
+            cls._instance.started = False
+        return cls._instance
+
+    def configure(self, config):
+        self.stats_interval = config.get('CHANGE_FEED_STATS_INTERVAL', self.stats_interval)
+
+    def start(self):
+        """Subscribe to local events and start a change stream per collection"""
+        if self.started:
+            return
+        self.started = True
+        for collection in self.collections:
+            event_bus.subscribe(collection, lambda event, c=collection: self._local_event(c, event))
+            threading.Thread(target=self._watch, args=(collection,), daemon=True).start()
+
+    def _local_event(self, collection, event):
+        # A live change stream already delivers this write (and everyone else's)
+        if collection in self.streaming:
+            return
+        self.dispatch(collection, event)
+
+    def _watch(self, collection):
+        backoff = 1
+        while True:
+            db = MongoDB().get_db()
+            if db is None:
+                time.sleep(backoff)
+                backoff = min(backoff * 2, 60)
+                continue
+
+            opened = False
+            try:
+                options = {'full_document': 'updateLookup'}
+                if collection in self.resume_tokens:
+                    options['resume_after'] = self.resume_tokens[collection]
+                pipeline = [{'$match': {'operationType': {'$in': WATCHED_OPERATIONS}}}]
+
+                with db[collection].watch(pipeline, **options) as stream:
+                    opened = True
+                    self.streaming.add(collection)
+                    print(f"Change stream started on {collection}")
+                    backoff = 1
+                    for change in stream:
+                        self.resume_tokens[collection] = stream.resume_token
+                        event = self._event_from_change(change)
+                        # In-process caches (report index) follow other processes' writes too
+                        event_bus.publish(f"{collection}.stream", event)
+                        self.dispatch(collection, event, local=True)
+            except OperationFailure as e:
+                self.streaming.discard(collection)
+                if not opened:
+                    # Not a replica set, or a collection type without change streams
+                    print(f"Change streams unavailable for {collection}, using local events: {e}")
+                    return
+                print(f"Change stream on {collection} failed, reopening: {e}")
+                self.resume_tokens.pop(collection, None)
+            except PyMongoError as e:
+                self.streaming.discard(collection)
+                print(f"Change stream on {collection} interrupted: {e}")
+
+            time.sleep(backoff)
+            backoff = min(backoff * 2, 60)
+
+    def _event_from_change(self, change):
+        return {
+            'op': change['operationType'],
+            'document': change.get('fullDocument'),
+            'id': change.get('documentKey', {}).get('_id')
+        }
+
+    def dispatch(self, collection, event, local=False):
+        """Push one change to the connected clients (of this process only if local)"""
+        from websocket_handler import broadcast_map_update
+
+        op = event.get('op')
+        document = event.get('document')
+
+        if collection == 'road_reports':
+            if op == 'delete' or document is None:
+                # The deleted document's location is unknown, so tell everyone
+                report_id = event.get('id') or (document or {}).get('_id')
+                broadcast_map_update('report_removed', {'id': str(report_id) if report_id else None}, local=local)
+            elif op == 'insert' and document.get('import_batch'):
+                # Bulk imports send one reports_imported message instead
+                pass
+            else:
+                # Routed to the grid cells containing the report
+                report = RoadReport.from_doc(document)
+                broadcast_map_update(
+                    'new_report' if op == 'insert' else 'report_updated',
+                    report.to_json(),
+                    report.location,
+                    local=local
+                )
+        elif collection == 'camera_detections' and op == 'insert' and document:
+            broadcaster.publish('recent_detections', {
+                'detections': [detection_payload(CameraDetection.from_doc(document))]
+            }, local=local)
+
+        self._schedule_stats_push()
+
+    def _schedule_stats_push(self):
+        """Send statistics now, or once at the end of the current interval"""
+        with self.lock:
+            now = time.time()
+            wait = self.last_stats_push + self.stats_interval - now
+            if wait <= 0:
+                self.last_stats_push = now
+            elif self.stats_timer is None:
+                self.stats_timer = threading.Timer(wait, self._delayed_stats_push)
+                self.stats_timer.daemon = True
+                self.stats_timer.start()
+                return
+            else:
+                return
+        self._push_stats()
+
+    def _delayed_stats_push(self):
+        with self.lock:
+            self.stats_timer = None
+            self.last_stats_push = time.time()
+        self._push_stats()
+
+    def _push_stats(self):
+        from websocket_handler import socketio
+        try:
+            # Every process pushes its own statistics to its own clients
+            socketio.emit('live_statistics', live_statistics_payload(), ignore_queue=True)
+        except Exception as e:
+            print(f"Statistics push error: {e}")
+
+
+# Global change feed
+change_feed = ChangeFeed()
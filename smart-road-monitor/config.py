@@ -17,11 +17,29 @@ class Config:
     # MongoDB Database Name
     MONGO_DBNAME = 'smart_roads'
     
+    # MongoDB connection pool, shared by Flask views, Socket.IO handlers and camera threads
+    MONGO_MAX_POOL_SIZE = int(os.environ.get('MONGO_MAX_POOL_SIZE', 100))
+    MONGO_MIN_POOL_SIZE = int(os.environ.get('MONGO_MIN_POOL_SIZE', 5))
+    MONGO_MAX_IDLE_TIME_MS = 300000
+    MONGO_WAIT_QUEUE_TIMEOUT_MS = int(os.environ.get('MONGO_WAIT_QUEUE_TIMEOUT_MS', 2000))
+    MONGO_SERVER_SELECTION_TIMEOUT_MS = 5000
+    MONGO_COMPRESSORS = os.environ.get('MONGO_COMPRESSORS', 'zstd,snappy,zlib')
+    MONGO_APP_NAME = 'smart-road-monitor'
+    # Read preference for list/export/statistics queries. primary keeps
+    # read-your-writes (a report listed right after it is submitted); set
+    # secondaryPreferred only where those reads may lag behind writes
+    MONGO_LIST_READ_PREFERENCE = os.environ.get('MONGO_LIST_READ_PREFERENCE', 'primary')
+    
     # File upload configuration
     MAX_CONTENT_LENGTH = 10 * 1024 * 1024  # 10MB max file size
     UPLOAD_FOLDER = os.path.join(basedir, 'uploads')
     ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif', 'mp4', 'avi'}
     
+    # Bulk report import/export
+    BULK_IMPORT_CHUNK_SIZE = 1000  # reports per insert_many
+    BULK_IMPORT_MAX_BYTES = 1024 * 1024 * 1024  # 1GB, separate from MAX_CONTENT_LENGTH
+    EXPORT_BATCH_SIZE = 2000  # cursor batch size when streaming exports
+    
     # Session configuration
     PERMANENT_SESSION_LIFETIME = timedelta(days=7)
     SESSION_TYPE = 'filesystem'
@@ -37,13 +55,108 @@ class Config:
     ESP32_STREAM_URL = f"http://{ESP32_CAM_IP}:{ESP32_CAM_PORT}/stream"
     ESP32_SNAPSHOT_URL = f"http://{ESP32_CAM_IP}:{ESP32_CAM_PORT}/capture"
     
+    # Camera relay: one upstream stream per camera shared by all viewers
+    CAMERA_RELAY_MAX_FPS = 15  # per browser viewer
+    CAMERA_DETECTION_FPS = 30  # frames per second fed to the detector
+    CAMERA_RELAY_IDLE_TIMEOUT = 30  # seconds without consumers before disconnecting
+    CAMERA_RELAY_STALL_TIMEOUT = 15  # seconds without frames before ending a viewer stream
+    
     # AI Model Configuration
     MODEL_PATH = os.path.join(basedir, 'ml_models', 'road_defect_model.h5')
     MODEL_CLASSES = ['pothole', 'crack', 'speed_hump', 'normal_road', 'debris', 'flooding']
     CONFIDENCE_THRESHOLD = 0.7
     
     # WebSocket Configuration
-    SOCKETIO_MESSAGE_QUEUE = os.environ.get('REDIS_URL', 'redis://localhost:6379/0')
+    # Message queue shared by all web processes (e.g. redis://localhost:6379/0);
+    # unset runs a single process with in-memory presence
+    SOCKETIO_MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE') or os.environ.get('REDIS_URL')
+    PRESENCE_TTL = 60  # seconds before sockets of a dead process are forgotten
+    NOTIFICATION_RETENTION_DAYS = 30  # unacknowledged notifications kept for offline users
+    
+    # Map update rooms: Web Mercator tile zoom levels and max cells joined per viewport
+    MAP_ROOM_ZOOMS = (10, 12, 14)
+    MAP_ROOM_MAX_CELLS = 16
+    
+    # Broadcast coalescing: batch window (seconds), max messages per batch and
+    # per-client send queue length beyond which a client is skipped
+    BROADCAST_WINDOW = 0.25
+    BROADCAST_MAX_BATCH = 100
+    BROADCAST_MAX_CLIENT_QUEUE = 64
+    
+    # Worker pool for MongoDB calls made from Socket.IO handlers/background tasks
+    ASYNC_DB_WORKERS = int(os.environ.get('ASYNC_DB_WORKERS', 16))
+    ASYNC_DB_TIMEOUT = 10  # seconds a background task waits for a result
+    
+    # Minimum seconds between live_statistics pushes triggered by data changes
+    CHANGE_FEED_STATS_INTERVAL = 1.0
+    
+    # Statistics: read cache lifetime, statistics upsert and DB reconcile schedule (seconds)
+    STATS_CACHE_TTL = 5
+    STATS_FLUSH_INTERVAL = 60
+    STATS_RECONCILE_INTERVAL = 300
+    
+    # Camera detections: raw time-series retention and hourly grid rollups
+    DETECTION_RETENTION_DAYS = int(os.environ.get('DETECTION_RETENTION_DAYS', 30))
+    DETECTION_ROLLUP_AFTER_HOURS = 24
+    DETECTION_ROLLUP_INTERVAL = 3600  # seconds
+    DETECTION_GRID_DEG = 0.01  # ~1 km grid cells
+    DETECTION_SUMMARY_RETENTION_DAYS = 365
+    
+    # In-memory index of open reports: grid cell size and MongoDB consistency check interval
+    REPORT_INDEX_CELL_DEG = 0.01
+    REPORT_INDEX_CHECK_INTERVAL = 300  # seconds
+    
+    # Map clusters: cell size in screen pixels (same size at every zoom)
+    REPORT_CLUSTER_CELL_PX = 60
+    
+    # Incidents: new reports of the same issue type within this radius and
+    # time since the last report are merged into one incident; images kept per
+    # incident, the confidence given to citizen reports and how often a merge
+    # that lost a race with a concurrent submission is retried
+    INCIDENT_RADIUS_M = 30
+    INCIDENT_WINDOW_HOURS = 720
+    INCIDENT_MAX_IMAGES = 20
+    INCIDENT_CITIZEN_CONFIDENCE = 0.5
+    INCIDENT_MERGE_ATTEMPTS = 5
+    
+    # Reverse geocoding of reports without an address (geocoding.py): backend
+    # ('gazetteer', 'nominatim' or 'none'; 'gazetteer' by default only when a
+    # gazetteer CSV is configured), optional gazetteer CSV, coordinate
+    # rounding for cache keys, in-process LRU size, persistent cache lifetime,
+    # worker batch size / poll interval and hours before a failed lookup retries
+    GEOCODER_GAZETTEER_PATH = os.environ.get('GEOCODER_GAZETTEER_PATH')
+    GEOCODER_BACKEND = os.environ.get('GEOCODER_BACKEND', 'gazetteer' if GEOCODER_GAZETTEER_PATH else 'none')
+    GEOCODER_GAZETTEER_MAX_DISTANCE = 5000  # metres
+    GEOCODER_USER_AGENT = os.environ.get('GEOCODER_USER_AGENT', 'smart-road-monitor')
+    GEOCODER_PRECISION = 4  # decimals, about 11 m
+    GEOCODER_CACHE_SIZE = 10000
+    GEOCODE_CACHE_DAYS = 180
+    GEOCODER_BATCH_SIZE = 100
+    GEOCODER_INTERVAL = 60  # seconds
+    GEOCODER_RETRY_HOURS = 24
+    
+    # Most reports returned by one bbox query (REST and map subscriptions)
+    MAP_QUERY_MAX_RESULTS = 1000
+    
+    # Precomputed heatmaps (heatmaps.py): grid resolutions in degrees (about
+    # 11 km, 1.1 km and 110 m), rebuild interval, days rebuilt on every pass
+    # (keep below DETECTION_RETENTION_DAYS), and read limits for /api/heatmap
+    HEATMAP_CELL_DEG = (0.1, 0.01, 0.001)
+    HEATMAP_INTERVAL = 900  # seconds
+    HEATMAP_REBUILD_DAYS = 7
+    HEATMAP_MAX_CELLS = 10000
+    HEATMAP_MAX_DAYS = 366
+    HEATMAP_LEASE_SECONDS = 1800  # one process builds at a time; must outlast one resolution's rebuild
+    
+    # Report tiles (/tiles/reports/z/x/y): deepest zoom served, zoom from which
+    # tiles list single reports instead of clusters, cluster cell size (divides
+    # 256), in-memory cache size and lifetime, and HTTP max-age for browsers/CDN
+    TILE_MAX_ZOOM = 20
+    TILE_POINTS_MIN_ZOOM = 15
+    TILE_CLUSTER_CELL_PX = 64
+    TILE_CACHE_MAX_TILES = 5000
+    TILE_CACHE_TTL = 300  # seconds
+    TILE_HTTP_MAX_AGE = 30  # seconds
     
     # GPS Configuration
     GPS_SIMULATION = os.environ.get('GPS_SIMULATION', 'true').lower() == 'true'
@@ -0,0 +1,137 @@
+"""MongoDB client factory and connection pool metrics.
+
+Every part of the app (Flask views, Socket.IO handlers, camera threads,
+background workers and the command line tools) shares the one pool built
+here, sized from the MONGO_* settings in config.py.
+"""
+import threading
+import time
+
+from pymongo import MongoClient, ReadPreference
+from pymongo.monitoring import ConnectionPoolListener
+
+READ_PREFERENCES = {
+    'primary': ReadPreference.PRIMARY,
+    'primaryPreferred': ReadPreference.PRIMARY_PREFERRED,
+    'secondary': ReadPreference.SECONDARY,
+    'secondaryPreferred': ReadPreference.SECONDARY_PREFERRED,
+    'nearest': ReadPreference.NEAREST,
+}
+
+
+class PoolMetrics(ConnectionPoolListener):
+    """Count connection pool events to show how busy the pool is"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.local = threading.local()
+        self.pools = 0
+        self.connections_open = 0
+        self.connections_created = 0
+        self.connections_closed = 0
+        self.checked_out = 0
+        self.max_checked_out = 0
+        self.checkouts = 0
+        self.checkout_failures = 0
+        self.checkout_wait_total = 0.0
+        self.checkout_wait_max = 0.0
+        self.pool_clears = 0
+
+    def snapshot(self, max_pool_size=None):
+        with self.lock:
+            stats = {
+                'pools': self.pools,
+                'connections_open': self.connections_open,
+                'connections_created': self.connections_created,
+                'connections_closed': self.connections_closed,
+                'checked_out': self.checked_out,
+                'max_checked_out': self.max_checked_out,
+                'checkouts': self.checkouts,
+                'checkout_failures': self.checkout_failures,
+                'avg_checkout_wait_ms': (self.checkout_wait_total / self.checkouts * 1000) if self.checkouts else 0.0,
+                'max_checkout_wait_ms': self.checkout_wait_max * 1000,
+                'pool_clears': self.pool_clears
+            }
+        if max_pool_size:
+            # Per server pool: busy connections relative to the configured cap
+            stats['utilization'] = stats['checked_out'] / (max_pool_size * max(stats['pools'], 1))
+        return stats
+
+    def _finish_wait(self):
+        started = getattr(self.local, 'checkout_started', None)
+        self.local.checkout_started = None
+        return time.perf_counter() - started if started is not None else 0.0
+
+    def pool_created(self, event):
+        with self.lock:
+            self.pools += 1
+
+    def pool_ready(self, event):
+        pass
+
+    def pool_cleared(self, event):
+        with self.lock:
+            self.pool_clears += 1
+
+    def pool_closed(self, event):
+        with self.lock:
+            self.pools = max(self.pools - 1, 0)
+
+    def connection_created(self, event):
+        with self.lock:
+            self.connections_created += 1
+            self.connections_open += 1
+
+    def connection_ready(self, event):
+        pass
+
+    def connection_closed(self, event):
+        with self.lock:
+            self.connections_closed += 1
+            self.connections_open = max(self.connections_open - 1, 0)
+
+    def connection_check_out_started(self, event):
+        self.local.checkout_started = time.perf_counter()
+
+    def connection_check_out_failed(self, event):
+        self._finish_wait()
+        with self.lock:
+            self.checkout_failures += 1
+
+    def connection_checked_out(self, event):
+        waited = self._finish_wait()
+        with self.lock:
+            self.checkouts += 1
+            self.checked_out += 1
+            self.max_checked_out = max(self.max_checked_out, self.checked_out)
+            self.checkout_wait_total += waited
+            self.checkout_wait_max = max(self.checkout_wait_max, waited)
+
+    def connection_checked_in(self, event):
+        with self.lock:
+            self.checked_out = max(self.checked_out - 1, 0)
+
+
+def create_client(config, metrics=None):
+    """Build the MongoClient from a config mapping (app.config or vars(Config))"""
+    compressors = [name.strip() for name in config.get('MONGO_COMPRESSORS', '').split(',') if name.strip()]
+    options = {
+        'maxPoolSize': config.get('MONGO_MAX_POOL_SIZE', 100),
+        'minPoolSize': config.get('MONGO_MIN_POOL_SIZE', 0),
+        'maxIdleTimeMS': config.get('MONGO_MAX_IDLE_TIME_MS'),
+        'waitQueueTimeoutMS': config.get('MONGO_WAIT_QUEUE_TIMEOUT_MS'),
+        'serverSelectionTimeoutMS': config.get('MONGO_SERVER_SELECTION_TIMEOUT_MS', 5000),
+        'appname': config.get('MONGO_APP_NAME'),
+    }
+    if compressors:
+        # pymongo drops (with a warning) any compressor whose library is missing
+        options['compressors'] = compressors
+    if metrics is not None:
+        options['event_listeners'] = [metrics]
+    options = {key: value for key, value in options.items() if value is not None}
+    return MongoClient(config['MONGO_URI'], **options)
+
+
+def read_preference(name):
+    """Map a read preference name from config to a pymongo read preference"""
+    return READ_PREFERENCES.get(name or 'primary', ReadPreference.PRIMARY)
@@ -0,0 +1,288 @@
+"""Time-series storage, retention and rollup for camera detections.
+
+camera_detections is a MongoDB time-series collection (timeField=timestamp,
+metaField=camera_id) whose raw documents expire after
+DETECTION_RETENTION_DAYS. Before they expire, a periodic job rolls them up
+into detection_summaries: one document per camera, hour and grid cell with
+counts per defect type and confidence figures.
+
+    python detection_store.py migrate   # convert an existing plain collection
+    python detection_store.py rollup    # run one rollup pass now
+"""
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo.errors import BulkWriteError
+
+from geo_grid import point_from_location
+
+DETECTIONS = 'camera_detections'
+SUMMARIES = 'detection_summaries'
+ROLLUP_STATE = 'detection_rollup_state'
+
+
+def _floor_hour(value):
+    return value.replace(minute=0, second=0, microsecond=0)
+
+
+def _collection_info(db, name):
+    return next(iter(db.list_collections(filter={'name': name})), None)
+
+
+def create_timeseries(db, retention_seconds, name=DETECTIONS):
+    db.create_collection(
+        name,
+        timeseries={'timeField': 'timestamp', 'metaField': 'camera_id', 'granularity': 'seconds'},
+        expireAfterSeconds=retention_seconds
+    )
+
+
+def ensure_detection_collection(db, retention_seconds):
+    """Create camera_detections as a time-series collection and keep its TTL in sync
+
+    Returns 'created', 'timeseries' or 'legacy' (a plain collection that still
+    needs `python detection_store.py migrate`).
+    """
+    info = _collection_info(db, DETECTIONS)
+    if info is None:
+        create_timeseries(db, retention_seconds)
+        return 'created'
+
+    if info.get('type') != 'timeseries':
+        print(f"Warning: {DETECTIONS} is a plain collection; run 'python detection_store.py migrate'")
+        return 'legacy'
+
+    if info.get('options', {}).get('expireAfterSeconds') != retention_seconds:
+        db.command('collMod', DETECTIONS, expireAfterSeconds=retention_seconds)
+    return 'timeseries'
+
+
+def _legacy_detection(doc):
+    """A plain-collection detection in the current shape: GeoJSON location, raw GPS in gps"""
+    location = doc.get('location')
+    if location and location.get('type') != 'Point':
+        doc.setdefault('gps', location)
+        point = point_from_location(location)
+        if point is None:
+            doc.pop('location')
+        else:
+            doc['location'] = {'type': 'Point', 'coordinates': [point[0], point[1]]}
+    return doc
+
+
+def _insert_batch(collection, batch):
+    """Insert a batch, returning (inserted, rejected) instead of stopping at bad documents"""
+    try:
+        collection.insert_many(batch, ordered=False)
+        return len(batch), 0
+    except BulkWriteError as e:
+        errors = e.details.get('writeErrors', [])
+        for error in errors[:5]:
+            print(f"Rejected detection {batch[error['index']].get('_id')}: {error.get('errmsg')}")
+        return e.details.get('nInserted', len(batch) - len(errors)), len(errors)
+
+
+def migrate_to_timeseries(db, retention_seconds, batch_size=5000):
+    """Move a plain camera_detections collection into a new time-series one"""
+    info = _collection_info(db, DETECTIONS)
+    if info is None or info.get('type') == 'timeseries':
+        ensure_detection_collection(db, retention_seconds)
+        return 0
+
+    legacy = f"{DETECTIONS}_legacy"
+    db[DETECTIONS].rename(legacy)
+    create_timeseries(db, retention_seconds)
+
+    moved = 0
+    rejected = 0
+    batch = []
+    # Time-series documents must carry a date in the timeField
+    for doc in db[legacy].find({'timestamp': {'$type': 'date'}}).batch_size(batch_size):
+        # Old detections kept the raw GPS dict in location, which the 2dsphere index rejects
+        batch.append(_legacy_detection(doc))
+        if len(batch) >= batch_size:
+            inserted, failed = _insert_batch(db[DETECTIONS], batch)
+            moved += inserted
+            rejected += failed
+            batch = []
+    if batch:
+        inserted, failed = _insert_batch(db[DETECTIONS], batch)
+        moved += inserted
+        rejected += failed
+
+    print(f"Migrated {moved} detections ({rejected} rejected); the old data is kept in {legacy}")
+    return moved
+
+
+def rollup_pipeline(start, end, cell_size):
+    """Aggregate raw detections in [start, end) into hourly per-cell summaries"""
+    cell = lambda index: {'$ifNull': [
+        {'$floor': {'$divide': [{'$arrayElemAt': ['$location.coordinates', index]}, cell_size]}},
+        'none'
+    ]}
+    is_number = {'$cond': [{'$isNumber': '$confidence'}, 1, 0]}
+
+    return [
+        {'$match': {'timestamp': {'$gte': start, '$lt': end}}},
+        {'$group': {
+            '_id': {
+                'camera_id': '$camera_id',
+                'hour': {'$dateTrunc': {'date': '$timestamp', 'unit': 'hour'}},
+                'cell_x': cell(0),
+                'cell_y': cell(1),
+                'type': {'$ifNull': [{'$arrayElemAt': ['$detections.type', 0]}, 'unknown']}
+            },
+            'count': {'$sum': 1},
+            'confidence_sum': {'$sum': '$confidence'},
+            'confidence_n': {'$sum': is_number},
+            'max_confidence': {'$max': '$confidence'}
+        }},
+        {'$group': {
+            '_id': {
+                'camera_id': '$_id.camera_id',
+                'hour': '$_id.hour',
+                'cell_x': '$_id.cell_x',
+                'cell_y': '$_id.cell_y'
+            },
+            'count': {'$sum': '$count'},
+            'by_type': {'$push': {'k': '$_id.type', 'v': '$count'}},
+            'confidence_sum': {'$sum': '$confidence_sum'},
+            'confidence_n': {'$sum': '$confidence_n'},
+            'max_confidence': {'$max': '$max_confidence'}
+        }},
+        {'$project': {
+            '_id': 0,
+            'camera_id': {'$ifNull': ['$_id.camera_id', 'unknown']},
+            'hour': '$_id.hour',
+            'cell_x': '$_id.cell_x',
+            'cell_y': '$_id.cell_y',
+            'cell_size': {'$literal': cell_size},
+            'count': 1,
+            'by_type': {'$arrayToObject': '$by_type'},
+            'avg_confidence': {'$cond': [
+                {'$gt': ['$confidence_n', 0]},
+                {'$divide': ['$confidence_sum', '$confidence_n']},
+                None
+            ]},
+            'max_confidence': 1
+        }},
+        {'$merge': {
+            'into': SUMMARIES,
+            'on': ['camera_id', 'hour', 'cell_x', 'cell_y'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }}
+    ]
+
+
+def rollup_detections(db, rollup_after_seconds, cell_size):
+    """Roll up every complete hour older than rollup_after_seconds not yet summarised
+
+    Hours are processed exactly once (tracked in detection_rollup_state), so the
+    summaries are final and raw detections can expire behind them.
+    """
+    cutoff = _floor_hour(datetime.utcnow() - timedelta(seconds=rollup_after_seconds))
+    state = db[ROLLUP_STATE].find_one({'_id': DETECTIONS})
+    start = state.get('rolled_up_to') if state else None
+
+    if start is None:
+        oldest = db[DETECTIONS].find_one({}, sort=[('timestamp', 1)], projection={'timestamp': 1})
+        if oldest is None:
+            return None
+        start = _floor_hour(oldest['timestamp'])
+
+    if start >= cutoff:
+        return None
+
+    db[DETECTIONS].aggregate(rollup_pipeline(start, cutoff, cell_size))
+    db[ROLLUP_STATE].update_one(
+        {'_id': DETECTIONS},
+        {'$set': {'rolled_up_to': cutoff, 'updated_at': datetime.utcnow()}},
+        upsert=True
+    )
+    return start, cutoff
+
+
+class DetectionStore:
+    """Run the detection rollup on a schedule"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.retention_seconds = 30 * 86400
+            cls._instance.rollup_after_seconds = 86400
+            cls._instance.rollup_interval = 3600
+            cls._instance.cell_size = 0.01
+            cls._instance.worker = None
+        return cls._instance
+
+    def configure(self, config):
+        """Read retention/rollup settings from the Flask config"""
+        self.retention_seconds = int(config.get('DETECTION_RETENTION_DAYS', 30) * 86400)
+        self.rollup_after_seconds = int(config.get('DETECTION_ROLLUP_AFTER_HOURS', 24) * 3600)
+        self.rollup_interval = config.get('DETECTION_ROLLUP_INTERVAL', self.rollup_interval)
+        self.cell_size = config.get('DETECTION_GRID_DEG', self.cell_size)
+
+    def ensure_collection(self, db):
+        try:
+            return ensure_detection_collection(db, self.retention_seconds)
+        except Exception as e:
+            print(f"Error preparing {DETECTIONS}: {e}")
+            return None
+
+    def rollup(self):
+        from models import MongoDB
+        db = MongoDB().db
+        if db is None:
+            return None
+        try:
+            window = rollup_detections(db, self.rollup_after_seconds, self.cell_size)
+            if window:
+                print(f"Detections rolled up from {window[0]} to {window[1]}")
+            return window
+        except Exception as e:
+            print(f"Detection rollup error: {e}")
+            return None
+
+    def start(self):
+        """Start the periodic rollup worker"""
+        if self.worker is not None:
+            return
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
+
+    def _worker(self):
+        while True:
+            self.rollup()
+            time.sleep(self.rollup_interval)
+
+
+# Global detection store
+detection_store = DetectionStore()
+
+
+def main(argv):
+    from db_client import create_client
+    from config import Config
+
+    command = argv[1] if len(argv) > 1 else 'rollup'
+    db = create_client(vars(Config))[Config.MONGO_DBNAME]
+    detection_store.configure(vars(Config))
+
+    if command == 'migrate':
+        migrate_to_timeseries(db, detection_store.retention_seconds)
+        return 0
+    if command == 'rollup':
+        window = rollup_detections(db, detection_store.rollup_after_seconds, detection_store.cell_size)
+        print(f"Rolled up {window[0]} - {window[1]}" if window else "Nothing to roll up")
+        return 0
+
+    print(f"Usage: python {argv[0]} [migrate|rollup]")
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,41 @@
+import threading
+
+
+class EventBus:
+    """In-process publish/subscribe for data change events
+
+    Models publish {'op', 'document', ...} events per collection after every
+    write; subscribers (the change feed, caches) react without polling.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = threading.Lock()
+            cls._instance.subscribers = {}
+        return cls._instance
+
+    def subscribe(self, topic, handler):
+        with self.lock:
+            handlers = list(self.subscribers.get(topic, ()))
+            if handler not in handlers:
+                handlers.append(handler)
+            self.subscribers[topic] = handlers
+
+    def unsubscribe(self, topic, handler):
+        with self.lock:
+            handlers = [h for h in self.subscribers.get(topic, ()) if h is not handler]
+            self.subscribers[topic] = handlers
+
+    def publish(self, topic, event):
+        # Handlers list is replaced on (un)subscribe, so iterate without the lock
+        for handler in self.subscribers.get(topic, ()):
+            try:
+                handler(event)
+            except Exception as e:
+                print(f"Event handler error on {topic}: {e}")
+
+
+# Global event bus
+event_bus = EventBus()
@@ -0,0 +1,94 @@
+"""Fixed map grid based on Web Mercator (slippy map) tiles.
+
+Viewport subscriptions join the tiles covering the visible area and map
+updates are sent to the tiles containing the changed report, so fan-out
+follows local interest instead of total connections.
+"""
+import math
+
+MAX_LATITUDE = 85.05112878
+
+# Room name for clients that want every map update (dashboards, zoomed-out views)
+ALL_MAP_ROOM = 'map:all'
+
+
+def lonlat_to_tile(lon, lat, zoom):
+    """Return the (x, y) tile containing a point at the given zoom"""
+    lat = max(-MAX_LATITUDE, min(MAX_LATITUDE, lat))
+    n = 1 << zoom
+    x = int((lon + 180.0) / 360.0 * n)
+    lat_rad = math.radians(lat)
+    y = int((1.0 - math.asinh(math.tan(lat_rad)) / math.pi) / 2.0 * n)
+    return min(max(x, 0), n - 1), min(max(y, 0), n - 1)
+
+
+def tile_bounds(zoom, x, y):
+    """Return (west, south, east, north) of a tile in degrees"""
+    n = 1 << zoom
+    west = x / n * 360.0 - 180.0
+    east = (x + 1) / n * 360.0 - 180.0
+    north = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * y / n))))
+    south = math.degrees(math.atan(math.sinh(math.pi * (1 - 2 * (y + 1) / n))))
+    return west, south, east, north
+
+
+def _tile_ranges(west, south, east, north, zoom):
+    """Tile x/y ranges covering a bbox, split in two across the antimeridian"""
+    x0, y0 = lonlat_to_tile(west, north, zoom)
+    x1, y1 = lonlat_to_tile(east, south, zoom)
+    if west <= east:
+        return [(range(x0, x1 + 1), range(y0, y1 + 1))]
+    n = 1 << zoom
+    return [(range(x0, n), range(y0, y1 + 1)), (range(0, x1 + 1), range(y0, y1 + 1))]
+
+
+def count_tiles(west, south, east, north, zoom):
+    return sum(len(xs) * len(ys) for xs, ys in _tile_ranges(west, south, east, north, zoom))
+
+
+def tiles_for_bbox(west, south, east, north, zoom):
+    """List every (zoom, x, y) tile intersecting a bbox"""
+    return [
+        (zoom, x, y)
+        for xs, ys in _tile_ranges(west, south, east, north, zoom)
+        for x in xs
+        for y in ys
+    ]
+
+
+def room_name(zoom, x, y):
+    return f"map:{zoom}/{x}/{y}"
+
+
+def covering_rooms(bounds, zooms, max_cells):
+    """Rooms covering a viewport {north, south, east, west}
+
+    Uses the finest zoom in `zooms` that needs at most max_cells tiles; a
+    viewport too large even for the coarsest zoom gets ALL_MAP_ROOM.
+    """
+    west, south, east, north = bounds['west'], bounds['south'], bounds['east'], bounds['north']
+    for zoom in sorted(zooms, reverse=True):
+        if count_tiles(west, south, east, north, zoom) <= max_cells:
+            return [room_name(*tile) for tile in tiles_for_bbox(west, south, east, north, zoom)]
+    return [ALL_MAP_ROOM]
+
+
+def rooms_for_point(lon, lat, zooms):
+    """The room at every zoom level containing a point, plus ALL_MAP_ROOM"""
+    rooms = [room_name(zoom, *lonlat_to_tile(lon, lat, zoom)) for zoom in zooms]
+    rooms.append(ALL_MAP_ROOM)
+    return rooms
+
+
+def point_from_location(location):
+    """(lon, lat) from a GeoJSON point or a {latitude, longitude} GPS dict"""
+    if not location:
+        return None
+    if location.get('type') == 'Point':
+        coordinates = location.get('coordinates') or []
+        if len(coordinates) >= 2:
+            return coordinates[0], coordinates[1]
+        return None
+    if location.get('longitude') is not None and location.get('latitude') is not None:
+        return location['longitude'], location['latitude']
+    return None
@@ -0,0 +1,135 @@
+"""Vectorized geodesic helpers.
+
+Every function takes NumPy arrays (or anything np.asarray accepts) so one
+call handles a whole batch of reports; scalars work too. Points are (lon,
+lat) in degrees, in GeoJSON order, unless a name says otherwise. Distances
+are metres.
+
+The same module is used by smart-road-monitor and p2pl (kept identical in
+both apps, which are deployed separately).
+"""
+import numpy as np
+
+EARTH_RADIUS = 6371000.0
+METERS_PER_DEGREE = EARTH_RADIUS * np.pi / 180.0
+
+# Pairwise matrices are computed in blocks of about this many cells
+BLOCK_CELLS = 1_000_000
+
+
+def haversine(lat1, lon1, lat2, lon2):
+    """Great-circle distance in metres; arguments broadcast like NumPy arrays"""
+    lat1, lon1, lat2, lon2 = map(np.radians, (lat1, lon1, lat2, lon2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+    distance = 2 * EARTH_RADIUS * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+    return float(distance) if np.ndim(distance) == 0 else distance
+
+
+def as_points(values):
+    """(n, 2) float array of (lon, lat) from pairs or GeoJSON points
+
+    Entries without usable coordinates become NaN rows, so indexes line up
+    with the input.
+    """
+    values = list(values)
+    points = np.full((len(values), 2), np.nan)
+    for index, value in enumerate(values):
+        if isinstance(value, dict):
+            value = value.get('coordinates')
+        if value is not None and len(value) >= 2 and value[0] is not None and value[1] is not None:
+            points[index] = value[0], value[1]
+    return points
+
+
+def pairwise_distances(points, targets):
+    """(len(points), len(targets)) haversine distance matrix"""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    targets = np.asarray(targets, dtype=float).reshape(-1, 2)
+    return haversine(points[:, None, 1], points[:, None, 0], targets[None, :, 1], targets[None, :, 0])
+
+
+def nearest(points, targets, k=1):
+    """Indexes and distances of the k nearest targets for each point
+
+    Returns two (len(points), k) arrays, nearest first. Blocked so memory
+    stays bounded for large inputs.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    targets = np.asarray(targets, dtype=float).reshape(-1, 2)
+    k = min(k, len(targets))
+    indexes = np.empty((len(points), k), dtype=int)
+    distances = np.empty((len(points), k))
+    if k == 0:
+        return indexes, distances
+
+    block = max(BLOCK_CELLS // len(targets), 1)
+    for first in range(0, len(points), block):
+        d = pairwise_distances(points[first:first + block], targets)
+        if k < len(targets):
+            part = np.argpartition(d, k - 1, axis=1)[:, :k]
+        else:
+            part = np.tile(np.arange(len(targets)), (len(d), 1))
+        part_d = np.take_along_axis(d, part, axis=1)
+        order = np.argsort(part_d, axis=1)
+        indexes[first:first + block] = np.take_along_axis(part, order, axis=1)
+        distances[first:first + block] = np.take_along_axis(part_d, order, axis=1)
+    return indexes, distances
+
+
+def within_radius(points, lon, lat, radius_m):
+    """Boolean mask of points within radius_m of (lon, lat)"""
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    return haversine(lat, lon, points[:, 1], points[:, 0]) <= radius_m
+
+
+def bbox_from_radius(lon, lat, radius_m):
+    """(west, south, east, north) enclosing a circle; longitudes may wrap past 180"""
+    dlat = radius_m / METERS_PER_DEGREE
+    widest = min(abs(lat) + dlat, 89.9)
+    dlon = min(float(radius_m / (METERS_PER_DEGREE * np.cos(np.radians(widest)))), 180.0)
+    return lon - dlon, max(lat - dlat, -90.0), lon + dlon, min(lat + dlat, 90.0)
+
+
+def point_to_polyline(points, line):
+    """Distance of each point to a polyline
+
+    Uses a local equirectangular projection per segment, accurate to well
+    under a metre over road-scale distances. Returns (distance, along,
+    segment) arrays: the shortest distance to the line, how far along the
+    line the closest position lies, and the index of its segment.
+    """
+    points = np.asarray(points, dtype=float).reshape(-1, 2)
+    line = np.asarray(line, dtype=float).reshape(-1, 2)
+    if len(line) == 1:
+        line = np.vstack([line, line])
+
+    start, end = line[:-1], line[1:]
+    # Metres per degree of longitude at each segment's latitude
+    scale_x = METERS_PER_DEGREE * np.cos(np.radians((start[:, 1] + end[:, 1]) / 2))
+    seg_x = (end[:, 0] - start[:, 0]) * scale_x
+    seg_y = (end[:, 1] - start[:, 1]) * METERS_PER_DEGREE
+    seg_len2 = seg_x ** 2 + seg_y ** 2
+    seg_len = np.sqrt(seg_len2)
+    line_offset = np.concatenate([[0.0], np.cumsum(seg_len)[:-1]])
+    safe_len2 = np.where(seg_len2 > 0, seg_len2, 1.0)
+
+    distance = np.empty(len(points))
+    along = np.empty(len(points))
+    segment = np.empty(len(points), dtype=int)
+
+    block = max(BLOCK_CELLS // len(start), 1)
+    for first in range(0, len(points), block):
+        chunk = points[first:first + block]
+        # (points, segments) offsets from each segment start, in metres
+        px = (chunk[:, None, 0] - start[None, :, 0]) * scale_x[None, :]
+        py = (chunk[:, None, 1] - start[None, :, 1]) * METERS_PER_DEGREE
+        t = np.clip((px * seg_x + py * seg_y) / safe_len2, 0.0, 1.0)
+        d = np.hypot(px - t * seg_x, py - t * seg_y)
+
+        closest = np.argmin(d, axis=1)
+        rows = np.arange(len(chunk))
+        distance[first:first + block] = d[rows, closest]
+        along[first:first + block] = line_offset[closest] + t[rows, closest] * seg_len[closest]
+        segment[first:first + block] = closest
+
+    return distance, along, segment
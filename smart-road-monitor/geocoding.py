@@ -0,0 +1,281 @@
+"""Reverse geocoding of report locations, off the request path.
+
+Reports are saved with whatever address the client sent (often none). The
+geocoder worker picks up reports that have a location but no address, in
+batches, resolves each distinct rounded position once and stores the
+address (refreshing the report's search terms and announcing the update).
+New reports wake the worker through the event bus, so addresses usually
+appear within seconds without any request waiting on a lookup.
+
+Lookups go through two caches keyed on the backend and on coordinates
+rounded to GEOCODER_PRECISION decimals (4 = about 11 m): an in-process LRU
+and the geocode_cache collection, shared by every process and kept for
+GEOCODE_CACHE_DAYS. Only then is the backend asked:
+
+    gazetteer   nearest place from a local CSV (name,latitude,longitude),
+                or a small built-in list of Chennai localities; offline.
+                Its "Near <place>" answers are stored as address_hint, so
+                a real backend still fills in address later
+    nominatim   OpenStreetMap Nominatim through geopy, at most one request
+                per second as its usage policy requires
+    none        never resolve (the default unless a gazetteer CSV is set)
+
+    python geocoding.py resolve    # resolve every report missing an address
+"""
+import csv
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+import numpy as np
+
+import geo_utils
+from event_bus import event_bus
+
+GEOCODE_CACHE = 'geocode_cache'
+
+# Stand-in gazetteer used when no GEOCODER_GAZETTEER_PATH is configured
+DEFAULT_PLACES = [
+    ('Chennai Central', 13.0827, 80.2707), ('Egmore', 13.0732, 80.2609),
+    ('T Nagar', 13.0418, 80.2341), ('Mylapore', 13.0368, 80.2676),
+    ('Adyar', 13.0012, 80.2565), ('Guindy', 13.0067, 80.2206),
+    ('Velachery', 12.9815, 80.2180), ('Anna Nagar', 13.0850, 80.2101),
+    ('Vadapalani', 13.0500, 80.2121), ('Porur', 13.0382, 80.1565),
+    ('Tambaram', 12.9249, 80.1000), ('Sholinganallur', 12.9010, 80.2279),
+    ('Perungudi', 12.9654, 80.2461), ('Royapuram', 13.1137, 80.2954),
+    ('Ambattur', 13.1143, 80.1548), ('Sriperumbudur', 12.9689, 79.9485),
+]
+
+
+class NullBackend:
+    name = 'none'
+    field = 'address'
+
+    def reverse(self, lat, lon):
+        return None
+
+
+class GazetteerBackend:
+    """Nearest named place from an offline list"""
+    name = 'gazetteer'
+    # Only approximate, so kept apart from addresses
+    field = 'address_hint'
+
+    def __init__(self, path=None, max_distance=5000):
+        places = self.load(path) if path else DEFAULT_PLACES
+        self.names = [name for name, _, _ in places]
+        self.points = np.array([(lon, lat) for _, lat, lon in places], dtype=float).reshape(-1, 2)
+        self.max_distance = max_distance
+
+    @staticmethod
+    def load(path):
+        with open(path, newline='', encoding='utf-8') as f:
+            return [
+                (row['name'], float(row['latitude']), float(row['longitude']))
+                for row in csv.DictReader(f)
+            ]
+
+    def reverse(self, lat, lon):
+        if not self.names:
+            return None
+        indexes, distances = geo_utils.nearest([(lon, lat)], self.points)
+        if distances[0, 0] > self.max_distance:
+            return None
+        return f"Near {self.names[indexes[0, 0]]}"
+
+
+class NominatimBackend:
+    """OpenStreetMap Nominatim via geopy, rate limited to one request per second"""
+    name = 'nominatim'
+    field = 'address'
+
+    def __init__(self, user_agent, timeout=10, min_interval=1.0):
+        from geopy.geocoders import Nominatim
+        self.client = Nominatim(user_agent=user_agent, timeout=timeout)
+        self.min_interval = min_interval
+        self.last_request = 0.0
+        self.lock = threading.Lock()
+
+    def reverse(self, lat, lon):
+        with self.lock:
+            wait = self.last_request + self.min_interval - time.monotonic()
+            if wait > 0:
+                time.sleep(wait)
+            try:
+                location = self.client.reverse((lat, lon), exactly_one=True, language='en')
+            finally:
+                self.last_request = time.monotonic()
+        return location.address if location else None
+
+
+def create_backend(config):
+    name = config.get('GEOCODER_BACKEND') or ('gazetteer' if config.get('GEOCODER_GAZETTEER_PATH') else 'none')
+    if name == 'nominatim':
+        return NominatimBackend(config.get('GEOCODER_USER_AGENT', 'smart-road-monitor'))
+    if name == 'gazetteer':
+        return GazetteerBackend(config.get('GEOCODER_GAZETTEER_PATH'), config.get('GEOCODER_GAZETTEER_MAX_DISTANCE', 5000))
+    return NullBackend()
+
+
+class Geocoder:
+    """Cached reverse geocoding plus the worker filling in report addresses"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.backend = NullBackend()
+            cls._instance.lock = threading.Lock()
+            cls._instance.cache = OrderedDict()  # backend:position key -> address or None
+            cls._instance.cache_size = 10000
+            cls._instance.precision = 4
+            cls._instance.batch_size = 100
+            cls._instance.interval = 60
+            cls._instance.retry_after = timedelta(hours=24)
+            cls._instance.wake = threading.Event()
+            cls._instance.worker = None
+            cls._instance.hits = 0
+            cls._instance.lookups = 0
+        return cls._instance
+
+    def configure(self, config):
+        self.backend = create_backend(config)
+        self.cache_size = config.get('GEOCODER_CACHE_SIZE', self.cache_size)
+        self.precision = config.get('GEOCODER_PRECISION', self.precision)
+        self.batch_size = config.get('GEOCODER_BATCH_SIZE', self.batch_size)
+        self.interval = config.get('GEOCODER_INTERVAL', self.interval)
+        self.retry_after = timedelta(hours=config.get('GEOCODER_RETRY_HOURS', self.retry_after.total_seconds() / 3600))
+
+    def start(self):
+        """Resolve missing addresses in the background, woken by new reports"""
+        if self.worker is not None or isinstance(self.backend, NullBackend):
+            return
+        event_bus.subscribe('road_reports', self.on_event)
+        event_bus.subscribe('road_reports.bulk', self.on_event)
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
+
+    def on_event(self, event):
+        documents = event.get('documents') or [event.get('document') or {}]
+        if event.get('op') == 'insert' and any(not document.get('address') for document in documents):
+            self.wake.set()
+
+    def _worker(self):
+        while True:
+            try:
+                while self.resolve_missing() >= self.batch_size:
+                    pass
+            except Exception as e:
+                print(f"Geocoder error: {e}")
+            self.wake.wait(self.interval)
+            self.wake.clear()
+
+    # Lookups
+
+    def position(self, lat, lon):
+        return f"{lat:.{self.precision}f},{lon:.{self.precision}f}"
+
+    def key(self, lat, lon):
+        # Answers differ per backend, so a switch of backend must not reuse them
+        return f"{self.backend.name}:{self.position(lat, lon)}"
+
+    def _db(self):
+        from models import MongoDB
+        return MongoDB().get_db()
+
+    def reverse(self, lat, lon):
+        """Address for a position, or None; consults both caches before the backend"""
+        position = self.position(lat, lon)
+        key = f"{self.backend.name}:{position}"
+        with self.lock:
+            if key in self.cache:
+                self.cache.move_to_end(key)
+                self.hits += 1
+                return self.cache[key]
+
+        db = self._db()
+        stored = db[GEOCODE_CACHE].find_one({'_id': key, 'backend': self.backend.name}) if db is not None else None
+        if stored is not None:
+            address = stored.get('address')
+        else:
+            self.lookups += 1
+            try:
+                # Resolve the rounded position, so every report sharing the key gets the same answer
+                address = self.backend.reverse(*map(float, position.split(',')))
+            except Exception as e:
+                print(f"Geocoding {key} failed: {e}")
+                return None
+            if address and db is not None:
+                db[GEOCODE_CACHE].update_one(
+                    {'_id': key},
+                    {'$set': {'address': address, 'backend': self.backend.name, 'created_at': datetime.utcnow()}},
+                    upsert=True
+                )
+
+        with self.lock:
+            self.cache[key] = address
+            while len(self.cache) > self.cache_size:
+                self.cache.popitem(last=False)
+        return address
+
+    def resolve_missing(self, limit=None):
+        """Fill in one batch of reports without an address; returns the batch size"""
+        from models import RoadReport
+        documents = RoadReport.find_missing_address(limit or self.batch_size, datetime.utcnow() - self.retry_after)
+        if not documents:
+            return 0
+
+        addresses = {}
+        for document in documents:
+            lon, lat = document['location']['coordinates'][:2]
+            key = self.key(lat, lon)
+            if key not in addresses:
+                addresses[key] = self.reverse(lat, lon)
+
+        resolved = RoadReport.set_addresses(documents, [
+            addresses[self.key(document['location']['coordinates'][1], document['location']['coordinates'][0])]
+            for document in documents
+        ], field=self.backend.field)
+        print(f"Geocoder resolved {resolved} of {len(documents)} report addresses")
+        return len(documents)
+
+    def stats(self):
+        return {
+            'backend': self.backend.name,
+            'cached': len(self.cache),
+            'hits': self.hits,
+            'lookups': self.lookups
+        }
+
+
+# Global geocoder
+geocoder = Geocoder()
+
+
+def main(argv):
+    from config import Config
+    from models import MongoDB
+
+    command = argv[1] if len(argv) > 1 else 'resolve'
+    config = vars(Config)
+    MongoDB().init_db(config)
+    geocoder.configure(config)
+
+    if command == 'resolve':
+        total = 0
+        while True:
+            count = geocoder.resolve_missing()
+            total += count
+            if count < geocoder.batch_size:
+                break
+        print(f"Looked up {total} reports ({geocoder.stats()})")
+        return 0
+
+    print(f"Usage: python {argv[0]} [resolve]")
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
@@ -0,0 +1,369 @@
+"""Precomputed multi-resolution heatmaps of reports and camera detections.
+
+A periodic job aggregates road_reports (by created_at, duplicates left
+out) and camera_detections (by timestamp, one count per detected defect
+rather than per frame) into heatmap_cells: one document
+per source, grid resolution (HEATMAP_CELL_DEG), day and lon/lat cell with
+the count, counts per severity and counts per issue/defect type. The last
+HEATMAP_REBUILD_DAYS days (today included) are rebuilt on every pass, so
+late changes such as merged duplicates are picked up; older days are final.
+A pass overwrites cells in place, stamping them with its build time, and
+only then removes the window's cells carrying an older stamp, so readers
+never see the window empty. A lease in heatmap_state lets one process
+build at a time; the others skip their pass while it is held.
+
+Heatmap reads are index range scans over (source, cell_size, day, cell_x,
+cell_y), bounded by the number of cells in view times the days asked for,
+instead of ad-hoc aggregations over the raw collections.
+
+    python heatmaps.py build    # run one build pass now
+"""
+import math
+import os
+import re
+import socket
+import sys
+import threading
+import time
+from datetime import datetime, timedelta
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+HEATMAP_CELLS = 'heatmap_cells'
+HEATMAP_STATE = 'heatmap_state'
+LEASE_ID = 'build_lease'
+SEVERITIES = ('high', 'medium', 'low')
+
+# Per source: collection, time field, match, array to count the elements of
+# (unwind) and the severity / type expressions
+SOURCES = {
+    'reports': {
+        'collection': 'road_reports',
+        'time': 'created_at',
+        'match': {'status': {'$ne': 'duplicate'}},
+        'severity': '$severity',
+        'type': '$issue_type'
+    },
+    'detections': {
+        'collection': 'camera_detections',
+        'time': 'timestamp',
+        'match': {},
+        'unwind': '$detections',
+        'severity': '$detections.severity',
+        'type': '$detections.type'
+    }
+}
+
+_TYPE_NAME = re.compile(r'^[A-Za-z0-9_-]+$')
+
+
+def _floor_day(value):
+    return value.replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def build_pipeline(source, start, end, cell_size, built_at):
+    """Aggregate one source's records in [start, end) into daily cells of cell_size degrees"""
+    spec = SOURCES[source]
+    cell = lambda index: {'$floor': {'$divide': [{'$arrayElemAt': ['$location.coordinates', index]}, cell_size]}}
+    match = {spec['time']: {'$gte': start, '$lt': end}, 'location.coordinates': {'$exists': True}}
+    match.update(spec['match'])
+
+    severity_counts = {
+        severity: {'$sum': {'$cond': [{'$eq': ['$_id.severity', severity]}, '$count', 0]}}
+        for severity in SEVERITIES
+    }
+    # Per-type totals from the (severity, type) rows of a cell
+    by_type = {'$arrayToObject': {'$map': {
+        'input': {'$setUnion': ['$types.k']},
+        'as': 'type',
+        'in': {'k': '$$type', 'v': {'$sum': {'$map': {
+            'input': {'$filter': {'input': '$types', 'cond': {'$eq': ['$$this.k', '$$type']}}},
+            'in': '$$this.v'
+        }}}}
+    }}}
+
+    return [
+        {'$match': match},
+        *([{'$unwind': spec['unwind']}] if spec.get('unwind') else []),
+        {'$group': {
+            '_id': {
+                'day': {'$dateTrunc': {'date': f"${spec['time']}", 'unit': 'day'}},
+                'cell_x': cell(0),
+                'cell_y': cell(1),
+                'severity': {'$ifNull': [spec['severity'], 'unknown']},
+                'type': {'$toString': {'$ifNull': [spec['type'], 'unknown']}}
+            },
+            'count': {'$sum': 1}
+        }},
+        {'$group': {
+            '_id': {'day': '$_id.day', 'cell_x': '$_id.cell_x', 'cell_y': '$_id.cell_y'},
+            'count': {'$sum': '$count'},
+            **severity_counts,
+            'types': {'$push': {'k': '$_id.type', 'v': '$count'}}
+        }},
+        {'$project': {
+            '_id': 0,
+            'source': {'$literal': source},
+            'cell_size': {'$literal': cell_size},
+            'day': '$_id.day',
+            'cell_x': '$_id.cell_x',
+            'cell_y': '$_id.cell_y',
+            'count': 1,
+            'by_severity': {severity: f"${severity}" for severity in SEVERITIES},
+            'by_type': by_type,
+            'built_at': {'$literal': built_at}
+        }},
+        {'$merge': {
+            'into': HEATMAP_CELLS,
+            'on': ['source', 'cell_size', 'day', 'cell_x', 'cell_y'],
+            'whenMatched': 'replace',
+            'whenNotMatched': 'insert'
+        }}
+    ]
+
+
+def acquire_lease(db, holder, seconds):
+    """Take or renew the build lease for `seconds`; False while another process holds it"""
+    now = datetime.utcnow()
+    try:
+        lease = db[HEATMAP_STATE].find_one_and_update(
+            {'_id': LEASE_ID, '$or': [{'holder': holder}, {'expires_at': {'$lt': now}}]},
+            {'$set': {'holder': holder, 'expires_at': now + timedelta(seconds=seconds)}},
+            upsert=True,
+            return_document=ReturnDocument.AFTER
+        )
+    except DuplicateKeyError:
+        # The lease exists and is held by someone else, so the upsert collided
+        return False
+    return lease is not None and lease.get('holder') == holder
+
+
+def release_lease(db, holder):
+    db[HEATMAP_STATE].update_one(
+        {'_id': LEASE_ID, 'holder': holder},
+        {'$set': {'expires_at': datetime.utcnow()}}
+    )
+
+
+def build_heatmaps(db, cell_sizes, rebuild_days, sources=tuple(SOURCES), renew=None):
+    """Rebuild every source from its last final day up to today; returns {source: (start, end)}
+
+    Callers hold the build lease; renew() is called between steps to extend
+    it and returning False stops the pass.
+    """
+    today = _floor_day(datetime.utcnow())
+    end = today + timedelta(days=1)
+    built = {}
+    for source in sources:
+        spec = SOURCES[source]
+        state = db[HEATMAP_STATE].find_one({'_id': source})
+        start = state.get('built_to') if state else None
+        if start is None:
+            oldest = db[spec['collection']].find_one(
+                {spec['time']: {'$type': 'date'}}, sort=[(spec['time'], 1)], projection={spec['time']: 1}
+            )
+            if oldest is None:
+                continue
+            start = _floor_day(oldest[spec['time']])
+        start = min(start, today - timedelta(days=rebuild_days))
+
+        for cell_size in cell_sizes:
+            if renew is not None and not renew():
+                return built
+            built_at = datetime.utcnow()
+            db[spec['collection']].aggregate(build_pipeline(source, start, end, cell_size, built_at))
+            # Cells this pass did not write have emptied since (e.g. merged duplicates)
+            db[HEATMAP_CELLS].delete_many({
+                'source': source, 'cell_size': cell_size,
+                'day': {'$gte': start, '$lt': end}, 'built_at': {'$ne': built_at}
+            })
+
+        db[HEATMAP_STATE].update_one(
+            {'_id': source},
+            {'$set': {'built_to': today, 'updated_at': datetime.utcnow()}},
+            upsert=True
+        )
+        built[source] = (start, end)
+    return built
+
+
+class HeatmapStore:
+    """Build heatmaps on a schedule and answer cell-range queries"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.cell_sizes = (0.1, 0.01, 0.001)
+            cls._instance.interval = 900
+            cls._instance.rebuild_days = 7
+            cls._instance.max_cells = 10000
+            cls._instance.max_days = 366
+            cls._instance.lease_seconds = 1800
+            cls._instance.node = f"{socket.gethostname()}:{os.getpid()}"
+            cls._instance.worker = None
+            cls._instance.last_build = None
+        return cls._instance
+
+    def configure(self, config):
+        self.cell_sizes = tuple(sorted(config.get('HEATMAP_CELL_DEG', self.cell_sizes), reverse=True))
+        self.interval = config.get('HEATMAP_INTERVAL', self.interval)
+        self.rebuild_days = config.get('HEATMAP_REBUILD_DAYS', self.rebuild_days)
+        self.max_cells = config.get('HEATMAP_MAX_CELLS', self.max_cells)
+        self.max_days = config.get('HEATMAP_MAX_DAYS', self.max_days)
+        self.lease_seconds = config.get('HEATMAP_LEASE_SECONDS', self.lease_seconds)
+
+    def build(self, db=None):
+        """One build pass if no other process is building; returns what was built or None"""
+        if db is None:
+            from models import MongoDB
+            db = MongoDB().get_db()
+        if db is None:
+            return None
+        try:
+            renew = lambda: acquire_lease(db, self.node, self.lease_seconds)
+            if not renew():
+                return None
+            try:
+                self.last_build = build_heatmaps(db, self.cell_sizes, self.rebuild_days, renew=renew)
+            finally:
+                release_lease(db, self.node)
+            return self.last_build
+        except Exception as e:
+            print(f"Heatmap build error: {e}")
+            return None
+
+    def start(self):
+        """Start the periodic build worker"""
+        if self.worker is not None:
+            return
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
+
+    def _worker(self):
+        while True:
+            self.build()
+            time.sleep(self.interval)
+
+    # Queries
+
+    def _cell_ranges(self, bbox, cell_size):
+        """(x range, y range) pairs covering a bbox, two across the antimeridian"""
+        west, south, east, north = bbox
+        # floor(value / size), as $floor($divide) computes it at build time (value // size differs at round values)
+        cell = lambda value: math.floor(value / cell_size)
+        ys = (cell(south), cell(north))
+        if west <= east:
+            return [((cell(west), cell(east)), ys)]
+        return [((cell(west), cell(180.0)), ys), ((cell(-180.0), cell(east)), ys)]
+
+    def pick_cell_size(self, bbox):
+        """Finest resolution showing bbox in at most max_cells cells"""
+        for cell_size in reversed(self.cell_sizes):
+            cells = sum(
+                (x1 - x0 + 1) * (y1 - y0 + 1)
+                for (x0, x1), (y0, y1) in self._cell_ranges(bbox, cell_size)
+            )
+            if cells <= self.max_cells:
+                return cell_size
+        return self.cell_sizes[0]
+
+    def query(self, source, bbox, start, end, cell_size=None, severity=None, issue_type=None):
+        """Per-cell totals over days [start, end] inside bbox
+
+        Returns {'source', 'cell_size', 'from', 'to', 'columns', 'cells', 'max'}
+        with cells as [cell_x, cell_y, count, high, medium, low] rows; a cell
+        covers [x, x + 1) * cell_size degrees of longitude (y likewise).
+        count is narrowed by severity or issue_type when given.
+        """
+        if source not in SOURCES:
+            raise ValueError(f"Unknown heatmap source '{source}'")
+        if severity and issue_type:
+            raise ValueError('Filter by severity or by type, not both')
+        if severity and severity not in SEVERITIES:
+            raise ValueError(f"Unknown severity '{severity}'")
+        if issue_type and not _TYPE_NAME.match(issue_type):
+            raise ValueError(f"Invalid type '{issue_type}'")
+        start, end = _floor_day(start), _floor_day(end)
+        if end < start or (end - start).days >= self.max_days:
+            raise ValueError(f"Date range must be 1 to {self.max_days} days")
+        if cell_size is None:
+            cell_size = self.pick_cell_size(bbox)
+        elif cell_size not in self.cell_sizes:
+            raise ValueError(f"cell_size must be one of {list(self.cell_sizes)}")
+
+        from models import MongoDB
+        db = MongoDB().get_read_db()
+        if db is None:
+            return None
+
+        ranges = [
+            {'cell_x': {'$gte': x0, '$lte': x1}, 'cell_y': {'$gte': y0, '$lte': y1}}
+            for (x0, x1), (y0, y1) in self._cell_ranges(bbox, cell_size)
+        ]
+        match = {'source': source, 'cell_size': cell_size, 'day': {'$gte': start, '$lte': end}}
+        if len(ranges) == 1:
+            match.update(ranges[0])
+        else:
+            match['$or'] = ranges
+
+        if severity:
+            value = f"$by_severity.{severity}"
+        elif issue_type:
+            value = {'$ifNull': [f"$by_type.{issue_type}", 0]}
+        else:
+            value = '$count'
+        pipeline = [
+            {'$match': match},
+            {'$group': {
+                '_id': {'x': '$cell_x', 'y': '$cell_y'},
+                'count': {'$sum': value},
+                **{s: {'$sum': f"$by_severity.{s}"} for s in SEVERITIES}
+            }},
+            {'$match': {'count': {'$gt': 0}}}
+        ]
+        cells = [
+            [int(row['_id']['x']), int(row['_id']['y']), row['count']] + [row[s] for s in SEVERITIES]
+            for row in db[HEATMAP_CELLS].aggregate(pipeline)
+        ]
+        return {
+            'source': source,
+            'cell_size': cell_size,
+            'from': start.date().isoformat(),
+            'to': end.date().isoformat(),
+            'columns': ['cell_x', 'cell_y', 'count', *SEVERITIES],
+            'cells': cells,
+            'max': max((row[2] for row in cells), default=0)
+        }
+
+
+# Global heatmap store
+heatmap_store = HeatmapStore()
+
+
+def main(argv):
+    from db_client import create_client
+    from config import Config
+
+    command = argv[1] if len(argv) > 1 else 'build'
+    db = create_client(vars(Config))[Config.MONGO_DBNAME]
+    heatmap_store.configure(vars(Config))
+
+    if command == 'build':
+        built = heatmap_store.build(db)
+        if built is None:
+            print("Another process is building heatmaps (or the build failed)")
+            return 1
+        for source, (start, end) in built.items():
+            print(f"Built {source} heatmaps {start:%Y-%m-%d} - {end:%Y-%m-%d}")
+        if not built:
+            print("Nothing to build")
+        return 0
+
+    print(f"Usage: python {argv[0]} build")
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
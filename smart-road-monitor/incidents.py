@@ -0,0 +1,214 @@
+"""Fold duplicate reports of the same defect into one incident.
+
+An incident is an open road report that has absorbed later reports of the
+same issue type made within INCIDENT_RADIUS_M and INCIDENT_WINDOW_HOURS of
+its last report. Clustering is incremental and DBSCAN-like: a new report
+joins the nearest matching incident, and if it lies within reach of
+several incidents they are density-connected through it and merged into
+the one with the most reports (the others become status 'duplicate' with
+merged_into set, which takes them off every open-report query).
+
+A merged incident keeps:
+    report_count      reports folded into it (itself included)
+    reporter_ids      everyone who reported it, so all of them are notified
+    verification_score  confidence, combined as 1 - prod(1 - c) over reports
+    severity          the highest reported
+    location          the mean position of its reports
+    images            up to INCIDENT_MAX_IMAGES, oldest first
+    address           the first known one
+    description       each distinct description, in report order
+    last_reported_at  time of the latest report
+
+Candidates come from RoadReport.find_nearby(active_only=True), i.e. the
+in-memory report index once it has loaded. There is no lock: every write
+is conditional on the incident still being open with the report_count it
+was read with (RoadReport.save_if), so concurrent submissions, in this or
+another process, cannot overwrite each other's merges. A submission that
+loses the race re-reads its candidates from MongoDB and tries again, up to
+INCIDENT_MERGE_ATTEMPTS times. Two duplicates submitted at the same moment
+can still both open an incident; the next report within reach of both
+merges them.
+"""
+from datetime import datetime, timedelta
+
+from geo_grid import point_from_location
+from indexes import ACTIVE_STATUSES
+
+SEVERITY_RANK = {'low': 0, 'medium': 1, 'high': 2}
+
+DUPLICATE_STATUS = 'duplicate'
+
+
+def combine_confidence(*scores):
+    """Probability at least one independent report is right"""
+    miss = 1.0
+    for score in scores:
+        miss *= 1.0 - min(max(float(score or 0), 0.0), 1.0)
+    return 1.0 - miss
+
+
+def unchanged(report):
+    """Condition for save_if: still open and with the report_count read"""
+    return {'status': {'$in': ACTIVE_STATUSES}, 'report_count': report.report_count}
+
+
+def merge_text(current, addition):
+    """current plus addition on a new line, unless it already contains it"""
+    addition = (addition or '').strip()
+    if not addition or addition in (current or ''):
+        return current
+    return f"{current}\n{addition}" if current else addition
+
+
+class IncidentMerger:
+    """Saves new reports, merging them into the open incident they duplicate"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.radius = 30
+            cls._instance.window = timedelta(hours=720)
+            cls._instance.max_images = 20
+            cls._instance.citizen_confidence = 0.5
+            cls._instance.attempts = 5
+        return cls._instance
+
+    def configure(self, config):
+        self.radius = config.get('INCIDENT_RADIUS_M', self.radius)
+        self.window = timedelta(hours=config.get('INCIDENT_WINDOW_HOURS', self.window.total_seconds() / 3600))
+        self.max_images = config.get('INCIDENT_MAX_IMAGES', self.max_images)
+        self.citizen_confidence = config.get('INCIDENT_CITIZEN_CONFIDENCE', self.citizen_confidence)
+        self.attempts = config.get('INCIDENT_MERGE_ATTEMPTS', self.attempts)
+
+    def candidates(self, report, now, fresh=False):
+        """Open incidents a new report duplicates, nearest first
+
+        fresh reads MongoDB instead of the report index, which may not have
+        caught up with another process's writes yet.
+        """
+        from models import RoadReport
+        point = point_from_location(report.location)
+        if point is None:
+            return []
+        if fresh:
+            found = [
+                incident for incident in RoadReport.find_nearby(point[0], point[1], self.radius)
+                if incident.status in ACTIVE_STATUSES
+            ]
+        else:
+            found = RoadReport.find_nearby(point[0], point[1], self.radius, active_only=True)
+        since = now - self.window
+        return [
+            incident for incident in found
+            if incident.issue_type == report.issue_type
+            and (incident.last_reported_at or incident.created_at or now) >= since
+        ]
+
+    def submit(self, report, confidence=None):
+        """Save report as a new incident or merge it; returns (incident, merged)
+
+        confidence defaults to the report's verification_score, or
+        INCIDENT_CITIZEN_CONFIDENCE for reports without one.
+        """
+        now = datetime.utcnow()
+        if confidence is None:
+            confidence = report.verification_score or self.citizen_confidence
+
+        for attempt in range(self.attempts):
+            candidates = self.candidates(report, now, fresh=attempt > 0)
+            if not candidates:
+                break
+            incident = max(candidates, key=lambda candidate: candidate.report_count or 1)
+            # Retire the other incidents first so nobody else merges into them meanwhile
+            retired = [(other, self._retire(other, incident)) for other in candidates if other is not incident]
+            retired = [(other, status) for other, status in retired if status]
+            merged = self._commit(incident, [other for other, _ in retired], report, confidence, now)
+            if merged is not None:
+                return merged, True
+            # The incident was closed or merged away: reopen what was retired into it
+            for other, status in retired:
+                self._reopen(other, status, incident)
+
+        report.report_count = 1
+        report.reporter_ids = report.reporters()
+        report.verification_score = confidence
+        report.last_reported_at = now
+        report.save()
+        return report, False
+
+    def _commit(self, incident, absorbed, report, confidence, now):
+        """Fold absorbed incidents and report into incident; None if it is no longer open"""
+        from models import RoadReport
+        for _ in range(self.attempts):
+            condition = unchanged(incident)
+            for other in absorbed:
+                self._absorb(incident, other)
+            self._add_report(incident, report, confidence, now)
+            if incident.save_if(condition):
+                return incident
+            # Someone else merged into it first: start again from the stored incident
+            incident = RoadReport.find_by_id(incident._id)
+            if incident is None or incident.status not in ACTIVE_STATUSES:
+                return None
+        return None
+
+    def _merge_fields(self, incident, source, count, confidence):
+        """Fold source, standing for `count` reports, into incident"""
+        point = point_from_location(source.location)
+        total = (incident.report_count or 1) + count
+        current = point_from_location(incident.location)
+        if current is not None and point is not None:
+            weight = count / total
+            incident.location = {
+                'type': 'Point',
+                'coordinates': [
+                    current[0] + (point[0] - current[0]) * weight,
+                    current[1] + (point[1] - current[1]) * weight
+                ]
+            }
+        incident.report_count = total
+        if SEVERITY_RANK.get(source.severity, -1) > SEVERITY_RANK.get(incident.severity, -1):
+            incident.severity = source.severity
+            incident.priority = 1 if source.severity == 'high' else 2
+        room = self.max_images - len(incident.images or [])
+        if room > 0:
+            incident.images = (incident.images or []) + [image for image in source.images or [] if image][:room]
+        incident.verification_score = combine_confidence(incident.verification_score, confidence)
+        incident.reporter_ids = list(dict.fromkeys(incident.reporters() + source.reporters()))
+        incident.address = incident.address or source.address
+        incident.description = merge_text(incident.description, source.description)
+
+    def _add_report(self, incident, report, confidence, now):
+        self._merge_fields(incident, report, 1, confidence)
+        incident.last_reported_at = now
+
+    def _absorb(self, incident, other):
+        """Merge a retired incident into this one"""
+        self._merge_fields(incident, other, other.report_count or 1, other.verification_score)
+        if other.last_reported_at and (not incident.last_reported_at or other.last_reported_at > incident.last_reported_at):
+            incident.last_reported_at = other.last_reported_at
+
+    def _retire(self, other, incident):
+        """Mark other as merged into incident unless it changed since it was read
+
+        Returns other's previous status, or None if it was not retired.
+        """
+        condition = unchanged(other)
+        status = other.status
+        other.status = DUPLICATE_STATUS
+        other.merged_into = incident._id
+        if other.save_if(condition):
+            return status
+        other.status = status
+        other.merged_into = None
+        return None
+
+    def _reopen(self, other, status, incident):
+        other.status = status
+        other.merged_into = None
+        other.save_if({'status': DUPLICATE_STATUS, 'merged_into': incident._id})
+
+
+# Global incident merger
+incidents = IncidentMerger()
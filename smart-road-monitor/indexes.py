@@ -0,0 +1,234 @@
+"""Index plan for the smart_roads database.
+
+INDEX_PLAN lists every index the application needs; QUERY_SHAPES lists the
+queries the indexes were derived from (routes.py, websocket_handler.py,
+models.py and p2pl/app.py share the same database). Run
+
+    python indexes.py create    # build the plan
+    python indexes.py check     # explain() every registered query, flag COLLSCANs
+
+to verify each query is served by an index.
+"""
+import sys
+from datetime import datetime, timedelta
+from pymongo import GEOSPHERE, ASCENDING, DESCENDING
+from config import Config
+
+# Report statuses that count as "not resolved"; queries on open reports use
+# this list (rather than $ne) so they match the partial indexes below.
+ACTIVE_STATUSES = ['pending', 'assigned', 'in_progress']
+
+INDEX_PLAN = [
+    # Users: login / registration lookups
+    ('users', [('email', ASCENDING)], {'unique': True}),
+    ('users', [('username', ASCENDING)], {'unique': True}),
+
+    # Road reports
+    ('road_reports', [('location', GEOSPHERE)], {}),
+    # RoadReport.get_all: equality on severity or issue type, sorted by newest
+    # (status and status + severity filters use report_stats below)
+    ('road_reports', [('severity', ASCENDING), ('created_at', DESCENDING)], {}),
+    ('road_reports', [('issue_type', ASCENDING), ('created_at', DESCENDING)], {}),
+    ('road_reports', [('created_at', DESCENDING)], {}),
+    # p2pl stats_queries $facet pipeline (covered scan) and get_all by status
+    ('road_reports', [('status', ASCENDING), ('severity', ASCENDING),
+                      ('created_at', DESCENDING), ('resolved_at', DESCENDING)], {'name': 'report_stats'}),
+    # Map/viewport/route queries over open reports only
+    ('road_reports', [('location', GEOSPHERE), ('severity', ASCENDING), ('created_at', DESCENDING)], {
+        'name': 'location_active',
+        'partialFilterExpression': {'status': {'$in': ACTIVE_STATUSES}}
+    }),
+    # Address/description/issue type prefix search (report_search.py)
+    ('road_reports', [('search_terms', ASCENDING)], {'name': 'search_terms'}),
+    # Geocoder: reports still missing an address (null matches missing fields too)
+    ('road_reports', [('address', ASCENDING), ('created_at', DESCENDING)], {}),
+    # A user's reports, including those merged into incidents (reporter_ids)
+    ('road_reports', [('reporter_id', ASCENDING), ('created_at', DESCENDING)], {}),
+    ('road_reports', [('reporter_ids', ASCENDING), ('created_at', DESCENDING)], {}),
+    # "Resolved today" counters
+    ('road_reports', [('resolved_at', DESCENDING)], {
+        'name': 'resolved_at_resolved',
+        'partialFilterExpression': {'status': 'resolved'}
+    }),
+
+    # Camera detections: recent feed, per-camera history, time ranges
+    ('camera_detections', [('timestamp', DESCENDING)], {}),
+    ('camera_detections', [('camera_id', ASCENDING), ('timestamp', DESCENDING)], {}),
+    ('camera_detections', [('location', GEOSPHERE), ('timestamp', DESCENDING)], {}),
+
+    # Hourly per-cell detection summaries (detection_store.py): $merge key + TTL
+    ('detection_summaries', [('camera_id', ASCENDING), ('hour', ASCENDING),
+                             ('cell_x', ASCENDING), ('cell_y', ASCENDING)], {'unique': True}),
+    ('detection_summaries', [('hour', DESCENDING)], {
+        'name': 'hour_ttl',
+        'expireAfterSeconds': Config.DETECTION_SUMMARY_RETENTION_DAYS * 86400
+    }),
+
+    # Daily heatmap cells (heatmaps.py): $merge key, also serving cell-range reads
+    ('heatmap_cells', [('source', ASCENDING), ('cell_size', ASCENDING), ('day', ASCENDING),
+                       ('cell_x', ASCENDING), ('cell_y', ASCENDING)], {'unique': True}),
+
+    # Maintenance teams
+    ('maintenance_teams', [('status', ASCENDING)], {}),
+
+    # Notifications: pending per target room, expired after the retention period
+    ('notifications', [('target', ASCENDING), ('created_at', DESCENDING)], {}),
+    ('notifications', [('created_at', ASCENDING)], {
+        'name': 'created_ttl',
+        'expireAfterSeconds': Config.NOTIFICATION_RETENTION_DAYS * 86400
+    }),
+
+    # Reverse-geocoding cache (geocoding.py), keyed by rounded position
+    ('geocode_cache', [('created_at', ASCENDING)], {
+        'name': 'created_ttl',
+        'expireAfterSeconds': Config.GEOCODE_CACHE_DAYS * 86400
+    }),
+
+    # Statistics snapshots
+    ('statistics', [('date', DESCENDING)], {}),
+]
+
+
+def _today():
+    return datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+def _point(lon=80.2707, lat=13.0827):
+    return {'type': 'Point', 'coordinates': [lon, lat]}
+
+
+# (name, collection, filter, sort, limit) for every query the apps issue
+QUERY_SHAPES = [
+    ('User.find_by_email', 'users', lambda: {'email': 'admin@smartroads.com'}, None, 1),
+    ('User.find_by_username', 'users', lambda: {'username': 'admin'}, None, 1),
+    ('RoadReport.get_all (no filter)', 'road_reports', lambda: {}, [('created_at', DESCENDING)], 20),
+    ('RoadReport.get_all (status)', 'road_reports',
+     lambda: {'status': 'pending'}, [('created_at', DESCENDING)], 20),
+    ('RoadReport.get_all (status, severity)', 'road_reports',
+     lambda: {'status': 'pending', 'severity': 'high'}, [('created_at', DESCENDING)], 20),
+    ('RoadReport.get_all (severity)', 'road_reports',
+     lambda: {'severity': 'high'}, [('created_at', DESCENDING)], 20),
+    ('RoadReport.get_all (issue_type)', 'road_reports',
+     lambda: {'issue_type': 'pothole'}, [('created_at', DESCENDING)], 20),
+    ('RoadReport.get_all (date range)', 'road_reports',
+     lambda: {'created_at': {'$gte': _today() - timedelta(days=7), '$lte': _today()}},
+     [('created_at', DESCENDING)], 20),
+    ('RoadReport.find_nearby / subscribe_map / /api/reports/nearby', 'road_reports',
+     lambda: {'location': {'$near': {'$geometry': _point(), '$maxDistance': 5000}}}, None, 50),
+    ('route damages (open reports)', 'road_reports',
+     lambda: {'location': {'$geoWithin': {'$centerSphere': [[80.2707, 13.0827], 1000 / 6378100.0]}},
+              'status': {'$in': ACTIVE_STATUSES}}, None, 0),
+    ('p2pl search_reports (prefix search)', 'road_reports',
+     lambda: {'$and': [{'search_terms': {'$gte': 'mount', '$lt': 'mounu'}},
+                       {'search_terms': {'$gte': 'ro', '$lt': 'rp'}}]}, None, 5000),
+    ('Geocoder: reports missing an address', 'road_reports',
+     lambda: {'address': {'$in': [None, '']}, 'location.coordinates': {'$exists': True}},
+     [('created_at', DESCENDING)], 100),
+    ('RoadReport.find_by_reporter', 'road_reports',
+     lambda: {'$or': [{'reporter_id': '0'}, {'reporter_ids': '0'}]}, [('created_at', DESCENDING)], 50),
+    ('statistics: pending', 'road_reports', lambda: {'status': 'pending'}, None, 0),
+    ('statistics: high severity', 'road_reports', lambda: {'severity': 'high'}, None, 0),
+    ('statistics: reports today', 'road_reports', lambda: {'created_at': {'$gte': _today()}}, None, 0),
+    ('statistics: resolved today', 'road_reports',
+     lambda: {'status': 'resolved', 'resolved_at': {'$gte': _today()}}, None, 0),
+    ('CameraDetection.get_recent / camera_live', 'camera_detections',
+     lambda: {}, [('timestamp', DESCENDING)], 10),
+    ('statistics: detections today', 'camera_detections',
+     lambda: {'timestamp': {'$gte': _today()}}, None, 0),
+    ('detections per camera', 'camera_detections',
+     lambda: {'camera_id': 'esp32_dev', 'timestamp': {'$gte': _today()}}, [('timestamp', DESCENDING)], 100),
+    ('detection summaries per camera', 'detection_summaries',
+     lambda: {'camera_id': 'esp32_dev', 'hour': {'$gte': _today() - timedelta(days=7)}}, None, 0),
+    ('heatmap cell range', 'heatmap_cells',
+     lambda: {'source': 'reports', 'cell_size': 0.01, 'day': {'$gte': _today() - timedelta(days=29)},
+              'cell_x': {'$gte': 8015, '$lte': 8035}, 'cell_y': {'$gte': 1290, '$lte': 1310}}, None, 0),
+    ('MaintenanceTeam by status', 'maintenance_teams', lambda: {'status': 'available'}, None, 0),
+    ('Notification.find_pending', 'notifications',
+     lambda: {'target': {'$in': ['user:0', 'role:citizen']}, 'acked_by': {'$ne': '0'}},
+     [('created_at', DESCENDING)], 50),
+    ('Statistics by date', 'statistics', lambda: {'date': _today()}, None, 1),
+]
+
+# Indexes made redundant by a longer one with the same prefix (report_stats);
+# dropped by create_indexes so they stop costing every report write
+DROPPED_INDEXES = [
+    ('road_reports', 'status_1_severity_1_created_at_-1'),
+    ('road_reports', 'status_1'),
+    ('road_reports', 'severity_1'),
+]
+
+
+def create_indexes(db):
+    """Create every index in INDEX_PLAN; a failing index does not stop the rest"""
+    for collection, name in DROPPED_INDEXES:
+        if name in db[collection].index_information():
+            db[collection].drop_index(name)
+    created = 0
+    for collection, keys, options in INDEX_PLAN:
+        try:
+            db[collection].create_index(keys, **options)
+            created += 1
+        except Exception as e:
+            print(f"Error creating index {collection} {keys}: {e}")
+    return created
+
+
+def _plan_stages(plan):
+    """Yield every stage name in an explain() plan tree"""
+    if not isinstance(plan, dict):
+        return
+    if 'stage' in plan:
+        yield plan['stage'], plan.get('indexName')
+    for key in ('inputStage', 'queryPlan'):
+        if key in plan:
+            yield from _plan_stages(plan[key])
+    for child in plan.get('inputStages', []):
+        yield from _plan_stages(child)
+
+
+def check_queries(db):
+    """Explain each registered query and report the stages/indexes it uses"""
+    problems = []
+    for name, collection, make_filter, sort, limit in QUERY_SHAPES:
+        cursor = db[collection].find(make_filter())
+        if sort:
+            cursor = cursor.sort(sort)
+        if limit:
+            cursor = cursor.limit(limit)
+        try:
+            explain = cursor.explain()
+        except Exception as e:
+            problems.append(name)
+            print(f"ERROR     {name}: {e}")
+            continue
+
+        stages = list(_plan_stages(explain.get('queryPlanner', {}).get('winningPlan', {})))
+        indexes = sorted({index for _, index in stages if index})
+        if any(stage == 'COLLSCAN' for stage, _ in stages):
+            problems.append(name)
+            print(f"COLLSCAN  {name}")
+        else:
+            print(f"OK        {name} -> {', '.join(indexes) or 'n/a'}")
+    return problems
+
+
+def main(argv):
+    from db_client import create_client
+
+    command = argv[1] if len(argv) > 1 else 'check'
+    db = create_client(vars(Config))[Config.MONGO_DBNAME]
+
+    if command == 'create':
+        print(f"Created/verified {create_indexes(db)} of {len(INDEX_PLAN)} indexes")
+        return 0
+    if command == 'check':
+        problems = check_queries(db)
+        print(f"{len(QUERY_SHAPES) - len(problems)}/{len(QUERY_SHAPES)} queries use an index")
+        return 1 if problems else 0
+
+    print(f"Usage: python {argv[0]} [create|check]")
+    return 2
+
+
+if __name__ == '__main__':
+    sys.exit(main(sys.argv))
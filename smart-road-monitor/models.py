@@ -1,7 +1,14 @@
 from datetime import datetime, timedelta
 from bson import ObjectId
-from pymongo import MongoClient, GEOSPHERE, ASCENDING, DESCENDING
+from pymongo import DESCENDING
+from pymongo.errors import BulkWriteError
 from flask import current_app
+from schema import Document, Field
+from db_client import PoolMetrics, create_client, read_preference
+from event_bus import event_bus
+from indexes import ACTIVE_STATUSES
+from report_search import search_terms
+import threading
 import json
 
 class MongoDB:
@@ -13,112 +20,111 @@ class MongoDB:
             # Initialize attributes
             cls._instance.client = None
             cls._instance.db = None
+            cls._instance.read_db = None
+            cls._instance.config = None
+            cls._instance.metrics = PoolMetrics()
+            cls._instance.lock = threading.Lock()
         return cls._instance
     
-    def init_db(self):
+    def init_db(self, config=None):
+        # Keep the config so threads without an app context can reconnect
+        config = config or self.config or current_app.config
+        self.config = config
         try:
-            self.client = MongoClient(current_app.config['MONGO_URI'], serverSelectionTimeoutMS=5000)
-            self.db = self.client[current_app.config['MONGO_DBNAME']]
+            self.client = create_client(config, self.metrics)
+            self.db = self.client[config['MONGO_DBNAME']]
+            # List/read-mostly endpoints may be served by secondaries
+            self.read_db = self.db.with_options(
+                read_preference=read_preference(config.get('MONGO_LIST_READ_PREFERENCE'))
+            )
+            # camera_detections must exist as a time-series collection before indexing
+            from detection_store import detection_store
+            detection_store.ensure_collection(self.db)
             self.create_indexes()
-            print(f"MongoDB connected to database: {current_app.config['MONGO_DBNAME']}")
+            print(f"MongoDB connected to database: {config['MONGO_DBNAME']}")
             return True
         except Exception as e:
             print(f"MongoDB connection error: {e}")
             self.client = None
             self.db = None
+            self.read_db = None
             return False
     
     def get_db(self):
         """Get database connection, initialize if needed"""
         if self.db is None:
-            self.init_db()
+            with self.lock:
+                if self.db is None:
+                    self.init_db()
         return self.db
     
+    def get_read_db(self):
+        """Database handle using the configured read preference for list queries"""
+        if self.get_db() is None:
+            return None
+        return self.read_db
+    
+    def pool_stats(self):
+        """Connection pool metrics for sizing MONGO_MAX_POOL_SIZE"""
+        max_pool_size = self.config.get('MONGO_MAX_POOL_SIZE', 100) if self.config else None
+        stats = self.metrics.snapshot(max_pool_size)
+        stats['max_pool_size'] = max_pool_size
+        return stats
+    
     def create_indexes(self):
         if self.db is None:
             return
-            
-        try:
-            # Users collection
-            self.db.users.create_index([('email', ASCENDING)], unique=True)
-            self.db.users.create_index([('username', ASCENDING)], unique=True)
-            
-            # Road reports collection
-            self.db.road_reports.create_index([('location', GEOSPHERE)])
-            self.db.road_reports.create_index([('status', ASCENDING)])
-            self.db.road_reports.create_index([('severity', ASCENDING)])
-            self.db.road_reports.create_index([('created_at', DESCENDING)])
-            
-            # Camera detections collection
-            self.db.camera_detections.create_index([('timestamp', DESCENDING)])
-            self.db.camera_detections.create_index([('location', GEOSPHERE)])
-            
-            # Maintenance teams collection
-            self.db.maintenance_teams.create_index([('status', ASCENDING)])
-            
-            # Statistics collection
-            self.db.statistics.create_index([('date', DESCENDING)])
-            print("Database indexes created/verified")
-        except Exception as e:
-            print(f"Error creating indexes: {e}")
-
-class User:
-    def __init__(self, data=None):
-        self._id = None
-        self.username = None
-        self.email = None
-        self.password_hash = None
-        self.full_name = None
-        self.role = 'citizen'
-        self.department = None
-        self.phone = None
-        self.avatar = None
-        self.is_active = True
-        self.created_at = datetime.utcnow()
-        self.last_login = None
         
-        if data:
-            self._id = data.get('_id')
-            self.username = data.get('username')
-            self.email = data.get('email')
-            self.password_hash = data.get('password_hash')
-            self.full_name = data.get('full_name')
-            self.role = data.get('role', 'citizen')
-            self.department = data.get('department')
-            self.phone = data.get('phone')
-            self.avatar = data.get('avatar')
-            self.is_active = data.get('is_active', True)
-            self.created_at = data.get('created_at', datetime.utcnow())
-            self.last_login = data.get('last_login')
+        from indexes import INDEX_PLAN, create_indexes
+        created = create_indexes(self.db)
+        print(f"Database indexes created/verified ({created}/{len(INDEX_PLAN)})")
+
+class Model(Document):
+    """Document persisted in a MongoDB collection"""
+    __slots__ = ()
+    collection = None
+    label = 'document'
     
     def save(self):
         mongo = MongoDB()
         db = mongo.get_db()
         if db is None:
-            print("Warning: MongoDB not available, user not saved")
+            print(f"Warning: MongoDB not available, {self.label} not saved")
             return None
-            
-        user_data = {
-            'username': self.username,
-            'email': self.email,
-            'password_hash': self.password_hash,
-            'full_name': self.full_name,
-            'role': self.role,
-            'department': self.department,
-            'phone': self.phone,
-            'avatar': self.avatar,
-            'is_active': self.is_active,
-            'created_at': self.created_at,
-            'last_login': self.last_login
-        }
+        
+        data = self.to_doc()
+        collection = db[self.collection]
         
         if self._id:
-            result = db.users.update_one({'_id': self._id}, {'$set': user_data})
-            return self._id
+            self._update(collection, data)
         else:
-            result = db.users.insert_one(user_data)
-            self._id = result.inserted_id
-            return self._id
+            self._insert(collection, data)
+        return self._id
+    
+    def _insert(self, collection, data):
+        result = collection.insert_one(data)
+        self._id = result.inserted_id
+    
+    def _update(self, collection, data):
+        collection.update_one({'_id': self._id}, {'$set': data})
+
+class User(Model):
+    collection = 'users'
+    label = 'user'
+    fields = (
+        Field('_id', kind='id', json_key='id'),
+        Field('username'),
+        Field('email'),
+        Field('password_hash', json=False),
+        Field('full_name'),
+        Field('role', default='citizen'),
+        Field('department'),
+        Field('phone'),
+        Field('avatar'),
+        Field('is_active', default=True),
+        Field('created_at', factory=datetime.utcnow, kind='datetime'),
+        Field('last_login', kind='datetime'),
+    )
     
     @classmethod
     def find_by_email(cls, email):
@@ -129,7 +135,7 @@ class User:
             
         user_data = db.users.find_one({'email': email})
         if user_data:
-            return cls(user_data)
+            return cls.from_doc(user_data)
         return None
     
     @classmethod
@@ -141,7 +147,7 @@ class User:
             
         user_data = db.users.find_one({'username': username})
         if user_data:
-            return cls(user_data)
+            return cls.from_doc(user_data)
         return None
     
     @classmethod
@@ -154,7 +160,7 @@ class User:
         try:
             user_data = db.users.find_one({'_id': ObjectId(user_id)})
             if user_data:
-                return cls(user_data)
+                return cls.from_doc(user_data)
         except:
             pass
         return None
@@ -180,81 +186,41 @@ class User:
     def get_id(self):
         return str(self._id) if self._id else None
 
-class RoadReport:
-    def __init__(self, data=None):
-        self._id = None
-        self.reporter_id = None
-        self.location = None
-        self.address = None
-        self.issue_type = None
-        self.severity = None
-        self.description = None
-        self.images = []
-        self.status = 'pending'
-        self.priority = 1
-        self.assigned_to = None
-        self.assigned_at = None
-        self.resolved_at = None
-        self.resolution_notes = None
-        self.resolution_images = []
-        self.verification_score = 0
-        self.created_at = datetime.utcnow()
-        self.updated_at = datetime.utcnow()
-        
-        if data:
-            self._id = data.get('_id')
-            self.reporter_id = data.get('reporter_id')
-            self.location = data.get('location')
-            self.address = data.get('address')
-            self.issue_type = data.get('issue_type')
-            self.severity = data.get('severity')
-            self.description = data.get('description')
-            self.images = data.get('images', [])
-            self.status = data.get('status', 'pending')
-            self.priority = data.get('priority', 1)
-            self.assigned_to = data.get('assigned_to')
-            self.assigned_at = data.get('assigned_at')
-            self.resolved_at = data.get('resolved_at')
-            self.resolution_notes = data.get('resolution_notes')
-            self.resolution_images = data.get('resolution_images', [])
-            self.verification_score = data.get('verification_score', 0)
-            self.created_at = data.get('created_at', datetime.utcnow())
-            self.updated_at = data.get('updated_at', datetime.utcnow())
+class RoadReport(Model):
+    collection = 'road_reports'
+    label = 'report'
+    fields = (
+        Field('_id', kind='id', json_key='id'),
+        Field('reporter_id', kind='id'),
+        Field('location'),
+        Field('address'),
+        # Approximate place from the offline gazetteer (see geocoding.py)
+        Field('address_hint'),
+        Field('issue_type'),
+        Field('severity'),
+        Field('description'),
+        Field('images', factory=list),
+        Field('status', default='pending'),
+        Field('priority', default=1),
+        Field('assigned_to', kind='id'),
+        Field('assigned_at', kind='datetime'),
+        Field('resolved_at', kind='datetime'),
+        Field('resolution_notes', json=False),
+        Field('resolution_images', factory=list, json=False),
+        Field('verification_score', default=0, json=False),
+        # Incident bookkeeping (see incidents.py)
+        Field('report_count', default=1),
+        Field('reporter_ids', factory=list, json=False),
+        Field('last_reported_at', kind='datetime'),
+        Field('merged_into', kind='id'),
+        Field('created_at', factory=datetime.utcnow, kind='datetime'),
+        Field('updated_at', factory=datetime.utcnow, kind='datetime', auto_now=True),
+    )
     
-    def save(self):
-        mongo = MongoDB()
-        db = mongo.get_db()
-        if db is None:
-            print("Warning: MongoDB not available, report not saved")
-            return None
-            
-        report_data = {
-            'reporter_id': self.reporter_id,
-            'location': self.location,
-            'address': self.address,
-            'issue_type': self.issue_type,
-            'severity': self.severity,
-            'description': self.description,
-            'images': self.images,
-            'status': self.status,
-            'priority': self.priority,
-            'assigned_to': self.assigned_to,
-            'assigned_at': self.assigned_at,
-            'resolved_at': self.resolved_at,
-            'resolution_notes': self.resolution_notes,
-            'resolution_images': self.resolution_images,
-            'verification_score': self.verification_score,
-            'created_at': self.created_at,
-            'updated_at': datetime.utcnow()
-        }
-        
-        if self._id:
-            result = db.road_reports.update_one({'_id': self._id}, {'$set': report_data})
-            return self._id
-        else:
-            result = db.road_reports.insert_one(report_data)
-            self._id = result.inserted_id
-            return self._id
+    def reporters(self):
+        """Ids of everyone who reported this issue, the original reporter first"""
+        ids = [self.reporter_id] + list(self.reporter_ids or [])
+        return list(dict.fromkeys(str(reporter) for reporter in ids if reporter))
     
     @classmethod
     def find_by_id(cls, report_id):
@@ -266,13 +232,23 @@ class RoadReport:
         try:
             report_data = db.road_reports.find_one({'_id': ObjectId(report_id)})
             if report_data:
-                return cls(report_data)
+                return cls.from_doc(report_data)
         except:
             pass
         return None
     
     @classmethod
-    def find_nearby(cls, longitude, latitude, max_distance=5000):
+    def find_nearby(cls, longitude, latitude, max_distance=5000, active_only=False):
+        """Reports within max_distance metres, nearest first
+        
+        With active_only (open reports only) the in-memory report index
+        answers once it has loaded; MongoDB is the fallback.
+        """
+        if active_only:
+            from report_index import report_index
+            if report_index.ready:
+                return cls.hydrate(doc for doc, _ in report_index.radius(longitude, latitude, max_distance))
+        
         mongo = MongoDB()
         db = mongo.get_db()
         if db is None:
@@ -289,16 +265,60 @@ class RoadReport:
                 }
             }
         }
-        reports = db.road_reports.find(query)
-        return [cls(report) for report in reports]
+        if active_only:
+            query['status'] = {'$in': ACTIVE_STATUSES}
+        return cls.hydrate(db.road_reports.find(query))
     
     @classmethod
-    def get_all(cls, filters=None, page=1, per_page=20):
+    def find_in_bbox(cls, bbox, status='active', severities=None, limit=None):
+        """Reports inside a (west, south, east, north) box, unsorted
+        
+        status is 'active' (open reports, from the in-memory report index
+        once loaded), 'all' or a single status. At most limit reports.
+        """
+        import report_clusters
+        if status in (None, '', 'active'):
+            from report_index import report_index
+            if report_index.ready:
+                documents = report_index.bbox(*bbox)
+                if severities:
+                    documents = [doc for doc in documents if doc.get('severity') in severities]
+                return cls.hydrate(documents[:limit] if limit else documents)
+        
         mongo = MongoDB()
-        db = mongo.get_db()
+        db = mongo.get_read_db()
         if db is None:
-            return {'reports': [], 'total': 0, 'page': page, 'per_page': per_page, 'pages': 0}
-            
+            return []
+        query = report_clusters.filter_query(status, severities, ACTIVE_STATUSES)
+        query['location'] = {'$geoWithin': {'$geometry': report_clusters.bbox_geometry(*bbox)}}
+        return cls.hydrate(db.road_reports.find(query, limit=limit or 0))
+    
+    @classmethod
+    def clusters(cls, bbox, zoom, status='active', severities=None, cell_px=60):
+        """Map clusters of reports inside bbox at a zoom level (see report_clusters)
+        
+        Open reports come from the in-memory report index once it has
+        loaded; other status filters, and the fallback, aggregate in MongoDB.
+        """
+        import report_clusters
+        if status in (None, '', 'active'):
+            from report_index import report_index
+            if report_index.ready:
+                documents = report_index.bbox(*bbox)
+                if severities:
+                    documents = [doc for doc in documents if doc.get('severity') in severities]
+                return report_clusters.cluster_documents(documents, zoom, cell_px)
+        
+        mongo = MongoDB()
+        db = mongo.get_read_db()
+        if db is None:
+            return []
+        query = report_clusters.filter_query(status, severities, ACTIVE_STATUSES)
+        return report_clusters.find_clusters(db.road_reports, bbox, zoom, query, cell_px)
+    
+    @staticmethod
+    def build_query(filters=None):
+        """Translate list filters (status, severity, issue_type, date range) into a query"""
         query = {}
         
         if filters:
@@ -316,18 +336,185 @@ class RoadReport:
                 else:
                     query['created_at'] = {'$lte': filters['date_to']}
         
+        return query
+    
+    @classmethod
+    def find_by_reporter(cls, user_id, limit=50):
+        """A user's reports, newest first, including those merged into incidents"""
+        mongo = MongoDB()
+        db = mongo.get_read_db()
+        if db is None:
+            return []
+        
+        query = {'$or': [{'reporter_id': user_id}, {'reporter_ids': user_id}]}
+        return cls.hydrate(db.road_reports.find(query).sort('created_at', DESCENDING).limit(limit))
+    
+    @classmethod
+    def get_all(cls, filters=None, page=1, per_page=20):
+        mongo = MongoDB()
+        db = mongo.get_read_db()
+        if db is None:
+            return {'reports': [], 'total': 0, 'page': page, 'per_page': per_page, 'pages': 0}
+            
+        query = cls.build_query(filters)
+        
         skip = (page - 1) * per_page
         reports = db.road_reports.find(query).sort('created_at', DESCENDING).skip(skip).limit(per_page)
         total = db.road_reports.count_documents(query)
         
         return {
-            'reports': [cls(report) for report in reports],
+            'reports': cls.hydrate(reports),
             'total': total,
             'page': page,
             'per_page': per_page,
             'pages': (total + per_page - 1) // per_page
         }
     
+    def _insert(self, collection, data):
+        data['search_terms'] = search_terms(data)
+        super()._insert(collection, data)
+        from stats_service import statistics_service
+        statistics_service.report_created(self)
+        event_bus.publish('road_reports', {'op': 'insert', 'document': data})
+    
+    def _update(self, collection, data, condition=None):
+        data['search_terms'] = search_terms(data)
+        # The pre-update image tells the statistics service which counters moved
+        # (and the tile cache where a moved report used to be)
+        previous = collection.find_one_and_update(
+            dict(condition or {}, _id=self._id),
+            {'$set': data},
+            projection={'status': 1, 'severity': 1, 'location': 1}
+        )
+        if previous is None and condition is not None:
+            return None
+        from stats_service import statistics_service
+        statistics_service.report_changed(previous, self)
+        event_bus.publish('road_reports', {
+            'op': 'update',
+            'document': dict(data, _id=self._id),
+            'previous': previous
+        })
+        return previous
+    
+    def save_if(self, condition):
+        """Update this saved report only while its stored document matches condition
+        
+        The check and the write are one atomic find_one_and_update. Returns
+        whether the report was updated.
+        """
+        mongo = MongoDB()
+        db = mongo.get_db()
+        if db is None:
+            print(f"Warning: MongoDB not available, {self.label} not saved")
+            return False
+        return self._update(db[self.collection], self.to_doc(), condition) is not None
+    
+    @classmethod
+    def find_missing_address(cls, limit=100, retry_before=None):
+        """Raw documents of located reports without an address, newest first
+        
+        Reports whose lookup was attempted after retry_before are skipped.
+        """
+        mongo = MongoDB()
+        db = mongo.get_db()
+        if db is None:
+            return []
+        query = {'address': {'$in': [None, '']}, 'location.coordinates': {'$exists': True}}
+        if retry_before is not None:
+            query['$or'] = [{'geocoded_at': {'$exists': False}}, {'geocoded_at': {'$lt': retry_before}}]
+        return list(db.road_reports.find(query).sort('created_at', DESCENDING).limit(limit))
+    
+    @classmethod
+    def set_addresses(cls, documents, addresses, field='address'):
+        """Store geocoded addresses (None: lookup failed) on raw report documents
+        
+        Only reports still without an address are changed. Resolved reports
+        get an update event, so the map, report index and tiles pick the
+        address up, and fresh search terms unless field is 'address_hint'
+        (an approximate place a better backend may replace). Returns the
+        number resolved.
+        """
+        from pymongo import UpdateOne
+        mongo = MongoDB()
+        db = mongo.get_db()
+        if db is None:
+            return 0
+        
+        now = datetime.utcnow()
+        operations = []
+        resolved = []
+        for document, address in zip(documents, addresses):
+            fields = {'geocoded_at': now}
+            if address:
+                fields[field] = address
+                if field == 'address':
+                    fields['search_terms'] = search_terms(dict(document, address=address))
+                resolved.append(dict(document, **fields))
+            operations.append(UpdateOne({'_id': document['_id'], 'address': {'$in': [None, '']}}, {'$set': fields}))
+        if operations:
+            db.road_reports.bulk_write(operations, ordered=False)
+        for document in resolved:
+            event_bus.publish('road_reports', {'op': 'update', 'document': document, 'previous': None})
+        return len(resolved)
+    
+    @classmethod
+    def iter_all(cls, filters=None, batch_size=1000):
+        """Yield reports matching get_all filters, fetched batch_size documents at a time"""
+        mongo = MongoDB()
+        db = mongo.get_read_db()
+        if db is None:
+            return
+        
+        cursor = db.road_reports.find(cls.build_query(filters)).sort('created_at', DESCENDING).batch_size(batch_size)
+        from_doc = cls.from_doc
+        for report in cursor:
+            yield from_doc(report)
+    
+    @classmethod
+    def insert_many(cls, reports):
+        """Insert new reports in one round trip; returns the number inserted
+        
+        Documents are tagged with an import_batch id, so the change feed can
+        leave them to the single reports_imported message. On a
+        BulkWriteError the reports that did get in are still announced
+        before the error is re-raised.
+        """
+        if not reports:
+            return 0
+        mongo = MongoDB()
+        db = mongo.get_db()
+        if db is None:
+            print("Warning: MongoDB not available, reports not saved")
+            return 0
+        
+        batch = ObjectId()
+        documents = [report.to_doc() for report in reports]
+        for document in documents:
+            document['search_terms'] = search_terms(document)
+            document['import_batch'] = batch
+        try:
+            db.road_reports.insert_many(documents, ordered=False)
+            failed = set()
+            error = None
+        except BulkWriteError as e:
+            failed = {write_error['index'] for write_error in e.details.get('writeErrors', [])}
+            error = e
+        
+        # insert_many sets _id on each document before sending it
+        inserted = [(report, document) for index, (report, document) in enumerate(zip(reports, documents))
+                    if index not in failed]
+        from stats_service import statistics_service
+        for report, document in inserted:
+            report._id = document['_id']
+            statistics_service.report_created(report)
+        # One event for the batch (clients get a single reports_imported message)
+        if inserted:
+            event_bus.publish('road_reports.bulk', {'op': 'insert', 'documents': [document for _, document in inserted]})
+        if error is not None:
+            raise error
+        return len(inserted)
+    
     def assign_to(self, user_id, team_id=None):
         self.assigned_to = user_id
         self.assigned_at = datetime.utcnow()
@@ -341,156 +528,149 @@ class RoadReport:
         if images:
             self.resolution_images = images
         self.save()
-    
-    def to_json(self):
-        return {
-            'id': str(self._id) if self._id else None,
-            'reporter_id': str(self.reporter_id) if self.reporter_id else None,
-            'location': self.location,
-            'address': self.address,
-            'issue_type': self.issue_type,
-            'severity': self.severity,
-            'description': self.description,
-            'images': self.images,
-            'status': self.status,
-            'priority': self.priority,
-            'assigned_to': str(self.assigned_to) if self.assigned_to else None,
-            'assigned_at': self.assigned_at.isoformat() if self.assigned_at else None,
-            'resolved_at': self.resolved_at.isoformat() if self.resolved_at else None,
-            'created_at': self.created_at.isoformat() if self.created_at else None,
-            'updated_at': self.updated_at.isoformat() if self.updated_at else None
-        }
 
-class CameraDetection:
-    def __init__(self, data=None):
-        self._id = None
-        self.camera_id = None
-        self.location = None
-        self.image_url = None
-        self.detections = []
-        self.confidence = None
-        self.processed = False
-        self.report_id = None
-        self.timestamp = datetime.utcnow()
-        
-        if data:
-            self._id = data.get('_id')
-            self.camera_id = data.get('camera_id')
-            self.location = data.get('location')
-            self.image_url = data.get('image_url')
-            self.detections = data.get('detections', [])
-            self.confidence = data.get('confidence')
-            self.processed = data.get('processed', False)
-            self.report_id = data.get('report_id')
-            self.timestamp = data.get('timestamp', datetime.utcnow())
+class CameraDetection(Model):
+    # Stored in a time-series collection (see detection_store.py); updating
+    # saved detections needs MongoDB 7.0+
+    collection = 'camera_detections'
+    label = 'detection'
+    fields = (
+        Field('_id', kind='id', json_key='id'),
+        Field('camera_id'),
+        Field('location'),
+        Field('gps'),
+        Field('image_url'),
+        Field('detections', factory=list),
+        Field('confidence'),
+        Field('processed', default=False),
+        Field('report_id', kind='id'),
+        Field('timestamp', factory=datetime.utcnow, kind='datetime'),
+    )
     
-    def save(self):
-        mongo = MongoDB()
-        db = mongo.get_db()
-        if db is None:
-            print("Warning: MongoDB not available, detection not saved")
-            return None
-            
-        detection_data = {
-            'camera_id': self.camera_id,
-            'location': self.location,
-            'image_url': self.image_url,
-            'detections': self.detections,
-            'confidence': self.confidence,
-            'processed': self.processed,
-            'report_id': self.report_id,
-            'timestamp': self.timestamp
-        }
-        
-        if self._id:
-            result = db.camera_detections.update_one({'_id': self._id}, {'$set': detection_data})
-            return self._id
-        else:
-            result = db.camera_detections.insert_one(detection_data)
-            self._id = result.inserted_id
-            return self._id
+    def _insert(self, collection, data):
+        super()._insert(collection, data)
+        from stats_service import statistics_service
+        statistics_service.detection_created(self)
+        event_bus.publish('camera_detections', {'op': 'insert', 'document': data})
     
     @classmethod
     def get_recent(cls, limit=100):
         mongo = MongoDB()
-        db = mongo.get_db()
+        db = mongo.get_read_db()
         if db is None:
             return []
             
         detections = db.camera_detections.find().sort('timestamp', DESCENDING).limit(limit)
-        return [cls(detection) for detection in detections]
+        return cls.hydrate(detections)
 
-class MaintenanceTeam:
-    def __init__(self, data=None):
-        self._id = None
-        self.name = None
-        self.members = []
-        self.location = None
-        self.status = 'available'
-        self.current_assignment = None
-        self.equipment = []
-        self.contact = None
+class MaintenanceTeam(Model):
+    collection = 'maintenance_teams'
+    label = 'team'
+    fields = (
+        Field('_id', kind='id', json_key='id'),
+        Field('name'),
+        Field('members', factory=list),
+        Field('location'),
+        Field('status', default='available'),
+        Field('current_assignment', kind='id'),
+        Field('equipment', factory=list),
+        Field('contact'),
+    )
+
+class Notification(Model):
+    """Message addressed to a room (user:<id>, role:<role>, authority_room)
+    
+    Kept until its retention TTL so recipients who were offline get it when
+    they next authenticate; each recipient acknowledges it separately.
+    """
+    collection = 'notifications'
+    label = 'notification'
+    fields = (
+        Field('_id', kind='id', json_key='id'),
+        Field('target'),
+        Field('type', default='info'),
+        Field('message'),
+        Field('data', factory=dict),
+        Field('acked_by', factory=list, json=False),
+        Field('created_at', factory=datetime.utcnow, kind='datetime'),
+    )
+    
+    @classmethod
+    def find_pending(cls, targets, user_id, limit=50):
+        """Newest notifications for any of `targets` not yet acknowledged by user_id"""
+        mongo = MongoDB()
+        db = mongo.get_db()
+        if db is None:
+            return []
         
-        if data:
-            self._id = data.get('_id')
-            self.name = data.get('name')
-            self.members = data.get('members', [])
-            self.location = data.get('location')
-            self.status = data.get('status', 'available')
-            self.current_assignment = data.get('current_assignment')
-            self.equipment = data.get('equipment', [])
-            self.contact = data.get('contact')
+        notifications = db.notifications.find({
+            'target': {'$in': list(targets)},
+            'acked_by': {'$ne': user_id}
+        }).sort('created_at', DESCENDING).limit(limit)
+        return cls.hydrate(notifications)
     
-    def save(self):
+    @classmethod
+    def acknowledge(cls, notification_ids, targets, user_id):
+        """Mark notifications addressed to one of `targets` as read by user_id"""
         mongo = MongoDB()
         db = mongo.get_db()
         if db is None:
-            print("Warning: MongoDB not available, team not saved")
-            return None
-            
-        team_data = {
-            'name': self.name,
-            'members': self.members,
-            'location': self.location,
-            'status': self.status,
-            'current_assignment': self.current_assignment,
-            'equipment': self.equipment,
-            'contact': self.contact
-        }
+            return 0
         
-        if self._id:
-            result = db.maintenance_teams.update_one({'_id': self._id}, {'$set': team_data})
-            return self._id
-        else:
-            result = db.maintenance_teams.insert_one(team_data)
-            self._id = result.inserted_id
-            return self._id
+        ids = []
+        for notification_id in notification_ids:
+            try:
+                ids.append(ObjectId(notification_id))
+            except Exception:
+                continue
+        if not ids:
+            return 0
+        
+        result = db.notifications.update_many(
+            {'_id': {'$in': ids}, 'target': {'$in': list(targets)}},
+            {'$addToSet': {'acked_by': user_id}}
+        )
+        return result.modified_count
 
 class Statistics:
     @staticmethod
-    def update_daily_stats():
+    def compute_daily_stats():
+        """Count today's statistics straight from the collections"""
         mongo = MongoDB()
-        db = mongo.get_db()
+        db = mongo.get_read_db()
         if db is None:
             return {}
             
         today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
         
         # Count reports by status
-        stats = {
+        return {
             'date': today,
             'total_reports': db.road_reports.count_documents({'created_at': {'$gte': today}}),
+            'all_reports': db.road_reports.estimated_document_count(),
             'pending_reports': db.road_reports.count_documents({'status': 'pending'}),
             'resolved_reports': db.road_reports.count_documents({'status': 'resolved'}),
             'high_priority': db.road_reports.count_documents({'severity': 'high'}),
             'ai_detections': db.camera_detections.count_documents({'timestamp': {'$gte': today}}),
             'updated_at': datetime.utcnow()
         }
+    
+    @staticmethod
+    def save_daily_stats(stats):
+        """Upsert a statistics snapshot for its day"""
+        mongo = MongoDB()
+        db = mongo.get_db()
+        if db is None or not stats:
+            return
         
         db.statistics.update_one(
-            {'date': today},
+            {'date': stats['date']},
             {'$set': stats},
             upsert=True
         )
-        
-        return stats
\ No newline at end of file
+    
+    @staticmethod
+    def update_daily_stats():
+        stats = Statistics.compute_daily_stats()
+        Statistics.save_daily_stats(stats)
+        return stats
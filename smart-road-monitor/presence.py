@@ -0,0 +1,216 @@
+"""Who is connected, shared between web processes.
+
+With SOCKETIO_MESSAGE_QUEUE set to a redis:// URL, Socket.IO emits go
+through Redis and each process records its sockets there too, so any
+process can tell which users are online and how many sockets are open.
+Without it, LocalPresence keeps the same records in memory for a single
+process (development and tests).
+
+Each process refreshes its own sockets every PRESENCE_TTL / 3 seconds;
+records of a process that died expire after PRESENCE_TTL.
+"""
+import json
+import os
+import socket
+import threading
+import time
+
+
+class LocalPresence:
+    """In-memory presence for a single process"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.sessions = {}  # sid -> info
+        self.users = {}  # user_id -> set of sids
+
+    def connect(self, sid, info):
+        with self.lock:
+            self.sessions[sid] = dict(info)
+
+    def update(self, sid, fields):
+        with self.lock:
+            info = self.sessions.setdefault(sid, {})
+            info.update(fields)
+            if fields.get('user_id'):
+                self.users.setdefault(fields['user_id'], set()).add(sid)
+
+    def disconnect(self, sid):
+        with self.lock:
+            info = self.sessions.pop(sid, None) or {}
+            sids = self.users.get(info.get('user_id'))
+            if sids is not None:
+                sids.discard(sid)
+                if not sids:
+                    del self.users[info['user_id']]
+
+    def get(self, sid):
+        with self.lock:
+            info = self.sessions.get(sid)
+            return dict(info) if info else None
+
+    def user_sessions(self, user_id):
+        with self.lock:
+            return set(self.users.get(user_id, ()))
+
+    def online_users(self):
+        with self.lock:
+            return set(self.users)
+
+    def count(self):
+        return len(self.sessions)
+
+    def heartbeat(self, sids):
+        pass
+
+
+class RedisPresence:
+    """Presence records in Redis, visible to every web process"""
+    prefix = 'presence'
+
+    def __init__(self, url, ttl):
+        import redis
+        self.redis = redis.Redis.from_url(url, decode_responses=True)
+        self.ttl = ttl
+
+    def _sid_key(self, sid):
+        return f"{self.prefix}:sid:{sid}"
+
+    def _user_key(self, user_id):
+        return f"{self.prefix}:user:{user_id}"
+
+    @property
+    def _sids_key(self):
+        return f"{self.prefix}:sids"
+
+    def connect(self, sid, info):
+        pipe = self.redis.pipeline()
+        pipe.delete(self._sid_key(sid))
+        pipe.hset(self._sid_key(sid), mapping={key: json.dumps(value) for key, value in info.items()})
+        pipe.expire(self._sid_key(sid), self.ttl)
+        pipe.zadd(self._sids_key, {sid: time.time() + self.ttl})
+        pipe.execute()
+
+    def update(self, sid, fields):
+        pipe = self.redis.pipeline()
+        pipe.hset(self._sid_key(sid), mapping={key: json.dumps(value) for key, value in fields.items()})
+        if fields.get('user_id'):
+            pipe.sadd(self._user_key(fields['user_id']), sid)
+        pipe.execute()
+
+    def disconnect(self, sid):
+        info = self.get(sid) or {}
+        pipe = self.redis.pipeline()
+        pipe.delete(self._sid_key(sid))
+        pipe.zrem(self._sids_key, sid)
+        if info.get('user_id'):
+            pipe.srem(self._user_key(info['user_id']), sid)
+        pipe.execute()
+
+    def get(self, sid):
+        raw = self.redis.hgetall(self._sid_key(sid))
+        return {key: json.loads(value) for key, value in raw.items()} if raw else None
+
+    def user_sessions(self, user_id):
+        sids = self.redis.smembers(self._user_key(user_id))
+        if not sids:
+            return set()
+        # Drop sockets of processes that stopped refreshing them
+        pipe = self.redis.pipeline()
+        for sid in sids:
+            pipe.zscore(self._sids_key, sid)
+        now = time.time()
+        live = {sid for sid, expires in zip(sids, pipe.execute()) if expires and expires > now}
+        stale = sids - live
+        if stale:
+            self.redis.srem(self._user_key(user_id), *stale)
+        return live
+
+    def online_users(self):
+        prefix = f"{self.prefix}:user:"
+        return {
+            key[len(prefix):]
+            for key in self.redis.scan_iter(match=f"{prefix}*")
+            if self.user_sessions(key[len(prefix):])
+        }
+
+    def count(self):
+        return self.redis.zcount(self._sids_key, time.time(), '+inf')
+
+    def heartbeat(self, sids):
+        now = time.time()
+        pipe = self.redis.pipeline()
+        for sid in sids:
+            pipe.expire(self._sid_key(sid), self.ttl)
+            pipe.zadd(self._sids_key, {sid: now + self.ttl})
+        pipe.zremrangebyscore(self._sids_key, '-inf', now)
+        pipe.execute()
+
+
+class Presence:
+    """Connected socket registry backed by Redis or process memory"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.backend = LocalPresence()
+            cls._instance.ttl = 60
+            cls._instance.local = set()
+            cls._instance.node = f"{socket.gethostname()}:{os.getpid()}"
+            cls._instance.task = None
+        return cls._instance
+
+    def configure(self, config):
+        """Pick the backend matching SOCKETIO_MESSAGE_QUEUE"""
+        self.ttl = config.get('PRESENCE_TTL', self.ttl)
+        url = config.get('SOCKETIO_MESSAGE_QUEUE')
+        if url and url.startswith(('redis://', 'rediss://')):
+            self.backend = RedisPresence(url, self.ttl)
+        else:
+            self.backend = LocalPresence()
+
+    def start(self, socketio):
+        """Keep this process's sockets alive in the shared registry"""
+        if self.task is None:
+            self.task = socketio.start_background_task(self._heartbeat, socketio)
+
+    def _heartbeat(self, socketio):
+        while True:
+            socketio.sleep(max(self.ttl / 3, 1))
+            try:
+                self.backend.heartbeat(list(self.local))
+            except Exception as e:
+                print(f"Presence heartbeat error: {e}")
+
+    def connect(self, sid, **info):
+        self.local.add(sid)
+        info.setdefault('node', self.node)
+        self.backend.connect(sid, info)
+
+    def update(self, sid, **fields):
+        self.backend.update(sid, fields)
+
+    def disconnect(self, sid):
+        self.local.discard(sid)
+        self.backend.disconnect(sid)
+
+    def get(self, sid):
+        return self.backend.get(sid)
+
+    def user_sessions(self, user_id):
+        """Socket ids of a user's open sessions on any process"""
+        return self.backend.user_sessions(user_id)
+
+    def is_online(self, user_id):
+        return bool(self.backend.user_sessions(user_id))
+
+    def online_users(self):
+        return self.backend.online_users()
+
+    def count(self):
+        return self.backend.count()
+
+
+# Global presence registry
+presence = Presence()
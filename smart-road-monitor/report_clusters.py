@@ -0,0 +1,226 @@
+"""Zoom-dependent clusters of road reports for the map.
+
+Reports are grouped on a fixed Web Mercator pixel grid: at zoom z the world
+is 256 * 2**z pixels wide and each cell is cell_px pixels square, so
+clusters keep the same on-screen size at every zoom and stay put while the
+map pans. A cluster carries its report count, a severity breakdown and the
+mean position of its reports; a single-report cluster also carries a
+short summary of the report (REPORT_FIELDS) so the map can draw a normal
+marker for it.
+
+find_clusters() groups inside MongoDB with one aggregation;
+cluster_documents() does the same in NumPy for documents already in memory.
+Both return the same shape.
+
+The same module is used by smart-road-monitor and p2pl (kept identical in
+both apps, which are deployed separately).
+"""
+import math
+
+import numpy as np
+
+from geo_utils import as_points
+
+MAX_LATITUDE = 85.05112878
+MAX_ZOOM = 22
+TILE_SIZE = 256
+SEVERITIES = ('high', 'medium', 'low')
+
+# Report fields sent with single-report clusters
+REPORT_FIELDS = ('severity', 'status', 'issue_type', 'address')
+
+# Vertex spacing (degrees) along bbox edges, so the spherical polygon
+# follows the parallels closely
+EDGE_STEP = 1.0
+
+
+def _wrap(lon):
+    return (lon + 180.0) % 360.0 - 180.0
+
+
+def parse_bbox(value):
+    """(west, south, east, north) from 'west,south,east,north' (see normalize_bbox)"""
+    try:
+        west, south, east, north = (float(part) for part in str(value).split(','))
+    except ValueError:
+        raise ValueError('bbox must be "west,south,east,north"')
+    return normalize_bbox(west, south, east, north)
+
+
+def normalize_bbox(west, south, east, north):
+    """Map bounds as a (west, south, east, north) box for queries
+
+    Longitudes are wrapped into [-180, 180]; west > east means the box
+    crosses the antimeridian. Latitudes are clamped to the Mercator range.
+    """
+    west, south, east, north = float(west), float(south), float(east), float(north)
+    south, north = max(south, -MAX_LATITUDE), min(north, MAX_LATITUDE)
+    if south >= north or west >= east:
+        raise ValueError('bbox is empty')
+    if east - west >= 360.0:
+        return -180.0, south, 180.0, north
+    west, east = _wrap(west), _wrap(east)
+    if east == -180.0:
+        east = 180.0
+    return west, south, east, north
+
+
+def parse_zoom(value):
+    try:
+        zoom = int(float(value))
+    except (TypeError, ValueError):
+        raise ValueError('zoom must be a number')
+    return min(max(zoom, 0), MAX_ZOOM)
+
+
+def filter_query(status=None, severities=None, active_statuses=()):
+    """Report query for the map's status ('active', 'all' or one status) and severity filters"""
+    query = {}
+    if not status or status == 'active':
+        query['status'] = {'$in': list(active_statuses)}
+    elif status != 'all':
+        query['status'] = status
+    if severities:
+        query['severity'] = {'$in': list(severities)}
+    return query
+
+
+def bbox_geometry(west, south, east, north):
+    """GeoJSON for a lon/lat box, with densified edges, for $geoWithin
+
+    2dsphere treats polygon edges as great circles, so the top and bottom
+    edges get a vertex every EDGE_STEP degrees and wide boxes are split into
+    pieces narrower than a hemisphere.
+    """
+    if west > east:
+        spans = [(west, 180.0), (-180.0, east)]
+    else:
+        spans = [(west, east)]
+
+    polygons = []
+    for span_west, span_east in spans:
+        pieces = max(math.ceil((span_east - span_west) / 90.0), 1)
+        width = (span_east - span_west) / pieces
+        for index in range(pieces):
+            left = span_west + index * width
+            steps = max(math.ceil(width / EDGE_STEP), 1)
+            lons = [left + width * step / steps for step in range(steps + 1)]
+            ring = [[lon, south] for lon in lons]
+            ring += [[lon, north] for lon in reversed(lons)]
+            ring.append([left, south])
+            polygons.append([ring])
+
+    if len(polygons) == 1:
+        return {'type': 'Polygon', 'coordinates': polygons[0]}
+    return {'type': 'MultiPolygon', 'coordinates': polygons}
+
+
+def _scales(zoom, cell_px):
+    """Cells per degree of longitude and per radian of Mercator y"""
+    world = TILE_SIZE * (1 << zoom) / cell_px
+    return world / 360.0, world / (2 * math.pi)
+
+
+def clusters_pipeline(query, zoom, cell_px=60, max_clusters=2000):
+    """Aggregation grouping matched reports into grid cells"""
+    scale_x, scale_y = _scales(zoom, cell_px)
+    lat = {'$max': [{'$min': ['$lat', MAX_LATITUDE]}, -MAX_LATITUDE]}
+    group = {
+        '_id': {
+            'x': {'$floor': {'$multiply': [{'$add': ['$lon', 180.0]}, scale_x]}},
+            'y': {'$floor': {'$multiply': [
+                {'$subtract': [math.pi, {'$asinh': {'$tan': {'$degreesToRadians': lat}}}]},
+                scale_y
+            ]}}
+        },
+        'count': {'$sum': 1},
+        'lon': {'$avg': '$lon'},
+        'lat': {'$avg': '$lat'},
+        'report': {'$first': {'_id': '$_id', **{field: f"${field}" for field in REPORT_FIELDS}}}
+    }
+    for severity in SEVERITIES:
+        group[severity] = {'$sum': {'$cond': [{'$eq': ['$severity', severity]}, 1, 0]}}
+
+    return [
+        {'$match': query},
+        {'$project': {
+            **{field: 1 for field in REPORT_FIELDS},
+            'lon': {'$arrayElemAt': ['$location.coordinates', 0]},
+            'lat': {'$arrayElemAt': ['$location.coordinates', 1]}
+        }},
+        {'$group': group},
+        {'$sort': {'count': -1}},
+        {'$limit': max_clusters}
+    ]
+
+
+def _report_summary(document):
+    summary = {field: document.get(field) for field in REPORT_FIELDS}
+    summary['id'] = str(document.get('_id'))
+    return summary
+
+
+def _cluster(zoom, x, y, count, lon, lat, severity_counts, document):
+    return {
+        'key': f"{zoom}/{int(x)}/{int(y)}",
+        'lat': float(lat),
+        'lon': float(lon),
+        'count': int(count),
+        'severity': {severity: int(n) for severity, n in zip(SEVERITIES, severity_counts)},
+        'report': _report_summary(document) if count == 1 else None
+    }
+
+
+def find_clusters(collection, bbox, zoom, query=None, cell_px=60, max_clusters=2000):
+    """Clusters of the reports matching query inside bbox, grouped by MongoDB"""
+    query = dict(query or {})
+    query['location'] = {'$geoWithin': {'$geometry': bbox_geometry(*bbox)}}
+    return [
+        _cluster(zoom, row['_id']['x'], row['_id']['y'], row['count'], row['lon'], row['lat'],
+                 [row[severity] for severity in SEVERITIES], row['report'])
+        for row in collection.aggregate(clusters_pipeline(query, zoom, cell_px, max_clusters))
+    ]
+
+
+def cluster_documents(documents, zoom, cell_px=60, max_clusters=2000):
+    """Clusters of report documents already in memory (same output as find_clusters)"""
+    documents = list(documents)
+    points = as_points(document.get('location') for document in documents)
+    keep = ~np.isnan(points).any(axis=1)
+    if not keep.any():
+        return []
+    documents = [document for document, kept in zip(documents, keep) if kept]
+    points = points[keep]
+
+    scale_x, scale_y = _scales(zoom, cell_px)
+    lat = np.radians(np.clip(points[:, 1], -MAX_LATITUDE, MAX_LATITUDE))
+    x = np.floor((points[:, 0] + 180.0) * scale_x)
+    y = np.floor((math.pi - np.arcsinh(np.tan(lat))) * scale_y)
+    cells, first, inverse = np.unique(np.column_stack([x, y]), axis=0, return_index=True, return_inverse=True)
+    inverse = inverse.reshape(-1)
+
+    counts = np.bincount(inverse)
+    lons = np.bincount(inverse, weights=points[:, 0]) / counts
+    lats = np.bincount(inverse, weights=points[:, 1]) / counts
+    severities = np.array([document.get('severity') for document in documents], dtype=object)
+    by_severity = [np.bincount(inverse, weights=severities == severity, minlength=len(cells)) for severity in SEVERITIES]
+
+    order = np.argsort(-counts, kind='stable')[:max_clusters]
+    return [
+        _cluster(zoom, cells[i, 0], cells[i, 1], counts[i], lons[i], lats[i],
+                 [counts_of[i] for counts_of in by_severity], documents[first[i]])
+        for i in order
+    ]
+
+
+def summarize(clusters, bbox, zoom, cell_px=60):
+    """API payload: the clusters plus viewport totals"""
+    totals = {severity: sum(cluster['severity'][severity] for cluster in clusters) for severity in SEVERITIES}
+    return {
+        'bbox': list(bbox),
+        'zoom': zoom,
+        'cell_px': cell_px,
+        'clusters': clusters,
+        'total': sum(cluster['count'] for cluster in clusters),
+        'severity': totals
+    }
@@ -0,0 +1,220 @@
+"""In-memory spatial index of unresolved road reports.
+
+Open reports (status in ACTIVE_STATUSES, with a location) are loaded once at
+startup into a uniform grid of REPORT_INDEX_CELL_DEG buckets and kept current
+from report events: this process's writes via the event bus and, where
+MongoDB change streams are available, everyone else's via the change feed.
+Radius, bbox and k-nearest queries then run against memory; until the index
+has loaded (or if loading failed) RoadReport falls back to MongoDB.
+
+A periodic check compares the indexed ids with MongoDB and rebuilds the
+index if they drifted (e.g. writes by another process without change
+streams).
+"""
+import math
+import threading
+import time
+
+import numpy as np
+
+import geo_utils
+from event_bus import event_bus
+from indexes import ACTIVE_STATUSES
+
+
+def _point(document):
+    coordinates = ((document or {}).get('location') or {}).get('coordinates')
+    if not coordinates or len(coordinates) < 2 or coordinates[0] is None or coordinates[1] is None:
+        return None
+    return float(coordinates[0]), float(coordinates[1])
+
+
+class ReportIndex:
+    """Grid-bucketed open reports answering geo queries from memory"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = threading.RLock()
+            cls._instance.cell = 0.01
+            cls._instance.check_interval = 300
+            cls._instance.reports = {}  # id -> (lon, lat, document)
+            cls._instance.buckets = {}  # (cell_x, cell_y) -> set of ids
+            cls._instance.ready = False
+            cls._instance.worker = None
+            cls._instance.last_check = None
+        return cls._instance
+
+    def configure(self, config):
+        self.cell = config.get('REPORT_INDEX_CELL_DEG', self.cell)
+        self.check_interval = config.get('REPORT_INDEX_CHECK_INTERVAL', self.check_interval)
+
+    def start(self):
+        """Load the index, follow report events and schedule consistency checks"""
+        if self.worker is not None:
+            return
+        event_bus.subscribe('road_reports', self.apply)
+        event_bus.subscribe('road_reports.stream', self.apply)
+        event_bus.subscribe('road_reports.bulk', self.apply_bulk)
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
+
+    def _worker(self):
+        self.load()
+        while True:
+            time.sleep(self.check_interval)
+            self.check(repair=True)
+
+    def _cell(self, lon, lat):
+        return math.floor(lon / self.cell), math.floor(lat / self.cell)
+
+    # Maintenance
+
+    def load(self):
+        """(Re)build the index from MongoDB"""
+        from models import MongoDB
+        db = MongoDB().get_db()
+        if db is None:
+            return False
+        try:
+            cursor = db.road_reports.find({
+                'status': {'$in': ACTIVE_STATUSES},
+                'location': {'$exists': True}
+            }).batch_size(5000)
+            reports, buckets = {}, {}
+            for document in cursor:
+                point = _point(document)
+                if point is None:
+                    continue
+                key = str(document['_id'])
+                reports[key] = (point[0], point[1], document)
+                buckets.setdefault(self._cell(*point), set()).add(key)
+        except Exception as e:
+            print(f"Report index load error: {e}")
+            return False
+
+        with self.lock:
+            self.reports, self.buckets = reports, buckets
+            self.ready = True
+        print(f"Report index loaded {len(reports)} open reports")
+        return True
+
+    def _remove(self, key):
+        entry = self.reports.pop(key, None)
+        if entry is None:
+            return
+        cell = self._cell(entry[0], entry[1])
+        ids = self.buckets.get(cell)
+        if ids is not None:
+            ids.discard(key)
+            if not ids:
+                del self.buckets[cell]
+
+    def apply(self, event):
+        """Apply a report event ({'op', 'document', 'id'}); safe to repeat"""
+        document = event.get('document')
+        report_id = event.get('id') or (document or {}).get('_id')
+        if report_id is None:
+            return
+        key = str(report_id)
+
+        with self.lock:
+            self._remove(key)
+            if event.get('op') == 'delete' or document is None:
+                return
+            point = _point(document)
+            if point is None or document.get('status') not in ACTIVE_STATUSES:
+                return
+            self.reports[key] = (point[0], point[1], document)
+            self.buckets.setdefault(self._cell(*point), set()).add(key)
+
+    def apply_bulk(self, event):
+        for document in event.get('documents', ()):
+            self.apply({'op': event.get('op'), 'document': document})
+
+    def check(self, repair=False):
+        """Compare indexed ids with MongoDB; rebuild on drift if repair"""
+        from models import MongoDB
+        # Primary only: replica lag would show up as drift and trigger needless reloads
+        db = MongoDB().get_db()
+        if db is None or not self.ready:
+            return None
+        try:
+            stored = {str(document['_id']) for document in db.road_reports.find(
+                {'status': {'$in': ACTIVE_STATUSES}, 'location': {'$exists': True}},
+                projection={'_id': 1}
+            )}
+        except Exception as e:
+            print(f"Report index check error: {e}")
+            return None
+
+        with self.lock:
+            indexed = set(self.reports)
+        result = {
+            'indexed': len(indexed),
+            'stored': len(stored),
+            'missing': len(stored - indexed),
+            'stale': len(indexed - stored),
+            'checked_at': time.time()
+        }
+        self.last_check = result
+        if repair and (result['missing'] or result['stale']):
+            print(f"Report index drifted ({result['missing']} missing, {result['stale']} stale), reloading")
+            self.load()
+        return result
+
+    # Queries
+
+    def _candidates(self, west, south, east, north):
+        """Entries in the grid cells overlapping a bbox (no exact filtering)"""
+        x0, y0 = self._cell(west, south)
+        x1, y1 = self._cell(east, north)
+        with self.lock:
+            if (x1 - x0 + 1) * (y1 - y0 + 1) > len(self.buckets):
+                cells = [cell for cell in self.buckets if x0 <= cell[0] <= x1 and y0 <= cell[1] <= y1]
+            else:
+                cells = [(x, y) for x in range(x0, x1 + 1) for y in range(y0, y1 + 1)]
+            return [self.reports[key] for cell in cells for key in self.buckets.get(cell, ())]
+
+    def bbox(self, west, south, east, north, limit=None):
+        """Documents inside a bbox (west > east crosses the antimeridian)"""
+        if west > east:
+            return (self.bbox(west, south, 180.0, north, limit) + self.bbox(-180.0, south, east, north, limit))[:limit]
+        found = [
+            document for lon, lat, document in self._candidates(west, south, east, north)
+            if west <= lon <= east and south <= lat <= north
+        ]
+        return found[:limit] if limit else found
+
+    def radius(self, lon, lat, radius_m, limit=None):
+        """(document, distance) pairs within radius_m, nearest first"""
+        west, south, east, north = geo_utils.bbox_from_radius(lon, lat, radius_m)
+        entries = self._candidates(west, south, east, north)
+        if not entries:
+            return []
+        points = np.array([(entry[0], entry[1]) for entry in entries])
+        distances = geo_utils.haversine(lat, lon, points[:, 1], points[:, 0])
+        order = np.argsort(distances)
+        order = order[distances[order] <= radius_m]
+        if limit:
+            order = order[:limit]
+        return [(entries[i][2], float(distances[i])) for i in order]
+
+    def nearest(self, lon, lat, k=1, max_distance=None):
+        """The k nearest (document, distance) pairs, optionally within max_distance"""
+        radius = self.cell * geo_utils.METERS_PER_DEGREE
+        while True:
+            if max_distance is not None:
+                radius = min(radius, max_distance)
+            found = self.radius(lon, lat, radius, limit=k)
+            if len(found) >= k or (max_distance is not None and radius >= max_distance) or radius > 2e7:
+                return found
+            radius *= 2
+
+    def count(self):
+        return len(self.reports)
+
+
+# Global report index
+report_index = ReportIndex()
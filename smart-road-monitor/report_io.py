@@ -0,0 +1,177 @@
+"""Streaming bulk import and export of road reports (NDJSON and CSV)."""
+import csv
+import io
+import json
+from datetime import datetime
+
+from pymongo.errors import BulkWriteError
+
+from models import RoadReport
+
+SEVERITIES = {'low', 'medium', 'high'}
+STATUSES = {'pending', 'assigned', 'in_progress', 'resolved', 'duplicate'}
+
+CSV_COLUMNS = [
+    'id', 'reporter_id', 'longitude', 'latitude', 'address', 'issue_type',
+    'severity', 'description', 'status', 'priority', 'assigned_to',
+    'assigned_at', 'resolved_at', 'created_at', 'updated_at'
+]
+
+MAX_REPORTED_ERRORS = 100
+
+
+def parse_ndjson(stream):
+    """Yield (line_number, record) from a binary NDJSON stream, skipping blank lines"""
+    for line_number, line in enumerate(stream, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield line_number, json.loads(line)
+        except ValueError as e:
+            yield line_number, ValueError(f"Invalid JSON: {e}")
+
+
+def parse_csv(stream):
+    """Yield (line_number, record) from a binary CSV stream with a header row"""
+    text = io.TextIOWrapper(stream, encoding='utf-8', newline='')
+    reader = csv.DictReader(text)
+    for record in reader:
+        yield reader.line_num, record
+
+
+def _parse_datetime(value):
+    if not value:
+        return None
+    if isinstance(value, datetime):
+        return value
+    return datetime.fromisoformat(str(value).replace('Z', '+00:00')).replace(tzinfo=None)
+
+
+def _parse_location(record):
+    location = record.get('location')
+    if isinstance(location, dict) and location.get('type') == 'Point':
+        lon, lat = location['coordinates']
+    else:
+        lon, lat = record.get('longitude'), record.get('latitude')
+        if lon in (None, '') or lat in (None, ''):
+            raise ValueError("Missing location (GeoJSON 'location' or 'longitude'/'latitude')")
+    lon, lat = float(lon), float(lat)
+    if not (-180 <= lon <= 180 and -90 <= lat <= 90):
+        raise ValueError(f"Coordinates out of range: {lon}, {lat}")
+    return {'type': 'Point', 'coordinates': [lon, lat]}
+
+
+def report_from_record(record, reporter_id=None):
+    """Validate one imported record and build an unsaved RoadReport"""
+    if isinstance(record, Exception):
+        raise record
+    if not isinstance(record, dict):
+        raise ValueError("Record must be an object")
+
+    issue_type = record.get('issue_type')
+    if not issue_type:
+        raise ValueError("Missing issue_type")
+
+    severity = (record.get('severity') or 'medium').lower()
+    if severity not in SEVERITIES:
+        raise ValueError(f"Invalid severity: {severity}")
+
+    status = (record.get('status') or 'pending').lower()
+    if status not in STATUSES:
+        raise ValueError(f"Invalid status: {status}")
+
+    report = RoadReport()
+    report.reporter_id = record.get('reporter_id') or reporter_id
+    report.location = _parse_location(record)
+    report.address = record.get('address') or ''
+    report.issue_type = issue_type
+    report.severity = severity
+    report.description = record.get('description') or ''
+    images = record.get('images') or []
+    report.images = images if isinstance(images, list) else [images]
+    report.status = status
+    report.priority = int(record.get('priority') or (1 if severity == 'high' else 2))
+    report.resolved_at = _parse_datetime(record.get('resolved_at'))
+    created_at = _parse_datetime(record.get('created_at'))
+    if created_at:
+        report.created_at = created_at
+    return report
+
+
+def import_reports(records, reporter_id=None, chunk_size=1000):
+    """Validate records and insert them with insert_many in chunks of chunk_size
+
+    Invalid records are skipped and reported (up to MAX_REPORTED_ERRORS) with
+    their line number; only one chunk is held in memory at a time. If a chunk
+    cannot be written (or the input breaks off), the import stops there: the
+    summary keeps what was already inserted and adds 'failed_at', the first
+    line not imported, and 'error'.
+    """
+    summary = {'inserted': 0, 'failed': 0, 'errors': []}
+    chunk = []
+    first_line = None
+    line_number = 0
+
+    try:
+        for line_number, record in records:
+            try:
+                report = report_from_record(record, reporter_id)
+            except Exception as e:
+                summary['failed'] += 1
+                if len(summary['errors']) < MAX_REPORTED_ERRORS:
+                    summary['errors'].append({'line': line_number, 'error': str(e)})
+                continue
+
+            if not chunk:
+                first_line = line_number
+            chunk.append(report)
+            if len(chunk) >= chunk_size:
+                summary['inserted'] += RoadReport.insert_many(chunk)
+                chunk = []
+
+        if chunk:
+            summary['inserted'] += RoadReport.insert_many(chunk)
+            chunk = []
+    except BulkWriteError as e:
+        write_errors = e.details.get('writeErrors', [])
+        summary['inserted'] += e.details.get('nInserted', 0)
+        summary['failed_at'] = first_line
+        summary['error'] = write_errors[0].get('errmsg') if write_errors else str(e)
+    except Exception as e:
+        summary['failed_at'] = first_line if chunk else line_number + 1
+        summary['error'] = str(e)
+    return summary
+
+
+def export_ndjson(reports):
+    """Yield one JSON line per report"""
+    dumps = json.dumps
+    for report in reports:
+        yield dumps(report.to_json()) + '\n'
+
+
+def _csv_row(report):
+    coordinates = (report.location or {}).get('coordinates') or [None, None]
+    data = report.to_json()
+    data['longitude'], data['latitude'] = coordinates[0], coordinates[1]
+    return [data.get(column) for column in CSV_COLUMNS]
+
+
+def export_csv(reports, rows_per_chunk=500):
+    """Yield CSV text (header first), rows_per_chunk rows per yielded chunk"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(CSV_COLUMNS)
+    rows = 0
+
+    for report in reports:
+        writer.writerow(_csv_row(report))
+        rows += 1
+        if rows >= rows_per_chunk:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate(0)
+            rows = 0
+
+    yield buffer.getvalue()
@@ -0,0 +1,164 @@
+"""Cached GeoJSON tiles of open road reports.
+
+/tiles/reports/{z}/{x}/{y} serves the open reports inside one Web Mercator
+tile as a compact GeoJSON FeatureCollection. Below TILE_POINTS_MIN_ZOOM a
+tile holds clusters (report_clusters, on a grid that divides the tile
+evenly) rather than every report, so tiles stay small at city and region
+zooms.
+
+Built tiles are kept in memory, with an ETag, until a report inside them
+changes: report events (the same ones that keep the report index current)
+drop the tile containing the report at every zoom, and the tile of its
+previous position when it moved. Events without a position (deletes seen
+through the change stream) clear the whole cache. TILE_CACHE_TTL bounds
+anything an event could not reach.
+"""
+import hashlib
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from event_bus import event_bus
+from geo_grid import lonlat_to_tile, point_from_location, tile_bounds
+
+GEOJSON_PRECISION = 6
+
+
+def _feature(cluster):
+    """GeoJSON feature for a single report or a cluster"""
+    if cluster['report']:
+        properties = dict(cluster['report'])
+    else:
+        properties = dict(cluster['severity'], cluster=True, count=cluster['count'])
+    return {
+        'type': 'Feature',
+        'geometry': {
+            'type': 'Point',
+            'coordinates': [round(cluster['lon'], GEOJSON_PRECISION), round(cluster['lat'], GEOJSON_PRECISION)]
+        },
+        'properties': properties
+    }
+
+
+class ReportTiles:
+    """Builds report tiles and caches them until their reports change"""
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = threading.Lock()
+            cls._instance.tiles = OrderedDict()  # (z, x, y) -> (body, etag, built_at)
+            cls._instance.versions = {}  # (z, x, y) -> invalidation count
+            cls._instance.epoch = 0
+            cls._instance.max_zoom = 20
+            cls._instance.points_min_zoom = 15
+            cls._instance.cell_px = 64
+            cls._instance.max_tiles = 5000
+            cls._instance.ttl = 300
+            cls._instance.hits = 0
+            cls._instance.misses = 0
+            cls._instance.started = False
+        return cls._instance
+
+    def configure(self, config):
+        self.max_zoom = config.get('TILE_MAX_ZOOM', self.max_zoom)
+        self.points_min_zoom = config.get('TILE_POINTS_MIN_ZOOM', self.points_min_zoom)
+        self.cell_px = config.get('TILE_CLUSTER_CELL_PX', self.cell_px)
+        self.max_tiles = config.get('TILE_CACHE_MAX_TILES', self.max_tiles)
+        self.ttl = config.get('TILE_CACHE_TTL', self.ttl)
+
+    def start(self):
+        """Follow report events (subscribe after the report index, so it is current first)"""
+        if self.started:
+            return
+        event_bus.subscribe('road_reports', self.on_event)
+        event_bus.subscribe('road_reports.stream', self.on_event)
+        event_bus.subscribe('road_reports.bulk', self.on_bulk)
+        self.started = True
+
+    def valid_tile(self, z, x, y):
+        return 0 <= z <= self.max_zoom and 0 <= x < (1 << z) and 0 <= y < (1 << z)
+
+    # Building
+
+    def build(self, z, x, y):
+        """GeoJSON bytes for one tile"""
+        from models import RoadReport
+        west, south, east, north = tile_bounds(z, x, y)
+        # Street zooms: 1 px cells, i.e. one feature per report
+        cell_px = 1 if z >= self.points_min_zoom else self.cell_px
+        clusters = RoadReport.clusters((west, south, east, north), z, cell_px=cell_px)
+        collection = {'type': 'FeatureCollection', 'features': [_feature(cluster) for cluster in clusters]}
+        return json.dumps(collection, separators=(',', ':'), default=str).encode()
+
+    def get(self, z, x, y):
+        """(body, etag) for a tile, from the cache when it is still valid"""
+        key = (z, x, y)
+        now = time.time()
+        with self.lock:
+            cached = self.tiles.get(key)
+            if cached is not None and now - cached[2] < self.ttl:
+                self.tiles.move_to_end(key)
+                self.hits += 1
+                return cached[0], cached[1]
+            self.misses += 1
+            version = (self.epoch, self.versions.get(key, 0))
+
+        body = self.build(z, x, y)
+        etag = hashlib.md5(body).hexdigest()
+
+        with self.lock:
+            # Skip caching if the tile was invalidated while it was being built
+            if (self.epoch, self.versions.get(key, 0)) == version:
+                self.tiles[key] = (body, etag, now)
+                self.tiles.move_to_end(key)
+                while len(self.tiles) > self.max_tiles:
+                    self.tiles.popitem(last=False)
+        return body, etag
+
+    # Invalidation
+
+    def invalidate_point(self, lon, lat):
+        """Drop the tile containing a point at every zoom"""
+        with self.lock:
+            for z in range(self.max_zoom + 1):
+                key = (z, *lonlat_to_tile(lon, lat, z))
+                self.tiles.pop(key, None)
+                self.versions[key] = self.versions.get(key, 0) + 1
+            # Versions only matter while a build is in flight; don't let them pile up
+            if len(self.versions) > self.max_tiles * 4:
+                self.versions.clear()
+                self.tiles.clear()
+                self.epoch += 1
+
+    def invalidate_all(self):
+        with self.lock:
+            self.tiles.clear()
+            self.epoch += 1
+
+    def on_event(self, event):
+        points = [
+            point_from_location((document or {}).get('location'))
+            for document in (event.get('document'), event.get('previous'))
+        ]
+        if event.get('op') == 'delete' or points[0] is None:
+            self.invalidate_all()
+            return
+        for point in set(point for point in points if point is not None):
+            self.invalidate_point(*point)
+
+    def on_bulk(self, event):
+        for document in event.get('documents', ()):
+            point = point_from_location(document.get('location'))
+            if point is not None:
+                self.invalidate_point(*point)
+
+    def stats(self):
+        with self.lock:
+            return {'tiles': len(self.tiles), 'hits': self.hits, 'misses': self.misses}
+
+
+# Global report tile cache
+report_tiles = ReportTiles()
@@ -1,15 +1,30 @@
-from flask import render_template, request, jsonify, redirect, url_for, flash, send_file, session
+from flask import render_template, request, jsonify, redirect, url_for, flash, send_file, session, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 import os
 from werkzeug.utils import secure_filename
-from datetime import datetime, timedelta
+from werkzeug.wsgi import LimitedStream
+from datetime import datetime, timedelta, timezone
 import json
 
-from models import User, RoadReport, CameraDetection, MaintenanceTeam, Statistics
+from models import User, RoadReport, CameraDetection, MaintenanceTeam, Notification
+from stats_service import statistics_service
 from auth import create_user, authenticate_user, authority_required, admin_required, api_token_required
 from camera_integration import camera_manager
+from camera_relay import relay_hub
 from ai_detection import detector
-from websocket_handler import socketio, broadcast_map_update
+import report_io
+import report_clusters
+from report_tiles import report_tiles
+from incidents import incidents
+from heatmaps import heatmap_store
+from websocket_handler import socketio, broadcast_map_update, send_notification, rooms_for_user
+
+def parse_utc(value):
+    """ISO 8601 date/time as a naive UTC datetime (times without an offset are taken as UTC)"""
+    parsed = datetime.fromisoformat(value)
+    if parsed.tzinfo is not None:
+        parsed = parsed.astimezone(timezone.utc).replace(tzinfo=None)
+    return parsed
 
 def register_routes(app):
     """Register all routes with the Flask app"""
@@ -17,7 +32,7 @@ def register_routes(app):
     # Home page
     @app.route('/')
     def index():
-        stats = Statistics.update_daily_stats()
+        stats = statistics_service.get()
         return render_template('index.html', stats=stats, user=current_user)
     
     # About page
@@ -47,7 +62,7 @@ def register_routes(app):
         
         # Get dashboard data
         reports = RoadReport.get_all(per_page=50)
-        stats = Statistics.update_daily_stats()
+        stats = statistics_service.get()
         teams = MaintenanceTeam.find_all()
         
         return render_template('dashboard.html', 
@@ -154,6 +169,22 @@ def register_routes(app):
             }
         })
     
+    @app.route('/api/reports/mine', methods=['GET'])
+    @api_token_required
+    def get_my_reports():
+        """The caller's reports, including reports merged into an incident"""
+        try:
+            limit = max(min(int(request.args.get('limit', 50)), 200), 1)
+        except ValueError:
+            return jsonify({'success': False, 'error': 'limit must be an integer'}), 400
+        
+        reports = RoadReport.find_by_reporter(request.user.get_id(), limit)
+        return jsonify({
+            'success': True,
+            'reports': [report.to_json() for report in reports],
+            'count': len(reports)
+        })
+    
     @app.route('/api/reports/nearby', methods=['GET'])
     def get_nearby_reports():
         """Get reports near a location"""
@@ -161,8 +192,10 @@ def register_routes(app):
             lat = float(request.args.get('lat', 0))
             lon = float(request.args.get('lon', 0))
             distance = int(request.args.get('distance', 5000))  # meters
+            # ?active=true: open reports only, served from the in-memory index
+            active_only = request.args.get('active', 'false').lower() == 'true'
             
-            reports = RoadReport.find_nearby(lon, lat, distance)
+            reports = RoadReport.find_nearby(lon, lat, distance, active_only=active_only)
             
             return jsonify({
                 'success': True,
@@ -172,6 +205,78 @@ def register_routes(app):
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
     
+    @app.route('/api/reports/bbox', methods=['GET'])
+    def get_reports_in_bbox():
+        """Reports inside the visible map area
+        
+        ?bbox=west,south,east,north, optionally &status=active|all|<status>,
+        &severity=high,medium and &limit (capped at MAP_QUERY_MAX_RESULTS)
+        """
+        max_results = app.config.get('MAP_QUERY_MAX_RESULTS', 1000)
+        try:
+            bbox = report_clusters.parse_bbox(request.args.get('bbox', ''))
+            limit = max(min(int(request.args.get('limit', max_results)), max_results), 1)
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        severities = [value for value in request.args.get('severity', '').split(',') if value]
+        try:
+            # One extra to tell the client the area holds more than it got
+            reports = RoadReport.find_in_bbox(bbox, request.args.get('status', 'active'), severities, limit + 1)
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+        
+        return jsonify({
+            'success': True,
+            'reports': [report.to_json() for report in reports[:limit]],
+            'count': min(len(reports), limit),
+            'truncated': len(reports) > limit
+        })
+    
+    @app.route('/api/reports/clusters', methods=['GET'])
+    def get_report_clusters():
+        """Zoom-dependent report clusters for the visible map area
+        
+        ?bbox=west,south,east,north&zoom=z, optionally &status=active|all|<status>
+        and &severity=high,medium
+        """
+        try:
+            bbox = report_clusters.parse_bbox(request.args.get('bbox', ''))
+            zoom = report_clusters.parse_zoom(request.args.get('zoom', 13))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        severities = [value for value in request.args.get('severity', '').split(',') if value]
+        cell_px = app.config.get('REPORT_CLUSTER_CELL_PX', 60)
+        try:
+            clusters = RoadReport.clusters(bbox, zoom, request.args.get('status', 'active'), severities, cell_px)
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+        
+        result = report_clusters.summarize(clusters, bbox, zoom, cell_px)
+        result['success'] = True
+        return jsonify(result)
+    
+    @app.route('/tiles/reports/<int:z>/<int:x>/<int:y>', methods=['GET'])
+    def report_tile(z, x, y):
+        """GeoJSON tile of open reports (clusters below TILE_POINTS_MIN_ZOOM)
+        
+        Served with an ETag and a short max-age, so browsers and CDNs cache
+        tiles and revalidate them cheaply.
+        """
+        if not report_tiles.valid_tile(z, x, y):
+            return jsonify({'success': False, 'error': 'Tile out of range'}), 404
+        try:
+            body, etag = report_tiles.get(z, x, y)
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+        
+        response = Response(body, mimetype='application/geo+json')
+        response.set_etag(etag)
+        response.cache_control.public = True
+        response.cache_control.max_age = app.config.get('TILE_HTTP_MAX_AGE', 30)
+        return response.make_conditional(request)
+    
     @app.route('/api/reports', methods=['POST'])
     @api_token_required
     def create_report_api():
@@ -190,19 +295,98 @@ def register_routes(app):
             report.status = 'pending'
             report.priority = 1 if data.get('severity') == 'high' else 2
             
-            report_id = report.save()
-            
-            # Broadcast via WebSocket
-            broadcast_map_update('new_report', report.to_json())
+            # Duplicates are merged into the open incident they repeat
+            report, merged = incidents.submit(report)
+            # Map clients are updated by the change feed
             
             return jsonify({
                 'success': True,
-                'report_id': str(report_id),
-                'message': 'Report created successfully'
+                'report_id': str(report._id),
+                'merged': merged,
+                'report_count': report.report_count,
+                'message': 'Report merged into an existing incident' if merged else 'Report created successfully'
             })
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
     
+    @app.route('/api/reports/import', methods=['POST'])
+    @api_token_required
+    def import_reports_api():
+        """Bulk import reports from an NDJSON or CSV request body"""
+        if not request.user.is_authority():
+            return jsonify({'success': False, 'error': 'Authority access required'}), 403
+        
+        fmt = request.args.get('format')
+        if not fmt:
+            fmt = 'csv' if 'csv' in (request.content_type or '') else 'ndjson'
+        if fmt not in ('ndjson', 'csv'):
+            return jsonify({'success': False, 'error': f'Unsupported format: {fmt}'}), 400
+        
+        # Imports are far larger than MAX_CONTENT_LENGTH, so read the raw WSGI
+        # input under the separate bulk limit instead of request.stream
+        length = request.content_length
+        if length is None:
+            return jsonify({'success': False, 'error': 'Content-Length required'}), 411
+        if length > app.config['BULK_IMPORT_MAX_BYTES']:
+            return jsonify({'success': False, 'error': 'Import too large'}), 413
+        stream = LimitedStream(request.environ['wsgi.input'], length)
+        
+        try:
+            records = report_io.parse_csv(stream) if fmt == 'csv' else report_io.parse_ndjson(stream)
+            summary = report_io.import_reports(
+                records,
+                reporter_id=request.user.get_id(),
+                chunk_size=app.config['BULK_IMPORT_CHUNK_SIZE']
+            )
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        # One notification for the whole import instead of one per report
+        # (the change feed skips documents tagged with an import_batch)
+        if summary['inserted']:
+            broadcast_map_update('reports_imported', {'count': summary['inserted']})
+        
+        if 'error' in summary:
+            # Chunks before failed_at are committed; tell the client how far it got
+            return jsonify({'success': False, **summary}), 207 if summary['inserted'] else 500
+        return jsonify({'success': True, **summary})
+    
+    @app.route('/api/reports/export', methods=['GET'])
+    @api_token_required
+    def export_reports_api():
+        """Stream reports as NDJSON or CSV, filtered like GET /api/reports"""
+        filters = {}
+        if request.args.get('status'):
+            filters['status'] = request.args.get('status')
+        if request.args.get('severity'):
+            filters['severity'] = request.args.get('severity')
+        if request.args.get('type'):
+            filters['issue_type'] = request.args.get('type')
+        try:
+            if request.args.get('date_from'):
+                filters['date_from'] = datetime.fromisoformat(request.args.get('date_from'))
+            if request.args.get('date_to'):
+                filters['date_to'] = datetime.fromisoformat(request.args.get('date_to'))
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        
+        fmt = request.args.get('format', 'ndjson')
+        reports = RoadReport.iter_all(filters, batch_size=app.config['EXPORT_BATCH_SIZE'])
+        timestamp = datetime.utcnow().strftime('%Y%m%d_%H%M%S')
+        
+        if fmt == 'csv':
+            body, mimetype = report_io.export_csv(reports), 'text/csv'
+        elif fmt == 'ndjson':
+            body, mimetype = report_io.export_ndjson(reports), 'application/x-ndjson'
+        else:
+            return jsonify({'success': False, 'error': f'Unsupported format: {fmt}'}), 400
+        
+        return Response(
+            stream_with_context(body),
+            mimetype=mimetype,
+            headers={'Content-Disposition': f'attachment; filename=reports_{timestamp}.{fmt}'}
+        )
+    
     @app.route('/api/reports/<report_id>', methods=['PUT'])
     @api_token_required
     def update_report_api(report_id):
@@ -213,6 +397,7 @@ def register_routes(app):
                 return jsonify({'success': False, 'error': 'Report not found'}), 404
             
             data = request.get_json()
+            old_status = report.status
             
             # Update allowed fields
             if 'status' in data:
@@ -230,9 +415,22 @@ def register_routes(app):
                 report.priority = data['priority']
             
             report.save()
-            
-            # Broadcast update
-            broadcast_map_update('report_updated', report.to_json())
+            # Map clients are updated by the change feed
+            
+            if report.status != old_status:
+                # Everyone whose report was merged into this incident
+                for reporter_id in report.reporters():
+                    send_notification(reporter_id, {
+                        'type': 'report_status',
+                        'message': f"Your {report.issue_type or 'road'} report is now {report.status}",
+                        'data': {'report_id': str(report._id), 'status': report.status}
+                    })
+            if data.get('assigned_to'):
+                send_notification(str(data['assigned_to']), {
+                    'type': 'assignment',
+                    'message': f"You have been assigned a {report.issue_type or 'road'} report",
+                    'data': {'report_id': str(report._id)}
+                })
             
             return jsonify({
                 'success': True,
@@ -242,6 +440,30 @@ def register_routes(app):
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
     
+    @app.route('/api/notifications', methods=['GET'])
+    @api_token_required
+    def get_notifications():
+        """Unacknowledged notifications for the token's user"""
+        user = request.user
+        targets = rooms_for_user(user.get_id(), user.role)
+        notifications = Notification.find_pending(targets, user.get_id(), limit=request.args.get('limit', 50, type=int))
+        return jsonify({
+            'success': True,
+            'notifications': [notification.to_json() for notification in notifications]
+        })
+    
+    @app.route('/api/notifications/ack', methods=['POST'])
+    @api_token_required
+    def ack_notifications():
+        """Acknowledge notifications: {"ids": [...]}"""
+        user = request.user
+        ids = (request.get_json(silent=True) or {}).get('ids') or []
+        if not ids:
+            return jsonify({'success': False, 'error': 'No notification ids'}), 400
+        
+        count = Notification.acknowledge(ids, rooms_for_user(user.get_id(), user.role), user.get_id())
+        return jsonify({'success': True, 'acknowledged': count})
+    
     @app.route('/api/camera/register', methods=['POST'])
     @api_token_required
     def register_camera():
@@ -290,30 +512,51 @@ def register_routes(app):
     
     @app.route('/api/camera/<camera_id>/snapshot', methods=['GET'])
     def get_camera_snapshot(camera_id):
-        """Get camera snapshot"""
+        """Get camera snapshot as image/jpeg (?format=json for the base64 form)"""
         try:
             camera = camera_manager.get_camera(camera_id)
             if not camera:
                 return jsonify({'success': False, 'error': 'Camera not found'}), 404
             
-            snapshot = camera.get_snapshot()
-            if snapshot is None:
+            jpeg = camera.get_snapshot_jpeg()
+            if jpeg is None:
                 return jsonify({'success': False, 'error': 'Failed to capture snapshot'}), 500
+            timestamp = datetime.utcfromtimestamp(camera.latest_jpeg_at).isoformat()
             
-            # Convert to base64
-            import cv2
-            import base64
-            _, buffer = cv2.imencode('.jpg', snapshot)
-            base64_image = base64.b64encode(buffer).decode('utf-8')
+            if request.args.get('format') == 'json':
+                import base64
+                return jsonify({
+                    'success': True,
+                    'image': base64.b64encode(jpeg).decode('utf-8'),
+                    'timestamp': timestamp
+                })
             
-            return jsonify({
-                'success': True,
-                'image': base64_image,
-                'timestamp': datetime.utcnow().isoformat()
+            # The camera's own JPEG bytes, usable directly as an <img> src
+            return Response(jpeg, mimetype='image/jpeg', headers={
+                'Cache-Control': 'no-store',
+                'X-Snapshot-Timestamp': timestamp
             })
         except Exception as e:
             return jsonify({'success': False, 'error': str(e)}), 400
     
+    @app.route('/api/camera/<camera_id>/mjpeg', methods=['GET'])
+    def camera_mjpeg(camera_id):
+        """Live MJPEG view served from the camera's shared relay (?fps= caps the rate)"""
+        camera = camera_manager.get_camera(camera_id)
+        if not camera:
+            return jsonify({'success': False, 'error': 'Camera not found'}), 404
+        
+        relay = relay_hub.relay_for(camera)
+        fps = relay_hub.viewer_fps(request.args.get('fps', type=float))
+        
+        def generate():
+            for jpeg in relay.frames(max_fps=fps, stall_timeout=relay_hub.stall_timeout):
+                yield (b'--frame\r\nContent-Type: image/jpeg\r\nContent-Length: '
+                       + str(len(jpeg)).encode() + b'\r\n\r\n' + jpeg + b'\r\n')
+        
+        return Response(generate(), mimetype='multipart/x-mixed-replace; boundary=frame',
+                        headers={'Cache-Control': 'no-store'})
+    
     @app.route('/api/detect', methods=['POST'])
     def detect_defects():
         """Detect defects in uploaded image"""
@@ -348,28 +591,68 @@ def register_routes(app):
     @app.route('/api/statistics', methods=['GET'])
     def get_statistics():
         """Get system statistics"""
-        stats = Statistics.update_daily_stats()
-        
-        # Calculate additional stats
-        total_reports = RoadReport.count_documents({})
-        reports_today = RoadReport.count_documents({
-            'created_at': {'$gte': datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)}
-        })
+        stats = statistics_service.get()
         
         return jsonify({
             'success': True,
             'stats': {
-                'total_reports': total_reports,
-                'reports_today': reports_today,
+                'total_reports': stats.get('all_reports', 0),
+                'reports_today': stats.get('total_reports', 0),
                 'pending_reports': stats.get('pending_reports', 0),
                 'resolved_today': stats.get('resolved_reports', 0),
                 'high_priority': stats.get('high_priority', 0),
                 'ai_detections': stats.get('ai_detections', 0),
-                'response_rate': self.calculate_response_rate(),
-                'average_resolution_time': self.calculate_avg_resolution_time()
+                'response_rate': calculate_response_rate(),
+                'average_resolution_time': calculate_avg_resolution_time()
             }
         })
     
+    @app.route('/api/heatmap', methods=['GET'])
+    @api_token_required
+    def get_heatmap():
+        """Precomputed report/detection density per grid cell (authorities only)
+        
+        ?bbox=west,south,east,north, optionally &source=reports|detections,
+        &from=YYYY-MM-DD&to=YYYY-MM-DD (default the last 30 days),
+        &resolution=<one of HEATMAP_CELL_DEG> (default the finest that fits
+        HEATMAP_MAX_CELLS) and &severity=high or &type=pothole
+        """
+        if not request.user.is_authority():
+            return jsonify({'success': False, 'error': 'Authority access required'}), 403
+    
+        try:
+            bbox = report_clusters.parse_bbox(request.args.get('bbox', ''))
+            end = parse_utc(request.args['to']) if request.args.get('to') else datetime.utcnow()
+            start = parse_utc(request.args['from']) if request.args.get('from') else end - timedelta(days=29)
+            resolution = request.args.get('resolution')
+            result = heatmap_store.query(
+                request.args.get('source', 'reports'), bbox, start, end,
+                cell_size=float(resolution) if resolution and resolution != 'auto' else None,
+                severity=request.args.get('severity'),
+                issue_type=request.args.get('type')
+            )
+        except ValueError as e:
+            return jsonify({'success': False, 'error': str(e)}), 400
+        except Exception as e:
+            return jsonify({'success': False, 'error': str(e)}), 500
+    
+        if result is None:
+            return jsonify({'success': False, 'error': 'Database unavailable'}), 503
+        result['success'] = True
+        return jsonify(result)
+    
+    @app.route('/api/system/db-pool', methods=['GET'])
+    @api_token_required
+    def get_db_pool_stats():
+        """MongoDB connection pool utilization (admin only)"""
+        if not request.user.is_admin():
+            return jsonify({'success': False, 'error': 'Admin access required'}), 403
+        
+        return jsonify({
+            'success': True,
+            'pool': app.mongo.pool_stats()
+        })
+    
     @app.route('/api/upload', methods=['POST'])
     @api_token_required
     def upload_file():
@@ -487,9 +770,12 @@ def register_routes(app):
             report.status = 'pending'
             report.priority = 1 if severity == 'high' else 2
             
-            report.save()
+            report, merged = incidents.submit(report)
             
-            flash('Report submitted successfully!', 'success')
+            if merged:
+                flash(f'This issue was already reported; your report was added to it ({report.report_count} reports).', 'success')
+            else:
+                flash('Report submitted successfully!', 'success')
             return redirect(url_for('report'))
             
         except Exception as e:
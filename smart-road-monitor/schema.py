@@ -0,0 +1,127 @@
+"""Declarative field schema for MongoDB-backed models.
+
+A model lists its fields once in ``fields``; ``SchemaMeta`` turns that list
+into ``__slots__`` and compiles the document -> object, object -> document
+and object -> JSON converters as straight-line functions, so hydrating large
+result sets does no per-field dict lookups or attribute loops.
+"""
+from datetime import datetime
+
+_MISSING = object()
+
+
+class Field:
+    """Describe one persisted attribute of a model"""
+    __slots__ = ('name', 'default', 'factory', 'kind', 'json', 'json_key', 'auto_now')
+
+    # kind: None (stored as-is), 'id' (ObjectId -> str) or 'datetime' (-> ISO 8601)
+    def __init__(self, name, default=None, factory=None, kind=None,
+                 json=True, json_key=None, auto_now=False):
+        self.name = name
+        self.default = default
+        self.factory = factory
+        self.kind = kind
+        self.json = json
+        self.json_key = json_key or name
+        self.auto_now = auto_now
+
+
+def _json_expr(field):
+    attr = f"self.{field.name}"
+    if field.kind == 'id':
+        return f"str({attr}) if {attr} else None"
+    if field.kind == 'datetime':
+        return f"{attr}.isoformat() if {attr} else None"
+    return attr
+
+
+def _compile(cls, fields):
+    """Generate the converter methods for a model class"""
+    namespace = {'_MISSING': _MISSING, '_utcnow': datetime.utcnow}
+    defaults_src = ["def _init_defaults(self):"]
+    load_src = ["def _load(self, doc):", "    get = doc.get"]
+    to_doc_src = ["def to_doc(self):"]
+    to_doc_items = []
+    json_items = []
+
+    for field in fields:
+        name = field.name
+        if field.factory is not None:
+            namespace[f"_f_{name}"] = field.factory
+            defaults_src.append(f"    self.{name} = _f_{name}()")
+            load_src.append(f"    v = get({name!r}, _MISSING)")
+            load_src.append(f"    self.{name} = _f_{name}() if v is _MISSING else v")
+        else:
+            namespace[f"_d_{name}"] = field.default
+            defaults_src.append(f"    self.{name} = _d_{name}")
+            if field.default is None:
+                load_src.append(f"    self.{name} = get({name!r})")
+            else:
+                load_src.append(f"    self.{name} = get({name!r}, _d_{name})")
+
+        if name != '_id':
+            if field.auto_now:
+                to_doc_src.append(f"    self.{name} = _utcnow()")
+            to_doc_items.append(f"{name!r}: self.{name}")
+
+        if field.json:
+            json_items.append(f"{field.json_key!r}: {_json_expr(field)}")
+
+    to_doc_src.append("    return {" + ", ".join(to_doc_items) + "}")
+    json_src = ["def to_json(self):", "    return {" + ", ".join(json_items) + "}"]
+    if len(defaults_src) == 1:
+        defaults_src.append("    pass")
+
+    source = "\n".join(defaults_src + load_src + to_doc_src + json_src)
+    exec(compile(source, f"<schema {cls.__name__}>", 'exec'), namespace)
+
+    cls._init_defaults = namespace['_init_defaults']
+    cls._load = namespace['_load']
+    cls.to_doc = namespace['to_doc']
+    # Keep a hand-written to_json on the class if one was defined
+    if 'to_json' not in cls.__dict__:
+        cls.to_json = namespace['to_json']
+
+
+class SchemaMeta(type):
+    """Build ``__slots__`` and converters from a class-level ``fields`` list"""
+    def __new__(mcs, name, bases, namespace):
+        fields = namespace.get('fields')
+        if fields is not None:
+            namespace['__slots__'] = tuple(field.name for field in fields)
+        else:
+            namespace.setdefault('__slots__', ())
+        cls = super().__new__(mcs, name, bases, namespace)
+        if fields is not None:
+            _compile(cls, fields)
+        return cls
+
+
+class Document(metaclass=SchemaMeta):
+    """Base class for slotted models with compiled BSON/JSON converters"""
+    fields = None
+
+    def __init__(self, data=None):
+        if data:
+            self._load(data)
+        else:
+            self._init_defaults()
+
+    @classmethod
+    def from_doc(cls, doc):
+        """Build an instance from a MongoDB document without running defaults"""
+        obj = cls.__new__(cls)
+        obj._load(doc)
+        return obj
+
+    @classmethod
+    def hydrate(cls, docs):
+        """Build instances from an iterable of documents (e.g. a cursor)"""
+        new = cls.__new__
+        result = []
+        append = result.append
+        for doc in docs:
+            obj = new(cls)
+            obj._load(doc)
+            append(obj)
+        return result
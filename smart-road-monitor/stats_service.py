@@ -0,0 +1,158 @@
+import threading
+import time
+from datetime import datetime
+
+from models import Statistics
+
+
+class StatisticsService:
+    """Keep daily statistics in memory and maintain them incrementally
+
+    Counters are seeded from the database once, then adjusted on every report
+    and detection write. Reads are served from a snapshot that is rebuilt at
+    most every ``cache_ttl`` seconds; the ``statistics`` collection is only
+    upserted on the flush schedule and counters are reconciled against the
+    database on a slower schedule to correct any drift.
+    """
+    _instance = None
+
+    def __new__(cls):
+        if cls._instance is None:
+            cls._instance = super().__new__(cls)
+            cls._instance.lock = threading.Lock()
+            cls._instance.counters = None
+            cls._instance.snapshot = None
+            cls._instance.snapshot_at = 0
+            cls._instance.dirty = False
+            cls._instance.closed_day = None
+            cls._instance.cache_ttl = 5
+            cls._instance.flush_interval = 60
+            cls._instance.reconcile_interval = 300
+            cls._instance.worker = None
+        return cls._instance
+
+    def configure(self, config):
+        """Read schedule settings from the Flask config"""
+        self.cache_ttl = config.get('STATS_CACHE_TTL', self.cache_ttl)
+        self.flush_interval = config.get('STATS_FLUSH_INTERVAL', self.flush_interval)
+        self.reconcile_interval = config.get('STATS_RECONCILE_INTERVAL', self.reconcile_interval)
+
+    def start(self):
+        """Seed the counters and start the flush/reconcile worker"""
+        if self.worker is not None:
+            return
+        self.reconcile()
+        self.worker = threading.Thread(target=self._worker, daemon=True)
+        self.worker.start()
+
+    def get(self):
+        """Return the current statistics without touching the database"""
+        now = time.time()
+        snapshot = self.snapshot
+        if snapshot is not None and now - self.snapshot_at < self.cache_ttl:
+            return snapshot
+
+        if self.counters is None:
+            self.reconcile()
+        with self.lock:
+            if self.counters is None:
+                return {}
+            self._roll_day()
+            snapshot = dict(self.counters)
+            self.snapshot = snapshot
+            self.snapshot_at = now
+        return snapshot
+
+    def reconcile(self):
+        """Recount everything from the database and replace the counters"""
+        try:
+            stats = Statistics.compute_daily_stats()
+        except Exception as e:
+            print(f"Statistics reconcile error: {e}")
+            return
+        if not stats:
+            return
+        with self.lock:
+            self.counters = stats
+            self.snapshot = None
+            self.dirty = True
+
+    def flush(self):
+        """Upsert the current counters into the statistics collection"""
+        with self.lock:
+            if self.counters is None or not self.dirty:
+                return
+            self._roll_day()
+            stats = dict(self.counters)
+            closed_day, self.closed_day = self.closed_day, None
+            self.dirty = False
+        try:
+            if closed_day:
+                Statistics.save_daily_stats(closed_day)
+            Statistics.save_daily_stats(stats)
+        except Exception as e:
+            print(f"Statistics flush error: {e}")
+            self.dirty = True
+
+    # Write hooks, called by the models after a successful insert/update
+
+    def report_created(self, report):
+        self._apply(
+            total_reports=1,
+            all_reports=1,
+            pending_reports=1 if report.status == 'pending' else 0,
+            resolved_reports=1 if report.status == 'resolved' else 0,
+            high_priority=1 if report.severity == 'high' else 0
+        )
+
+    def report_changed(self, previous, report):
+        if previous is None:
+            return
+        old_status = previous.get('status')
+        old_severity = previous.get('severity')
+        if old_status == report.status and old_severity == report.severity:
+            return
+        self._apply(
+            pending_reports=(report.status == 'pending') - (old_status == 'pending'),
+            resolved_reports=(report.status == 'resolved') - (old_status == 'resolved'),
+            high_priority=(report.severity == 'high') - (old_severity == 'high')
+        )
+
+    def detection_created(self, detection):
+        self._apply(ai_detections=1)
+
+    def _apply(self, **deltas):
+        with self.lock:
+            if self.counters is None:
+                return
+            self._roll_day()
+            for key, delta in deltas.items():
+                if delta:
+                    self.counters[key] = self.counters.get(key, 0) + delta
+            self.counters['updated_at'] = datetime.utcnow()
+            self.snapshot = None
+            self.dirty = True
+
+    def _roll_day(self):
+        """Reset the per-day counters at midnight UTC (caller holds the lock)"""
+        today = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        if self.counters['date'] != today:
+            if self.dirty:
+                self.closed_day = dict(self.counters)
+            self.counters['date'] = today
+            self.counters['total_reports'] = 0
+            self.counters['ai_detections'] = 0
+            self.dirty = True
+
+    def _worker(self):
+        last_reconcile = time.time()
+        while True:
+            time.sleep(self.flush_interval)
+            if time.time() - last_reconcile >= self.reconcile_interval:
+                self.reconcile()
+                last_reconcile = time.time()
+            self.flush()
+
+
+# Global statistics service
+statistics_service = StatisticsService()
@@ -5,6 +5,7 @@ from datetime import datetime, timedelta
 from functools import wraps
 from flask import request, jsonify
 import hashlib
+import geo_utils
 
 def generate_id():
     """Generate a unique ID"""
@@ -33,23 +34,11 @@ def validate_password(password):
     return True, "Password is valid"
 
 def calculate_distance(lat1, lon1, lat2, lon2):
-    """Calculate distance between two coordinates in meters"""
-    from math import radians, sin, cos, sqrt, atan2
+    """Calculate distance between two coordinates in meters
     
-    R = 6371000  # Earth's radius in meters
-    
-    lat1_rad = radians(lat1)
-    lon1_rad = radians(lon1)
-    lat2_rad = radians(lat2)
-    lon2_rad = radians(lon2)
-    
-    dlat = lat2_rad - lat1_rad
-    dlon = lon2_rad - lon1_rad
-    
-    a = sin(dlat/2)**2 + cos(lat1_rad) * cos(lat2_rad) * sin(dlon/2)**2
-    c = 2 * atan2(sqrt(a), sqrt(1-a))
-    
-    return R * c
+    Accepts arrays as well; see geo_utils for the batch helpers.
+    """
+    return geo_utils.haversine(lat1, lon1, lat2, lon2)
 
 def format_date(date_obj, format_str='%Y-%m-%d %H:%M:%S'):
     """Format datetime object to string"""
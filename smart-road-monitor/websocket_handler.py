@@ -1,35 +1,60 @@
-from flask_socketio import SocketIO, emit, join_room, leave_room
+from flask_socketio import SocketIO, emit, join_room, leave_room, rooms as socket_rooms
 from flask import request, session, current_app
 from flask_login import current_user
 import eventlet
 import json
 from datetime import datetime
-from models import RoadReport, CameraDetection
+from models import RoadReport, CameraDetection, Notification
 from auth import api_token_required
+from async_db import async_db
+from broadcaster import broadcaster
+from presence import presence
+from incidents import incidents
+from change_feed import live_statistics_payload
+import geo_grid
+from geo_grid import ALL_MAP_ROOM
+import report_clusters
 
 socketio = SocketIO(cors_allowed_origins="*", async_mode='eventlet')
 
-# Store connected clients
-connected_clients = {}
+# Joined by every socket of an authority or admin user
+AUTHORITY_ROOM = 'authority_room'
+
+# Rooms joined only by the server after authentication, never on request
+PRIVATE_ROOM_PREFIXES = ('user:', 'role:', AUTHORITY_ROOM)
+
+def user_room(user_id):
+    """Room joined by every authenticated socket of a user"""
+    return f"user:{user_id}"
+
+def role_room(role):
+    return f"role:{role}"
+
+def rooms_for_user(user_id, role):
+    """Notification rooms an authenticated user belongs to"""
+    rooms = [user_room(user_id), role_room(role)]
+    if role in ('authority', 'admin'):
+        rooms.append(AUTHORITY_ROOM)
+    return rooms
 
 @socketio.on('connect')
 def handle_connect():
     """Handle new WebSocket connection"""
     client_id = request.sid
-    connected_clients[client_id] = {
-        'connected_at': datetime.utcnow(),
-        'user_id': None,
-        'rooms': []
-    }
+    # Shared between web processes when a message queue is configured
+    presence.connect(client_id, connected_at=datetime.utcnow().isoformat(), user_id=None)
+    # Every map update until the client narrows it down with subscribe_map
+    join_room(ALL_MAP_ROOM)
     print(f"Client connected: {client_id}")
     emit('connection_success', {'message': 'Connected to Smart Road Monitor'})
+    # Later statistics arrive only when something changes (see change_feed.py)
+    emit('live_statistics', live_statistics_payload())
 
 @socketio.on('disconnect')
 def handle_disconnect():
     """Handle client disconnection"""
     client_id = request.sid
-    if client_id in connected_clients:
-        del connected_clients[client_id]
+    presence.disconnect(client_id)
     print(f"Client disconnected: {client_id}")
 
 @socketio.on('authenticate')
@@ -38,20 +63,41 @@ def handle_authentication(data):
     client_id = request.sid
     token = data.get('token')
     
-    from auth import verify_token
-    user, error = verify_token(token)
+    from auth import decode_token, load_token_user
+    user_id, error = decode_token(token)
+    user = None
+    if not error:
+        # The user lookup runs on the data-access pool, not the event loop
+        user, error = async_db.call(load_token_user, user_id, default=(None, 'Authentication timed out'))
     
     if user and not error:
-        connected_clients[client_id]['user_id'] = user.get_id()
-        connected_clients[client_id]['user_role'] = user.role
+        user_id = user.get_id()
+        presence.update(client_id, user_id=user_id, user_role=user.role)
+        
+        # Targeted delivery: one emit to a room reaches all of the user's tabs
+        targets = rooms_for_user(user_id, user.role)
+        for room in socket_rooms(client_id):
+            if room.startswith(PRIVATE_ROOM_PREFIXES) and room not in targets:
+                leave_room(room)
+        for room in targets:
+            join_room(room)
+        
         emit('auth_success', {
             'message': 'Authenticated successfully',
             'user': {
-                'id': user.get_id(),
+                'id': user_id,
                 'username': user.username,
                 'role': user.role
             }
         })
+        
+        # Deliver what arrived while the user was offline
+        async_db.run(
+            Notification.find_pending, targets, user_id,
+            callback=lambda pending: pending and socketio.emit('pending_notifications', {
+                'notifications': [notification.to_json() for notification in pending]
+            }, to=client_id)
+        )
     else:
         emit('auth_error', {'error': error or 'Authentication failed'})
 
@@ -61,9 +107,12 @@ def handle_join_room(data):
     room = data.get('room')
     client_id = request.sid
     
+    if room and str(room).startswith(PRIVATE_ROOM_PREFIXES):
+        emit('room_error', {'room': room, 'error': 'Room cannot be joined directly'})
+        return
+    
     if room:
         join_room(room)
-        connected_clients[client_id]['rooms'].append(room)
         emit('room_joined', {'room': room, 'client_id': client_id})
 
 @socketio.on('leave_room')
@@ -72,34 +121,112 @@ def handle_leave_room(data):
     room = data.get('room')
     client_id = request.sid
     
-    if room and room in connected_clients[client_id]['rooms']:
+    if room and room in socket_rooms(client_id):
         leave_room(room)
-        connected_clients[client_id]['rooms'].remove(room)
         emit('room_left', {'room': room})
 
+def _leave_map_rooms(client_id):
+    """Leave every grid room joined by a previous subscribe_map"""
+    for room in socket_rooms(client_id):
+        if room.startswith('map:'):
+            leave_room(room)
+
 @socketio.on('subscribe_map')
 def handle_subscribe_map(data):
     """Subscribe to map updates for a specific area"""
     client_id = request.sid
+    data = data or {}
     bounds = data.get('bounds')  # {north, south, east, west}
     
+    if data.get('all'):
+        _leave_map_rooms(client_id)
+        join_room(ALL_MAP_ROOM)
+        emit('map_subscribed', {'rooms': [ALL_MAP_ROOM]})
+        return
+    
     if bounds:
-        # Create a room name based on map bounds
-        room_name = f"map_{bounds['north']:.4f}_{bounds['south']:.4f}_{bounds['east']:.4f}_{bounds['west']:.4f}"
-        join_room(room_name)
-        connected_clients[client_id]['rooms'].append(room_name)
-        
-        # Send current reports in the area
-        from models import RoadReport
-        reports = RoadReport.find_nearby(
-            (bounds['east'] + bounds['west']) / 2,
-            (bounds['north'] + bounds['south']) / 2,
-            max_distance=5000
-        )
+        # Join the fixed grid cells covering the viewport (replacing the previous viewport)
+        try:
+            rooms = geo_grid.covering_rooms(
+                bounds,
+                current_app.config['MAP_ROOM_ZOOMS'],
+                current_app.config['MAP_ROOM_MAX_CELLS']
+            )
+        except (KeyError, TypeError, ValueError) as e:
+            emit('map_error', {'error': f"Invalid bounds: {e}"})
+            return
+        _leave_map_rooms(client_id)
+        for room in rooms:
+            join_room(room)
+        emit('map_subscribed', {'rooms': rooms})
         
-        emit('initial_map_data', {
-            'reports': [report.to_json() for report in reports]
-        })
+        # Send the open reports inside the viewport once the query completes
+        _query_bbox(client_id, bounds, data, 'initial_map_data')
+
+def _query_bbox(client_id, bounds, data, event):
+    """Run a bbox report query off the event loop and emit the result to one client"""
+    try:
+        bbox = report_clusters.normalize_bbox(bounds['west'], bounds['south'], bounds['east'], bounds['north'])
+    except (KeyError, TypeError, ValueError) as e:
+        emit('map_error', {'error': f"Invalid bounds: {e}"})
+        return
+    
+    max_results = current_app.config.get('MAP_QUERY_MAX_RESULTS', 1000)
+    try:
+        limit = max(min(int(data.get('limit') or max_results), max_results), 1)
+    except (TypeError, ValueError):
+        emit('map_error', {'error': 'limit must be a positive integer'})
+        return
+    severities = data.get('severity') or None
+    if isinstance(severities, str):
+        severities = severities.split(',')
+    
+    def send_reports(reports):
+        payload = {
+            'reports': [report.to_json() for report in reports[:limit]],
+            'truncated': len(reports) > limit
+        }
+        if data.get('request_id') is not None:
+            payload['request_id'] = data['request_id']
+        socketio.emit(event, payload, to=client_id)
+    
+    async_db.run(
+        RoadReport.find_in_bbox,
+        bbox,
+        data.get('status', 'active'),
+        severities,
+        limit + 1,
+        callback=send_reports,
+        errback=lambda e: socketio.emit('map_error', {'error': str(e)}, to=client_id)
+    )
+
+@socketio.on('query_bbox')
+def handle_query_bbox(data):
+    """One-off report query for a viewport (answered with bbox_results)"""
+    data = data or {}
+    _query_bbox(request.sid, data.get('bounds') or {}, data, 'bbox_results')
+
+@socketio.on('unsubscribe_map')
+def handle_unsubscribe_map(data=None):
+    """Stop receiving map updates"""
+    _leave_map_rooms(request.sid)
+    emit('map_unsubscribed', {})
+
+def _update_report_status(report_id, status, notes):
+    """Load, update and save a report; returns (report, old_status) or None"""
+    report = RoadReport.find_by_id(report_id)
+    if not report:
+        return None
+    
+    old_status = report.status
+    report.status = status
+    
+    if status == 'resolved':
+        report.resolution_notes = notes
+        report.resolved_at = datetime.utcnow()
+    
+    report.save()
+    return report, old_status
 
 @socketio.on('report_update')
 def handle_report_update(data):
@@ -108,37 +235,28 @@ def handle_report_update(data):
     status = data.get('status')
     notes = data.get('notes')
     
-    from models import RoadReport
-    report = RoadReport.find_by_id(report_id)
+    if not report_id or not status:
+        return
     
-    if report and status:
-        old_status = report.status
-        report.status = status
-        
-        if status == 'resolved':
-            report.resolution_notes = notes
-            report.resolved_at = datetime.utcnow()
-        
-        report.save()
+    def broadcast_update(result):
+        if result is None:
+            return
+        report, old_status = result
         
         # Broadcast update to all clients
-        emit('report_status_changed', {
+        socketio.emit('report_status_changed', {
             'report_id': report_id,
             'old_status': old_status,
             'new_status': status,
             'updated_at': datetime.utcnow().isoformat()
-        }, broadcast=True)
-        
-        # Update map in real-time
-        emit('map_update', {
-            'type': 'report_updated',
-            'data': report.to_json()
-        }, broadcast=True)
+        })
+        # The map itself is updated by the change feed
+    
+    async_db.run(_update_report_status, report_id, status, notes, callback=broadcast_update)
 
 @socketio.on('new_report')
 def handle_new_report(data):
     """Handle new report submission"""
-    from models import RoadReport, User
     from flask_login import current_user
     
     report = RoadReport()
@@ -152,20 +270,33 @@ def handle_new_report(data):
     report.status = 'pending'
     report.priority = 1 if data.get('severity') == 'high' else 2
     
-    report_id = report.save()
-    
-    # Broadcast to all connected clients
-    emit('new_report_added', {
-        'report': report.to_json(),
-        'message': 'New road issue reported'
-    }, broadcast=True)
+    def broadcast_new_report(result):
+        incident, merged = result
+        if incident._id is None:
+            return
+        if merged:
+            # A duplicate: the change feed announces the updated incident
+            socketio.emit('report_merged', {
+                'report': incident.to_json(),
+                'message': 'Added to an existing report of this issue'
+            }, to=client_id)
+            return
+        
+        # Broadcast to all connected clients
+        socketio.emit('new_report_added', {
+            'report': report.to_json(),
+            'message': 'New road issue reported'
+        })
+        
+        # Notify authorities via their room
+        notify_authorities({
+            'type': 'new_report',
+            'data': report.to_json(),
+            'message': 'New high priority report requires attention'
+        })
     
-    # Notify authorities via their room
-    emit('authority_notification', {
-        'type': 'new_report',
-        'data': report.to_json(),
-        'message': 'New high priority report requires attention'
-    }, room='authority_room')
+    client_id = request.sid
+    async_db.run(incidents.submit, report, callback=broadcast_new_report)
 
 @socketio.on('camera_stream_request')
 def handle_camera_stream(data):
@@ -184,22 +315,20 @@ def handle_camera_stream(data):
             camera.stop_streaming()
             emit('camera_stream_stopped', {'camera_id': camera_id})
         elif action == 'snapshot':
-            snapshot = camera.get_snapshot()
-            if snapshot:
-                # Convert to base64 for WebSocket transmission
-                import cv2
-                import base64
-                _, buffer = cv2.imencode('.jpg', snapshot)
-                base64_image = base64.b64encode(buffer).decode('utf-8')
+            jpeg = camera.get_snapshot_jpeg()
+            if jpeg:
+                # The camera's JPEG goes out as a binary attachment (arrives as
+                # an ArrayBuffer), without decoding, re-encoding or base64
                 emit('camera_snapshot', {
                     'camera_id': camera_id,
-                    'image': base64_image,
-                    'timestamp': datetime.utcnow().isoformat()
+                    'image': jpeg,
+                    'content_type': 'image/jpeg',
+                    'timestamp': datetime.utcfromtimestamp(camera.latest_jpeg_at).isoformat()
                 })
 
 def broadcast_detection(detection_data):
-    """Broadcast AI detection to connected clients"""
-    socketio.emit('ai_detection', {
+    """Broadcast AI detection to connected clients (coalesced per camera and defect)"""
+    broadcaster.publish('ai_detection', {
         'camera_id': detection_data.get('camera_id'),
         'defect_type': detection_data.get('defect_type'),
         'confidence': detection_data.get('confidence'),
@@ -207,63 +336,90 @@ def broadcast_detection(detection_data):
         'location': detection_data.get('gps'),
         'timestamp': detection_data.get('timestamp'),
         'image_url': detection_data.get('image_path')
-    }, broadcast=True)
+    }, key=(detection_data.get('camera_id'), detection_data.get('defect_type')))
 
-def broadcast_map_update(update_type, data):
-    """Broadcast map updates"""
-    socketio.emit('map_update', {
+def broadcast_map_update(update_type, data, location=None, local=False):
+    """Send a map update to the grid cells containing `location`
+    
+    Updates without a location (e.g. bulk imports) go to every client;
+    clients that have not sent subscribe_map sit in ALL_MAP_ROOM and get
+    every located update too.
+    Updates are batched by the broadcaster; within one window only the
+    latest update of each report is sent. `local` updates go only to this
+    process's clients (for changes every process observes itself).
+    """
+    message = {
         'type': update_type,
         'data': data,
         'timestamp': datetime.utcnow().isoformat()
-    }, broadcast=True)
+    }
+    key = (data or {}).get('id')
+    point = geo_grid.point_from_location(location)
+    if point is None:
+        broadcaster.publish('map_update', message, key=key, local=local)
+        return
+    
+    rooms = geo_grid.rooms_for_point(point[0], point[1], _map_room_zooms())
+    broadcaster.publish('map_update', message, to=rooms, key=key, local=local)
+
+def _map_room_zooms():
+    """Grid zoom levels for map rooms, also outside a request/app context"""
+    try:
+        return current_app.config['MAP_ROOM_ZOOMS']
+    except RuntimeError:
+        from config import Config
+        return Config.MAP_ROOM_ZOOMS
+
+@socketio.on('notification_ack')
+def handle_notification_ack(data):
+    """Mark notifications as read: {'ids': [...]}"""
+    client_id = request.sid
+    client = presence.get(client_id) or {}
+    user_id = client.get('user_id')
+    ids = data.get('ids') or ([data['id']] if data.get('id') else [])
+    if not user_id or not ids:
+        emit('notification_error', {'error': 'Authentication and notification ids required'})
+        return
+    
+    def acked(count):
+        # Other tabs of the same user can clear the notifications too
+        socketio.emit('notifications_acked', {'ids': ids, 'count': count}, to=user_room(user_id))
+    
+    targets = rooms_for_user(user_id, client.get('user_role'))
+    async_db.run(Notification.acknowledge, ids, targets, user_id, callback=acked)
+
+def notify(room, notification, event='notification'):
+    """Store a notification for a room and push it to the sockets in it
+    
+    Stored notifications are re-sent at authenticate until acknowledged.
+    The record is saved on the data-access pool and pushed (with its id)
+    once stored; returns the Future of the save.
+    """
+    record = Notification()
+    record.target = room
+    record.type = notification.get('type', 'info')
+    record.message = notification.get('message')
+    record.data = notification.get('data') or {}
+    
+    def push(_=None):
+        payload = dict(notification, id=str(record._id) if record._id else None,
+                       created_at=record.created_at.isoformat())
+        socketio.emit(event, payload, to=room)
+    
+    def failed(e):
+        print(f"Error storing notification: {e}")
+        push()
+    
+    return async_db.run(record.save, callback=push, errback=failed)
 
 def send_notification(user_id, notification):
-    """Send notification to specific user"""
-    for client_id, client_data in connected_clients.items():
-        if client_data.get('user_id') == user_id:
-            emit('notification', notification, room=client_id)
-            break
+    """Send notification to every open session of a user, on any process"""
+    return notify(user_room(user_id), notification)
 
-# Background task for periodic updates
-def background_updates():
-    """Send periodic updates to connected clients"""
-    import time
-    while True:
-        try:
-            # Update live statistics
-            from models import Statistics
-            stats = Statistics.update_daily_stats()
-            
-            # Broadcast statistics
-            socketio.emit('live_statistics', {
-                'total_reports': stats.get('total_reports', 0),
-                'pending_reports': stats.get('pending_reports', 0),
-                'resolved_today': stats.get('resolved_reports', 0),
-                'ai_detections': stats.get('ai_detections', 0),
-                'updated_at': datetime.utcnow().isoformat()
-            })
-            
-            # Check for new camera detections
-            from models import CameraDetection
-            recent_detections = CameraDetection.get_recent(limit=5)
-            if recent_detections:
-                socketio.emit('recent_detections', {
-                    'detections': [
-                        {
-                            'type': det.detections[0]['type'] if det.detections else 'unknown',
-                            'confidence': det.confidence,
-                            'timestamp': det.timestamp.isoformat() if det.timestamp else None,
-                            'location': det.location
-                        }
-                        for det in recent_detections
-                    ]
-                })
-            
-        except Exception as e:
-            print(f"Background update error: {e}")
-        
-        # Sleep for 30 seconds
-        time.sleep(30)
+def notify_role(role, notification):
+    """Send notification to every user with a role"""
+    return notify(role_room(role), notification)
 
-# Start background thread
-eventlet.spawn(background_updates)
\ No newline at end of file
+def notify_authorities(notification):
+    """Alert authority and admin users"""
+    return notify(AUTHORITY_ROOM, notification, event='authority_notification')